@@ -0,0 +1,285 @@
+"""
+שידור הודעה לכל הקהילה.
+
+הנמענים נקראים מהמאגר בסדר עולה של user_id, עמוד אחרי עמוד מה-cursor,
+ונשלחים במנות (BROADCAST_BATCH);
+כל מנה נשלחת במקביל דרך מתזמן ההודעות היוצאות (שדואג לקצב המותר), ואחריה
+נשמרת נקודת המשך (cursor) + המונים בטבלת broadcasts. אחרי ריסטארט שידור
+שלא הסתיים ממשיך מה-cursor – לכל היותר מנה אחת נשלחת פעמיים.
+משתמש שחסם את הבוט מסומן ומדולג בשידורים הבאים. שגיאה שאינה שליחה
+בודדת (למשל במאגר) מסמנת את השידור כ-failed ומדווחת – בלי לחזור עליו.
+
+בהרצה בכמה תהליכים רק התהליך המוביל מריץ שידורים: תהליך אחר רק שומר
+את הרשומה (status=running), והמוביל אוסף אותה ב-resume_all הבא.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from storage_executor import run_storage
+
+logger = logging.getLogger("slhnet.broadcast")
+
+try:
+    BROADCAST_BATCH = max(1, int(os.getenv("BROADCAST_BATCH", "50")))
+except ValueError:
+    BROADCAST_BATCH = 50
+
+try:
+    BROADCAST_PROGRESS_SECONDS = float(os.getenv("BROADCAST_PROGRESS_SECONDS", "5"))
+except ValueError:
+    BROADCAST_PROGRESS_SECONDS = 5.0
+
+try:
+    BROADCAST_RETRY_SECONDS = float(os.getenv("BROADCAST_RETRY_SECONDS", "60"))
+except ValueError:
+    BROADCAST_RETRY_SECONDS = 60.0
+
+RESULT_SENT = "sent"
+RESULT_FAILED = "failed"
+RESULT_BLOCKED = "blocked"
+
+
+class BroadcastEngine:
+    """
+    - table – טבלת storage לשמירת מצב השידורים (רשומה לכל שידור).
+    - recipients(after, limit) – עד limit user_id-ים גדולים מ-after, בסדר עולה
+      (נקרא ב-executor).
+    - count_recipients(after) – כמה user_id-ים גדולים מ-after (ל-total).
+    - send(user_id, text, parse_mode) – coroutine ששולח הודעה אחת.
+    - classify(exc) – RESULT_BLOCKED / RESULT_FAILED לחריגה משליחה.
+    - is_blocked(user_id) / mark_blocked(user_id) – רשימת החוסמים (ב-executor).
+    - on_progress(record) – נקרא לכל היותר פעם ב-BROADCAST_PROGRESS_SECONDS
+      ובסיום (למשל לעדכון הודעת הסטטוס של המנהל).
+    - is_leader() – האם התהליך הזה מריץ שידורים (ברירת מחדל: תמיד).
+    """
+
+    def __init__(
+        self,
+        table,
+        recipients: Callable[[Optional[int], int], List[int]],
+        count_recipients: Callable[[Optional[int]], int],
+        send: Callable[[int, str, Optional[str]], Awaitable[Any]],
+        classify: Callable[[Exception], str],
+        is_blocked: Callable[[int], bool],
+        mark_blocked: Callable[[int], None],
+        on_progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        is_leader: Callable[[], bool] = lambda: True,
+    ) -> None:
+        self.table = table
+        self._recipients = recipients
+        self._count_recipients = count_recipients
+        self._send = send
+        self._classify = classify
+        self._is_blocked = is_blocked
+        self._mark_blocked = mark_blocked
+        self._on_progress = on_progress
+        self._is_leader = is_leader
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # שידורים שנכשלו ולא הצליחו לשמור את הכישלון – מתחדשים רק בטיימר הזה
+        self._retries: Dict[str, asyncio.TimerHandle] = {}
+
+    # ---- state ----
+    def get(self, broadcast_id: str) -> Optional[Dict[str, Any]]:
+        rec = self.table.load().get(broadcast_id)
+        return dict(rec) if rec else None
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        records = self.table.load()
+        if not records:
+            return None
+        return dict(records[max(records, key=lambda k: records[k].get("created_ts", 0))])
+
+    def _save(self, rec: Dict[str, Any]) -> None:
+        self.table.put(rec["id"], dict(rec))
+
+    # ---- control ----
+    async def create(
+        self,
+        text: str,
+        parse_mode: Optional[str] = None,
+        created_by: Optional[int] = None,
+        notify: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        now = time.time()
+        broadcast_id = f"b{int(now * 1000)}"
+        rec = {
+            "id": broadcast_id,
+            "text": text,
+            "parse_mode": parse_mode,
+            "created_by": created_by,
+            "created_at": datetime.now().isoformat(),
+            "created_ts": now,
+            "status": "running",
+            "cursor": None,
+            "sent": 0,
+            "failed": 0,
+            "blocked": 0,
+            "skipped_blocked": 0,
+            "notify": notify,
+        }
+        await run_storage(self._save, rec)
+        if self._is_leader():
+            self._start(rec)
+        return rec
+
+    def _start(self, rec: Dict[str, Any]) -> None:
+        task = asyncio.create_task(self._run(rec["id"]))
+        self._tasks[rec["id"]] = task
+        task.add_done_callback(lambda _t, bid=rec["id"]: self._tasks.pop(bid, None))
+
+    async def resume_all(self) -> List[str]:
+        """
+        ממשיך שידורים שנקטעו (status=running) – נקרא באתחול, וכשיש כמה
+        תהליכים גם מדי פעם במוביל, לשידורים שנוצרו בתהליכים אחרים.
+        """
+        if not self._is_leader():
+            return []
+        records = await run_storage(self.table.load)
+        resumed = []
+        for broadcast_id, rec in sorted(records.items()):
+            if broadcast_id in self._retries:
+                continue
+            if rec.get("status") == "running" and broadcast_id not in self._tasks:
+                logger.info(f"Resuming broadcast {broadcast_id} after {rec.get('cursor')}")
+                self._start(rec)
+                resumed.append(broadcast_id)
+        return resumed
+
+    async def cancel(self, broadcast_id: str) -> bool:
+        def build(records: Dict[str, Any]) -> Dict[str, Any]:
+            # מול הרשומה העדכנית – השידור יכול לרוץ בתהליך אחר
+            stored = records.get(broadcast_id)
+            if not stored or stored.get("status") != "running":
+                return {}
+            rec = dict(stored)
+            rec["status"] = "cancelled"
+            rec["finished_at"] = datetime.now().isoformat()
+            return {broadcast_id: rec}
+
+        if not await run_storage(self.table.mutate, build):
+            return False
+        # אם השידור רץ בתהליך אחר – הוא יזהה את הביטול בסוף המנה הנוכחית
+        task = self._tasks.pop(broadcast_id, None)
+        if task is not None:
+            task.cancel()
+        return True
+
+    async def stop(self) -> None:
+        """עצירה בכיבוי – השידורים נשארים running וימשיכו באתחול הבא."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+        self._tasks.clear()
+        for handle in self._retries.values():
+            handle.cancel()
+        self._retries.clear()
+
+    def _retry(self, broadcast_id: str) -> None:
+        self._retries.pop(broadcast_id, None)
+        if self._is_leader() and broadcast_id not in self._tasks:
+            logger.info(f"Retrying broadcast {broadcast_id}")
+            self._start({"id": broadcast_id})
+
+    def _checkpoint(self, rec: Dict[str, Any]) -> bool:
+        """
+        שומר את ההתקדמות – רק אם השידור עדיין running במאגר (ייתכן שבוטל,
+        גם מתהליך אחר). מחזיר False אם השידור בוטל ויש לעצור.
+        """
+
+        def build(records: Dict[str, Any]) -> Dict[str, Any]:
+            stored = records.get(rec["id"])
+            if not stored or stored.get("status") != "running":
+                return {}
+            return {rec["id"]: dict(rec)}
+
+        return bool(self.table.mutate(build))
+
+    # ---- delivery ----
+    async def _deliver(self, user_id: int, text: str, parse_mode: Optional[str]) -> str:
+        try:
+            await self._send(user_id, text, parse_mode)
+            return RESULT_SENT
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result = self._classify(e)
+            if result == RESULT_BLOCKED:
+                await run_storage(self._mark_blocked, user_id)
+            else:
+                logger.warning(f"Broadcast to {user_id} failed: {e}")
+            return result
+
+    async def _report(self, rec: Dict[str, Any]) -> None:
+        if self._on_progress is None:
+            return
+        try:
+            await self._on_progress(dict(rec))
+        except Exception as e:
+            logger.warning(f"Broadcast progress callback failed: {e}")
+
+    async def _run(self, broadcast_id: str) -> None:
+        rec = await run_storage(self.get, broadcast_id)
+        if not rec or rec.get("status") != "running":
+            return
+        try:
+            await self._send_all(rec)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast {broadcast_id} failed: {e}")
+            rec["status"] = "failed"
+            rec["error"] = str(e)
+            rec["finished_at"] = datetime.now().isoformat()
+            try:
+                saved = await run_storage(self._checkpoint, rec)
+            except Exception as save_error:
+                # נשאר running במאגר – ננסה שוב אחרי BROADCAST_RETRY_SECONDS
+                # (גם בתהליך יחיד, שבו resume_all לא רץ מחזורית)
+                logger.error(f"Could not mark broadcast {broadcast_id} as failed: {save_error}")
+                self._retries[broadcast_id] = asyncio.get_running_loop().call_later(
+                    BROADCAST_RETRY_SECONDS, self._retry, broadcast_id
+                )
+                return
+            if saved:
+                await self._report(rec)
+
+    async def _send_all(self, rec: Dict[str, Any]) -> None:
+        broadcast_id = rec["id"]
+        cursor = rec.get("cursor")
+        rec["total"] = rec["sent"] + rec["failed"] + rec["blocked"] + rec["skipped_blocked"] + (
+            await run_storage(self._count_recipients, cursor)
+        )
+        last_report = 0.0
+        while True:
+            batch = await run_storage(self._recipients, cursor, BROADCAST_BATCH)
+            if not batch:
+                break
+            blocked = await run_storage(lambda ids=batch: [self._is_blocked(u) for u in ids])
+            targets = [uid for uid, b in zip(batch, blocked) if not b]
+            rec["skipped_blocked"] += len(batch) - len(targets)
+            results = await asyncio.gather(
+                *(self._deliver(uid, rec["text"], rec.get("parse_mode")) for uid in targets)
+            )
+            for result in results:
+                rec[result] += 1
+            cursor = rec["cursor"] = batch[-1]
+            if not await run_storage(self._checkpoint, rec):
+                logger.info(f"Broadcast {broadcast_id} was cancelled, stopping")
+                return
+            if time.monotonic() - last_report >= BROADCAST_PROGRESS_SECONDS:
+                last_report = time.monotonic()
+                await self._report(rec)
+
+        rec["status"] = "done"
+        rec["finished_at"] = datetime.now().isoformat()
+        if not await run_storage(self._checkpoint, rec):
+            return
+        await self._report(rec)
+        logger.info(
+            f"Broadcast {broadcast_id} done: sent={rec['sent']} failed={rec['failed']} "
+            f"blocked={rec['blocked']} skipped={rec['skipped_blocked']}"
+        )
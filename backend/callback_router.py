@@ -0,0 +1,88 @@
+"""
+ניתוב callback_data של כפתורי inline.
+
+במקום שרשרת if/elif של השוואות מחרוזת, כל נתיב נרשם פעם אחת:
+- route(data, handler) – התאמה מדויקת, חיפוש במילון.
+- prefix(name, handler) – callback_data בצורה "<name>:<arg>" (למשל approve:<user_id>);
+  הפירוק נעשה פעם אחת, והחלק שאחרי ':' מועבר ל-handler כפרמטר.
+כך הניתוב הוא O(1) ומסך חדש לא מאריך שום שרשרת. לכל נתיב מדד זמן משלו.
+"""
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger("slhnet.callback_router")
+
+CALLBACK_SECONDS = Histogram(
+    "slhnet_callback_seconds",
+    "Time spent handling an inline button callback, per route",
+    ["route"],
+)
+CALLBACK_UNKNOWN = Counter(
+    "slhnet_callback_unknown_total",
+    "Inline button callbacks whose callback_data matched no route",
+)
+
+
+class CallbackRoute(NamedTuple):
+    name: str
+    handler: Callable[..., Awaitable[None]]
+    # answer=False – ה-handler עונה בעצמו (למשל התראה למי שאינו מנהל)
+    answer: bool
+
+
+class CallbackRouter:
+    """
+    handler של נתיב מדויק נקרא עם (update, context), ושל prefix עם
+    (update, context, arg). fallback נקרא כשאין נתיב מתאים.
+    """
+
+    def __init__(self, fallback: Optional[Callable[[Any, Any], Awaitable[None]]] = None) -> None:
+        self._exact: Dict[str, CallbackRoute] = {}
+        self._prefixes: Dict[str, CallbackRoute] = {}
+        self._fallback = fallback
+
+    def route(self, data: str, handler: Callable[..., Awaitable[None]], answer: bool = True) -> None:
+        if data in self._exact:
+            raise ValueError(f"Callback route already registered: {data}")
+        self._exact[data] = CallbackRoute(data, handler, answer)
+
+    def prefix(self, name: str, handler: Callable[..., Awaitable[None]], answer: bool = True) -> None:
+        if ":" in name or name in self._prefixes:
+            raise ValueError(f"Invalid or duplicate callback prefix: {name}")
+        self._prefixes[name] = CallbackRoute(name + ":", handler, answer)
+
+    def resolve(self, data: str) -> Tuple[Optional[CallbackRoute], Tuple[str, ...]]:
+        """(נתיב, פרמטרים) עבור callback_data, או (None, ()) אם אין התאמה."""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, ()
+        name, sep, arg = data.partition(":")
+        if sep:
+            route = self._prefixes.get(name)
+            if route is not None:
+                return route, (arg,)
+        return None, ()
+
+    async def dispatch(self, update: Any, context: Any) -> None:
+        """ה-handler היחיד שנרשם ב-PTB לכל ה-callback queries."""
+        query = update.callback_query
+        if not query:
+            return
+        route, args = self.resolve(query.data or "")
+        if route is None:
+            CALLBACK_UNKNOWN.inc()
+            await query.answer()
+            if self._fallback is not None:
+                await self._fallback(update, context)
+            return
+        started = time.perf_counter()
+        try:
+            if route.answer:
+                await query.answer()
+            await route.handler(update, context, *args)
+        finally:
+            CALLBACK_SECONDS.labels(route.name).observe(time.perf_counter() - started)
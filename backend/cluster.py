@@ -0,0 +1,116 @@
+"""
+הרצה בכמה תהליכים (uvicorn --workers, לפי WEB_CONCURRENCY).
+
+כל תהליך מקבל את כל העדכונים שמגיעים אליו ומעבד אותם בעצמו – המצב המשותף
+נמצא במסד ה-SQLite, וכל תהליך מושך משם את מה שהאחרים כתבו. מה שחייב לרוץ
+פעם אחת בלבד (set_webhook, שידורים) רץ רק בתהליך המוביל: מי שמחזיק נעילת
+flock על data/locks/leader.lock. מערכת ההפעלה משחררת את הנעילה כשהתהליך
+מת, ותהליך אחר תופס אותה בבדיקה הבאה.
+
+בנוסף כל תהליך תופס "משבצת" קבועה (worker-<n>.lock) – מספר קטן ויציב
+לקבצים שרק תהליך אחד כותב אליהם (למשל יומן המינטים).
+"""
+
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # בלי flock (Windows) – תהליך יחיד בלבד
+    fcntl = None
+
+logger = logging.getLogger("slhnet.cluster")
+
+try:
+    WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+except ValueError:
+    WEB_CONCURRENCY = 1
+
+try:
+    CLUSTER_CHECK_SECONDS = float(os.getenv("CLUSTER_CHECK_SECONDS", "1"))
+except ValueError:
+    CLUSTER_CHECK_SECONDS = 1.0
+
+MAX_WORKER_SLOTS = 256
+
+
+class ProcessLock:
+    """נעילת flock לא חוסמת על קובץ, מוחזקת עד release() או סוף התהליך."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+
+class Cluster:
+    def __init__(self, lock_dir: Path, workers: int = WEB_CONCURRENCY) -> None:
+        self.lock_dir = Path(lock_dir)
+        self.workers = workers
+        self._leader = ProcessLock(self.lock_dir / "leader.lock")
+        self._slot_lock: Optional[ProcessLock] = None
+        self._slot: Optional[int] = None
+
+    @property
+    def multi_process(self) -> bool:
+        return self.workers > 1
+
+    def worker_slot(self) -> int:
+        """המשבצת הפנויה הנמוכה ביותר (0 בהרצה בתהליך יחיד); נתפסת בקריאה הראשונה."""
+        if self._slot is None:
+            for slot in range(MAX_WORKER_SLOTS):
+                lock = ProcessLock(self.lock_dir / f"worker-{slot}.lock")
+                if lock.acquire():
+                    self._slot_lock, self._slot = lock, slot
+                    break
+            else:
+                raise RuntimeError(f"No free worker slot under {self.lock_dir}")
+            logger.info(f"Process {os.getpid()} took worker slot {self._slot}")
+        return self._slot
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader.held
+
+    def try_lead(self) -> bool:
+        """מנסה לתפוס את ההובלה. True רק בפעם שבה התהליך הפך למוביל."""
+        if self._leader.held or not self._leader.acquire():
+            return False
+        logger.info(f"Process {os.getpid()} is now the cluster leader")
+        return True
+
+    def close(self) -> None:
+        self._leader.release()
+        if self._slot_lock is not None:
+            self._slot_lock.release()
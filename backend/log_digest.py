@@ -0,0 +1,140 @@
+"""
+איחוד הודעות לקבוצת הלוגים להודעות digest.
+
+send_log_message רק מוסיף שורה לבאפר; משימת רקע אוספת את ההודעות בחלון
+קצר (LOG_DIGEST_SECONDS) ושולחת אותן כהודעה אחת – עד מגבלת האורך של טלגרם.
+הודעה דחופה (urgent) מרוקנת את הבאפר מיד.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger("slhnet.log_digest")
+
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+DIGEST_SEPARATOR = "\n\n"
+
+try:
+    LOG_DIGEST_SECONDS = float(os.getenv("LOG_DIGEST_SECONDS", "5"))
+except ValueError:
+    LOG_DIGEST_SECONDS = 5.0
+
+try:
+    # כמה זמן הכיבוי ממתין לשליחת מה שנשאר (RetryAfter יכול להשהות את הקבוצה)
+    DIGEST_STOP_TIMEOUT = float(os.getenv("DIGEST_STOP_TIMEOUT", "10"))
+except ValueError:
+    DIGEST_STOP_TIMEOUT = 10.0
+
+
+def pack_digest(entries: List[str], limit: int = TELEGRAM_MAX_MESSAGE_LENGTH) -> List[str]:
+    """מאחד רשומות להודעות באורך limit לכל היותר; רשומה ארוכה מדי מפוצלת."""
+    chunks: List[str] = []
+    current = ""
+    for entry in entries:
+        while len(entry) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(entry[:limit])
+            entry = entry[limit:]
+        if not entry:
+            continue
+        if not current:
+            current = entry
+        elif len(current) + len(DIGEST_SEPARATOR) + len(entry) <= limit:
+            current += DIGEST_SEPARATOR + entry
+        else:
+            chunks.append(current)
+            current = entry
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class LogDigest:
+    def __init__(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        window: float = LOG_DIGEST_SECONDS,
+    ) -> None:
+        self._send = send
+        self._window = window
+        self._entries: List[str] = []
+        self._size = 0
+        self._has_entries: Optional[asyncio.Event] = None
+        self._flush_now: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # חלקים של ה-flush הנוכחי שעוד לא נשלחו
+        self._unsent = 0
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        self._stopping = False
+        self._has_entries = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def add(self, text: str, urgent: bool = False) -> None:
+        """מוסיף רשומה ל-digest הבא (לא חוסם)."""
+        self.start()
+        self._entries.append(text)
+        self._size += len(text) + len(DIGEST_SEPARATOR)
+        self._has_entries.set()
+        if urgent or self._size >= TELEGRAM_MAX_MESSAGE_LENGTH:
+            self._flush_now.set()
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await self._has_entries.wait()
+            if not self._flush_now.is_set():
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout=self._window)
+                except asyncio.TimeoutError:
+                    pass
+            await self.flush()
+
+    async def flush(self) -> None:
+        entries, self._entries, self._size = self._entries, [], 0
+        if self._has_entries is not None:
+            self._has_entries.clear()
+            self._flush_now.clear()
+        chunks = pack_digest(entries)
+        for i, chunk in enumerate(chunks):
+            self._unsent = len(chunks) - i
+            try:
+                await self._send(chunk)
+            except Exception as e:
+                logger.error(f"Failed to send log digest: {e}")
+        self._unsent = 0
+
+    async def stop(self, timeout: float = DIGEST_STOP_TIMEOUT) -> None:
+        """
+        מסמן למשימת הרקע לעצור וממתין לה – flush שכבר באמצע נשלח עד הסוף
+        (ביטול היה מאבד את שאר החלקים שלו) – ואז שולח את מה שנשאר בבאפר.
+        כל זה לכל היותר timeout שניות; מה שלא נשלח עד אז נזרק ונרשם בלוג.
+        """
+        task, self._task = self._task, None
+
+        async def _drain() -> None:
+            if task is not None:
+                self._stopping = True
+                self._flush_now.set()
+                self._has_entries.set()
+                try:
+                    await task
+                except Exception as e:
+                    logger.error(f"Log digest task failed: {e}")
+            await self.flush()
+
+        try:
+            await asyncio.wait_for(_drain(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Log digest stop timed out after {timeout}s: dropped {self._unsent} "
+                f"unsent messages and {len(self._entries)} buffered entries"
+            )
+            self._entries, self._size, self._unsent = [], 0, 0
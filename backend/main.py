@@ -1,12 +1,20 @@
+from __future__ import annotations
+
 import os
 import json
 import logging
+import asyncio
+import functools
+import hashlib
+import hmac
+import threading
+import time
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, NamedTuple, Set
 from decimal import Decimal, InvalidOperation
-from datetime import datetime
+from datetime import datetime, timezone
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Header, Request
 from fastapi.responses import JSONResponse, HTMLResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
@@ -14,22 +22,36 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from pydantic import BaseModel
 
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import CollectorRegistry, generate_latest, multiprocess, CONTENT_TYPE_LATEST
 
-from telegram import (
-    Update,
-    InlineKeyboardButton,
-    InlineKeyboardMarkup,
-    InputFile,
-)
-from telegram.ext import (
-    Application,
-    CommandHandler,
-    MessageHandler,
-    CallbackQueryHandler,
-    ContextTypes,
-    filters,
-)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# APP_ROLE: both (ברירת מחדל) – בוט + API באותו תהליך.
+# bot – בלי ה-routers הנוספים של ה-API.
+# api – נקודות HTTP בלבד: בלי python-telegram-bot, handlers, webhook וקבוצת לוגים.
+APP_ROLE = os.getenv("APP_ROLE", "both").strip().lower()
+RUNS_BOT = APP_ROLE != "api"
+RUNS_API = APP_ROLE != "bot"
+
+if RUNS_BOT:
+    from telegram import (
+        Update,
+        InlineKeyboardButton,
+        InlineKeyboardMarkup,
+        InputFile,
+    )
+    from telegram.error import BadRequest, Forbidden
+    from telegram.ext import (
+        Application,
+        CommandHandler,
+        MessageHandler,
+        CallbackQueryHandler,
+        ContextTypes,
+        filters,
+    )
 
 # === DB & internal wallets imports ===
 from db import (
@@ -43,6 +65,17 @@ from db import (
     get_pending_payments,
 )
 
+from broadcast import RESULT_BLOCKED, RESULT_FAILED, BroadcastEngine
+from callback_router import CallbackRouter
+from cluster import CLUSTER_CHECK_SECONDS, Cluster
+from log_digest import LogDigest
+from message_templates import MessageTemplates
+from price_history import PriceHistory
+from outbound import PRIORITY_ADMIN, PRIORITY_BULK, PRIORITY_LOG, PRIORITY_USER, outbound
+from storage import ReferralStore, create_backend
+from storage_executor import run_storage, shutdown_storage_executor
+from update_workers import UPDATE_WORKERS, UpdateDeduplicator, UpdateWorkerPool
+
 from slh_internal_wallets import (
     init_internal_wallet_schema,
     ensure_internal_wallet,
@@ -53,27 +86,28 @@ from slh_internal_wallets import (
     mint_slh_from_payment,  # משמש למינט SLH אחרי תשלום / קרדיט אדמין
 )
 
-# === Optional routers ===
-try:
-    from slh_public_api import router as public_router
-except Exception:
-    public_router = None
-
-try:
-    from social_api import router as social_router
-except Exception:
-    social_router = None
+# === Optional routers (לא נטענים בתפקיד bot) ===
+public_router = social_router = core_router = slhnet_extra_router = None
+if RUNS_API:
+    try:
+        from slh_public_api import router as public_router
+    except Exception:
+        public_router = None
 
-try:
-    from slh_core_api import router as core_router
-except Exception:
-    core_router = None
+    try:
+        from social_api import router as social_router
+    except Exception:
+        social_router = None
 
-try:
-    from slhnet_extra import router as slhnet_extra_router
-except Exception:
-    slhnet_extra_router = None
+    try:
+        from slh_core_api import router as core_router
+    except Exception:
+        core_router = None
 
+    try:
+        from slhnet_extra import router as slhnet_extra_router
+    except Exception:
+        slhnet_extra_router = None
 
 # =========================
 # Logging
@@ -156,11 +190,45 @@ DATA_DIR.mkdir(exist_ok=True)
 REF_FILE = DATA_DIR / "referrals.json"
 PROFILE_FILE = DATA_DIR / "profiles.json"
 MESSAGES_FILE = BASE_DIR / "bot_messages_slhnet.txt"
+ONCHAIN_FILE = DATA_DIR / "onchain_wallets.json"
+DYNAMIC_CONFIG_FILE = DATA_DIR / "slh_dynamic_config.json"
+MEDIA_CACHE_FILE = DATA_DIR / "media_file_ids.json"
+BROADCASTS_FILE = DATA_DIR / "broadcasts.json"
+BOT_STATE_FILE = DATA_DIR / "bot_state.json"
+
+# WEB_CONCURRENCY>1 – כמה תהליכי uvicorn; תהליך מוביל אחד מנהל webhook ושידורים
+cluster = Cluster(DATA_DIR / "locks")
+
+# תהליכים נוספים עובדים על אותו data/ – כמה workers, או בוט ו-API בנפרד
+SHARED_STORAGE = cluster.multi_process or APP_ROLE != "both"
+
+# STORAGE_BACKEND=json (ברירת מחדל, קבצי data/*.json) או sqlite (data/slhnet.db, WAL).
+# קבצי ה-JSON לא בטוחים לשיתוף בין תהליכים – במצב משותף רק sqlite
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sqlite" if SHARED_STORAGE else "json")
+if SHARED_STORAGE and STORAGE_BACKEND.strip().lower() != "sqlite":
+    logger.warning(
+        f"STORAGE_BACKEND={STORAGE_BACKEND} is not safe with WEB_CONCURRENCY={cluster.workers} "
+        f"and APP_ROLE={APP_ROLE}, using sqlite"
+    )
+    STORAGE_BACKEND = "sqlite"
+storage_backend = create_backend(STORAGE_BACKEND, DATA_DIR)
+
+referral_store = ReferralStore(
+    storage_backend.table("referrals", REF_FILE, root_key="users")
+)
+profiles_table = storage_backend.table("profiles", PROFILE_FILE)
+onchain_table = storage_backend.table("onchain_wallets", ONCHAIN_FILE, journaled=False)
+dynamic_config_table = storage_backend.table(
+    "dynamic_config", DYNAMIC_CONFIG_FILE, journaled=False
+)
+media_cache_table = storage_backend.table("media_cache", MEDIA_CACHE_FILE, journaled=False)
+broadcasts_table = storage_backend.table("broadcasts", BROADCASTS_FILE)
+bot_state_table = storage_backend.table("bot_state", BOT_STATE_FILE, journaled=False)
 
 
 def load_referrals() -> Dict[str, Any]:
     """
-    טוען את קובץ ההפניות מהדיסק.
+    מחזיר את מאגר ההפניות (נטען מהדיסק פעם אחת ונשמר בזיכרון).
     מבנה בסיסי:
     {
         "users": {
@@ -176,74 +244,43 @@ def load_referrals() -> Dict[str, Any]:
         }
     }
     """
-    if not REF_FILE.exists():
-        return {"users": {}, "statistics": {"total_users": 0}}
-
     try:
-        with REF_FILE.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-        if "users" not in data:
-            data["users"] = {}
-        if "statistics" not in data:
-            data["statistics"] = {"total_users": len(data["users"])}
-        return data
+        return referral_store.as_document()
     except Exception as e:
         logger.error(f"Error loading referrals: {e}")
         return {"users": {}, "statistics": {"total_users": 0}}
 
 
 def save_referrals(data: Dict[str, Any]) -> None:
-    """שומר את קובץ ההפניות לדיסק בצורה אטומית ככל האפשר."""
+    """מחליף את כל מאגר ההפניות וכותב snapshot מלא לדיסק."""
     try:
-        data["statistics"]["total_users"] = len(data.get("users", {}))
-        tmp_path = REF_FILE.with_suffix(".tmp")
-        with tmp_path.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        tmp_path.replace(REF_FILE)
+        referral_store.replace(data)
     except Exception as e:
         logger.error(f"Error saving referrals: {e}")
 
 
 def register_referral(user_id: int, referrer_id: Optional[int] = None) -> None:
     """
-    רושם משתמש חדש בקובץ ההפניות.
+    רושם משתמש חדש במאגר ההפניות.
     אם referrer_id קיים כבר במערכת – מגדיל לו את מונה ההפניות.
+    השינוי נרשם ב-journal בלבד, בלי לשכתב את כל הקובץ.
     """
     try:
-        data = load_referrals()
-        suid = str(user_id)
-        if suid not in data["users"]:
-            data["users"][suid] = {
-                "referrer": str(referrer_id) if referrer_id else None,
-                "joined_at": datetime.now().isoformat(),
-                "referral_count": 0,
-            }
-            # increment referrer counter if exists
-            if referrer_id:
-                rid = str(referrer_id)
-                if rid in data["users"]:
-                    data["users"][rid]["referral_count"] = (
-                        data["users"][rid].get("referral_count", 0) + 1
-                    )
-            save_referrals(data)
+        referral_store.register(user_id, referrer_id)
     except Exception as e:
         logger.error(f"Error registering referral: {e}")
 
 
-def get_user_referrals(user_id: int) -> List[int]:
+def get_user_referrals(
+    user_id: int,
+    limit: Optional[int] = None,
+    after: Optional[int] = None,
+) -> List[int]:
     """
-    מחזיר רשימת user_id שהופנו ע״י user_id מסויים.
+    מחזיר רשימת user_id שהופנו ע״י user_id מסויים, לפי סדר הצטרפות.
+    limit/after מאפשרים דפדוף: after הוא ה-user_id האחרון מהעמוד הקודם.
     """
-    data = load_referrals()
-    suid = str(user_id)
-    result: List[int] = []
-    for k, v in data.get("users", {}).items():
-        if v.get("referrer") == suid:
-            try:
-                result.append(int(k))
-            except Exception:
-                continue
-    return result
+    return referral_store.referrals_of(user_id, limit=limit, after=after)
 
 
 # =========================
@@ -251,23 +288,17 @@ def get_user_referrals(user_id: int) -> List[int]:
 # =========================
 def load_profiles() -> Dict[str, Any]:
     """טוען פרופילים של משתמשים (mini-CRM)."""
-    if not PROFILE_FILE.exists():
-        return {}
     try:
-        with PROFILE_FILE.open("r", encoding="utf-8") as f:
-            return json.load(f)
+        return profiles_table.load()
     except Exception as e:
         logger.error(f"Error loading profiles: {e}")
         return {}
 
 
 def save_profiles(data: Dict[str, Any]) -> None:
-    """שומר פרופילים לדיסק."""
+    """שומר את כל הפרופילים."""
     try:
-        tmp_path = PROFILE_FILE.with_suffix(".tmp")
-        with tmp_path.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        tmp_path.replace(PROFILE_FILE)
+        profiles_table.replace_all(data)
     except Exception as e:
         logger.error(f"Error saving profiles: {e}")
 
@@ -281,11 +312,26 @@ def upsert_profile(
     """
     מעדכן/יוצר פרופיל בסיסי למשתמש.
     זה future-ready כדי שבשלב הבא נוכל לשאול שאלות ולהעמיק בפרופיל.
+    אם שום שדה לא השתנה – לא נכתב כלום (גם updated_at לא מתעדכן),
+    ושינוי אמיתי נרשם כשורה אחת ב-journal של הפרופילים.
     """
     try:
         profiles = load_profiles()
         suid = str(user_id)
-        profile = profiles.get(suid, {})
+        current = profiles.get(suid)
+        if (
+            current is not None
+            and current.get("username") == username
+            and current.get("full_name") == full_name
+            and all(
+                current.get("extra", {}).get(k) == v for k, v in (extra or {}).items()
+            )
+            and "bot_blocked_at" not in current
+        ):
+            return
+        profile = dict(current or {})
+        # המשתמש חזר לבוט – כבר לא חוסם
+        profile.pop("bot_blocked_at", None)
         profile.update(
             {
                 "user_id": user_id,
@@ -295,19 +341,28 @@ def upsert_profile(
             }
         )
         if extra:
-            profile.setdefault("extra", {}).update(extra)
-        profiles[suid] = profile
-        save_profiles(profiles)
+            profile["extra"] = {**profile.get("extra", {}), **extra}
+        profiles_table.put(suid, profile)
     except Exception as e:
         logger.error(f"Error upserting profile: {e}")
 
 
+def is_bot_blocked(user_id: int) -> bool:
+    return "bot_blocked_at" in load_profiles().get(str(user_id), {})
+
+
+def mark_bot_blocked(user_id: int) -> None:
+    """מסמן שהמשתמש חסם את הבוט (טלגרם החזיר Forbidden) – שידורים ידלגו עליו."""
+    suid = str(user_id)
+    profile = dict(load_profiles().get(suid) or {"user_id": user_id})
+    profile["bot_blocked_at"] = datetime.now().isoformat()
+    profiles_table.put(suid, profile)
+
+
 # =========================
 # On-chain (external) wallets per user (file-based)
 # =========================
 
-ONCHAIN_FILE = DATA_DIR / "onchain_wallets.json"
-
 
 def load_onchain_wallets() -> Dict[str, Any]:
     """
@@ -321,11 +376,8 @@ def load_onchain_wallets() -> Dict[str, Any]:
       ...
     }
     """
-    if not ONCHAIN_FILE.exists():
-        return {}
     try:
-        with ONCHAIN_FILE.open("r", encoding="utf-8") as f:
-            return json.load(f)
+        return onchain_table.load()
     except Exception as e:
         logger.error(f"Error loading on-chain wallets: {e}")
         return {}
@@ -333,10 +385,7 @@ def load_onchain_wallets() -> Dict[str, Any]:
 
 def save_onchain_wallets(data: Dict[str, Any]) -> None:
     try:
-        tmp = ONCHAIN_FILE.with_suffix(".tmp")
-        with tmp.open("w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        tmp.replace(ONCHAIN_FILE)
+        onchain_table.replace_all(data)
     except Exception as e:
         logger.error(f"Error saving on-chain wallets: {e}")
 
@@ -366,59 +415,157 @@ def set_onchain_wallet(
     """
     data = load_onchain_wallets()
     suid = str(user_id)
-    rec = data.get(suid, {})
+    rec = dict(data.get(suid, {}))
     if bsc_address is not None:
         rec["bsc"] = None if bsc_address == "-" else bsc_address
     if ton_address is not None:
         rec["ton"] = None if ton_address == "-" else ton_address
     rec["updated_at"] = datetime.now().isoformat()
-    data[suid] = rec
-    save_onchain_wallets(data)
+    onchain_table.put(suid, rec)
     return rec
 
 
 # =========================
 # Messages file helper
 # =========================
-def load_message_block(block_name: str, fallback: str = "") -> str:
+try:
+    MESSAGES_RECHECK_SECONDS = float(os.getenv("MESSAGES_RECHECK_SECONDS", "10"))
+except ValueError:
+    MESSAGES_RECHECK_SECONDS = 10.0
+
+
+class MessageCatalog:
     """
-    טוען בלוק מלל מתוך bot_messages_slhnet.txt.
+    bot_messages_slhnet.txt מפורסר פעם אחת למילון {שם בלוק: טקסט}.
     פורמט גס:
     === START_TITLE ===
     ...
     === END ===
+
+    החיפוש הוא O(1) ללא גישה לדיסק. טעינה מחדש – כשה-mtime של הקובץ משתנה
+    (נבדק ברקע ע"י watch_messages_file) או בפקודת /reload_messages.
+    version עולה בכל טעינה – מטמונים תלויים (טקסטים, מסכים) נעזרים בו.
+    """
+
+    _blocks: Optional[Dict[str, str]] = None
+    _headers: List[str] = []
+    _aliases: Dict[str, Optional[str]] = {}
+    _mtime_ns: Optional[int] = None
+    _lock = threading.Lock()
+    version: int = 0
+
+    @staticmethod
+    def _parse(content: str) -> (Dict[str, str], List[str]):
+        blocks: Dict[str, str] = {}
+        headers: List[str] = []
+        name: Optional[str] = None
+        body: List[str] = []
+        for line in content.splitlines():
+            stripped = line.strip()
+            if name is not None and stripped.startswith("=== END"):
+                blocks.setdefault(name, "\n".join(body).strip())
+                name = None
+                continue
+            if stripped.startswith("===") and not stripped.startswith("=== END"):
+                if name is not None:
+                    # בלוק בלי END – נסגר בכותרת הבאה
+                    blocks.setdefault(name, "\n".join(body).strip())
+                name = stripped.strip("=").strip()
+                headers.append(name)
+                body = []
+                continue
+            if name is not None:
+                body.append(line)
+        if name is not None:
+            blocks.setdefault(name, "\n".join(body).strip())
+        return blocks, headers
+
+    @classmethod
+    def reload(cls) -> int:
+        """קורא ומפרסר את הקובץ מחדש. מחזיר את מספר הבלוקים."""
+        with cls._lock:
+            blocks: Dict[str, str] = {}
+            headers: List[str] = []
+            mtime_ns: Optional[int] = None
+            try:
+                mtime_ns = MESSAGES_FILE.stat().st_mtime_ns
+                blocks, headers = cls._parse(MESSAGES_FILE.read_text(encoding="utf-8"))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Error loading messages file: {e}")
+                if cls._blocks is not None:
+                    # משאירים את הגרסה הקודמת בתוקף
+                    return len(cls._blocks)
+            cls._blocks, cls._headers, cls._aliases = blocks, headers, {}
+            cls._mtime_ns = mtime_ns
+            cls.version += 1
+            return len(blocks)
+
+    @classmethod
+    def reload_if_changed(cls) -> bool:
+        try:
+            mtime_ns: Optional[int] = MESSAGES_FILE.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if cls._blocks is not None and mtime_ns == cls._mtime_ns:
+            return False
+        cls.reload()
+        return True
+
+    @classmethod
+    def get(cls, block_name: str) -> Optional[str]:
+        if cls._blocks is None:
+            cls.reload()
+        text = cls._blocks.get(block_name)
+        if text is not None:
+            return text
+        # תאימות לאחור: כותרת שמכילה את השם (למשל "=== START_TITLE (v2) ===")
+        if block_name not in cls._aliases:
+            cls._aliases[block_name] = next(
+                (h for h in cls._headers if block_name in h), None
+            )
+        alias = cls._aliases[block_name]
+        return cls._blocks.get(alias) if alias is not None else None
+
+    @classmethod
+    def file_exists(cls) -> bool:
+        if cls._blocks is None:
+            cls.reload()
+        return cls._mtime_ns is not None
+
+
+def load_message_block(block_name: str, fallback: str = "") -> str:
     """
-    if not MESSAGES_FILE.exists():
+    בלוק מלל מתוך bot_messages_slhnet.txt (מהקטלוג שבזיכרון).
+    """
+    if not MessageCatalog.file_exists():
         if fallback:
             return fallback
         return "[שגיאה: קובץ הודעות לא נמצא]"
 
-    try:
-        content = MESSAGES_FILE.read_text(encoding="utf-8")
-        lines = content.splitlines()
-        result_lines: List[str] = []
-        in_block = False
-        found_block = False
+    text = MessageCatalog.get(block_name)
+    if text is None and not fallback:
+        return f"[שגיאה: בלוק {block_name} לא נמצא]"
+    return text or fallback
+
+
+_messages_watcher: Optional[asyncio.Task] = None
 
-        for line in lines:
-            stripped = line.strip()
-            if stripped.startswith("===") and block_name in stripped:
-                in_block = True
-                found_block = True
-                continue
-            if in_block and stripped.startswith("=== END"):
-                break
-            if in_block:
-                result_lines.append(line)
-
-        if not found_block and not fallback:
-            return f"[שגיאה: בלוק {block_name} לא נמצא]"
-        if not result_lines and fallback:
-            return fallback
-        return "\n".join(result_lines).strip() or fallback
-    except Exception as e:
-        logger.error(f"Error loading message block '{block_name}': {e}")
-        return fallback or f"[שגיאה בטעינת בלוק {block_name}]"
+
+async def watch_messages_file() -> None:
+    """
+    בודק ברקע את ה-mtime של קובץ ההודעות וטוען מחדש כשהוא משתנה, ומרענן
+    את מטמון הקונפיגורציה – שתי הגרסאות שהתבניות נבנות לפיהן.
+    """
+    while True:
+        await asyncio.sleep(MESSAGES_RECHECK_SECONDS)
+        try:
+            if await run_storage(MessageCatalog.reload_if_changed):
+                logger.info(f"Messages file reloaded (version {MessageCatalog.version})")
+            await run_storage(DynamicConfigCache.get)
+        except Exception as e:
+            logger.error(f"Error checking messages file: {e}")
 
 
 # =========================
@@ -434,8 +581,6 @@ try:
 except Exception:
     DEFAULT_ENTRY_AMOUNT = Decimal("39")
 
-DYNAMIC_CONFIG_FILE = DATA_DIR / "slh_dynamic_config.json"
-
 
 def load_dynamic_config() -> Dict[str, Any]:
     """
@@ -443,7 +588,8 @@ def load_dynamic_config() -> Dict[str, Any]:
     {
       "slh_nis_price": float,      # מחיר SLH אחד בש"ח
       "nis_entry_amount": float,   # סכום כניסה בש"ח (ברירת מחדל 39)
-      "total_slh_minted": float    # כמה SLH חולקו ללקוחות עד כה
+      "total_slh_minted": str,     # כמה SLH חולקו ללקוחות עד כה (Decimal מדויק)
+      "mint_log_seq": int          # המינט האחרון מיומן המינטים שכבר נכלל בסך
     }
     """
     base = {
@@ -451,11 +597,8 @@ def load_dynamic_config() -> Dict[str, Any]:
         "nis_entry_amount": float(DEFAULT_ENTRY_AMOUNT),
         "total_slh_minted": 0.0,
     }
-    if not DYNAMIC_CONFIG_FILE.exists():
-        return base
     try:
-        with DYNAMIC_CONFIG_FILE.open("r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = dynamic_config_table.load()
         for k in base.keys():
             if k in data:
                 base[k] = data[k]
@@ -467,34 +610,258 @@ def load_dynamic_config() -> Dict[str, Any]:
 
 def save_dynamic_config(cfg: Dict[str, Any]) -> None:
     try:
-        tmp_path = DYNAMIC_CONFIG_FILE.with_suffix(".tmp")
-        with tmp_path.open("w", encoding="utf-8") as f:
-            json.dump(cfg, f, ensure_ascii=False, indent=2)
-        tmp_path.replace(DYNAMIC_CONFIG_FILE)
+        current = dynamic_config_table.load()
+        changed = {k: v for k, v in cfg.items() if current.get(k) != v}
+        dynamic_config_table.put_many(changed)
     except Exception as e:
         logger.error(f"Error saving dynamic SLH config: {e}")
+    finally:
+        DynamicConfigCache.invalidate()
+
+
+try:
+    CONFIG_RECHECK_SECONDS = float(os.getenv("CONFIG_RECHECK_SECONDS", "5"))
+except ValueError:
+    CONFIG_RECHECK_SECONDS = 5.0
+
+
+class DynamicConfigCache:
+    """
+    מטמון תהליכי לקונפיגורציית SLH: מחיר וסכום כניסה – כבר כ-Decimal.
+    מתרענן רק אחרי כתיבה דרך save_dynamic_config, או כשהקובץ/המסד שונה
+    מבחוץ (בדיקה לכל היותר פעם ב-CONFIG_RECHECK_SECONDS).
+    version עולה בכל טעינה מחדש – מטמונים תלויים (טקסטים, מסכים) נעזרים בו.
+    """
+
+    _price: Optional[Decimal] = None
+    _entry: Decimal = DEFAULT_ENTRY_AMOUNT
+    _checked_at: float = 0.0
+    _table_version: int = 0
+    _lock = threading.Lock()
+    version: int = 0
+
+    @classmethod
+    def _reload(cls) -> None:
+        cfg = load_dynamic_config()
+        try:
+            price = Decimal(str(cfg.get("slh_nis_price", float(DEFAULT_SLH_PRICE))))
+        except Exception:
+            price = DEFAULT_SLH_PRICE
+        try:
+            entry = Decimal(str(cfg.get("nis_entry_amount", float(DEFAULT_ENTRY_AMOUNT))))
+        except Exception:
+            entry = DEFAULT_ENTRY_AMOUNT
+        cls._price, cls._entry = price, entry
+        cls._checked_at = time.monotonic()
+        cls._table_version = dynamic_config_table.version
+        cls.version += 1
+
+    @classmethod
+    def get(cls) -> (Decimal, Decimal):
+        """(מחיר ל-SLH 1, סכום כניסה)."""
+        if (
+            cls._price is None
+            or time.monotonic() - cls._checked_at >= CONFIG_RECHECK_SECONDS
+        ):
+            with cls._lock:
+                # הטבלה יכולה להתרענן גם ברקע (כמה תהליכים) – משווים גרסה
+                dynamic_config_table.refresh_if_changed()
+                if cls._price is None or cls._table_version != dynamic_config_table.version:
+                    cls._reload()
+                else:
+                    cls._checked_at = time.monotonic()
+        return cls._price, cls._entry
+
+    @classmethod
+    def cached(cls) -> (Decimal, Decimal):
+        """
+        הערכים שבמטמון בלי לגשת לאחסון – ל-event loop. רק לפני הטעינה
+        הראשונה נופל ל-get(); הריענון עצמו רץ ב-executor (watch_messages_file).
+        """
+        if cls._price is None:
+            return cls.get()
+        return cls._price, cls._entry
+
+    @classmethod
+    def invalidate(cls) -> None:
+        with cls._lock:
+            cls._reload()
 
 
 def get_current_price_and_entry() -> (Decimal, Decimal):
-    cfg = load_dynamic_config()
-    try:
-        price = Decimal(str(cfg.get("slh_nis_price", float(DEFAULT_SLH_PRICE))))
-    except Exception:
-        price = DEFAULT_SLH_PRICE
-    try:
-        entry = Decimal(str(cfg.get("nis_entry_amount", float(DEFAULT_ENTRY_AMOUNT))))
-    except Exception:
-        entry = DEFAULT_ENTRY_AMOUNT
-    return price, entry
+    return DynamicConfigCache.get()
+
+
+try:
+    MINT_FLUSH_EVERY = max(1, int(os.getenv("MINT_FLUSH_EVERY", "50")))
+except ValueError:
+    MINT_FLUSH_EVERY = 50
+
+try:
+    MINT_FLUSH_SECONDS = float(os.getenv("MINT_FLUSH_SECONDS", "60"))
+except ValueError:
+    MINT_FLUSH_SECONDS = 60.0
+
+
+class MintAccumulator:
+    """
+    צובר את סך ה-SLH שחולקו כ-Decimal מדויק בזיכרון.
+    כל מינט נרשם מיד (append + fsync) ביומן קטן; הסך המצטבר נכתב לקונפיגורציה
+    הדינמית רק כל MINT_FLUSH_EVERY מינטים או MINT_FLUSH_SECONDS שניות.
+    כל שורה ביומן ממוספרת (seq), והקונפיגורציה שומרת את ה-seq האחרון שנכלל
+    בסך – כך שקריסה בין כתיבת הסך לניקוי היומן לא גורמת לספירה כפולה.
+
+    בכמה תהליכים לכל תהליך יומן ומפתחות משלו לפי המשבצת שלו (worker_slot):
+    משבצת 0 – slh_mints.log / total_slh_minted (כמו בתהליך יחיד), משבצת n –
+    slh_mints.<n>.log / total_slh_minted:<n>. אף תהליך לא דורס את הסך של אחר;
+    הסך הכולל הוא הסך שלנו + מה שהתהליכים האחרים כתבו בפעם האחרונה.
+    """
+
+    TOTAL_KEY = "total_slh_minted"
+    SEQ_KEY = "mint_log_seq"
+
+    def __init__(self, log_dir: Path, worker_slot: Callable[[], int] = lambda: 0) -> None:
+        self.log_dir = log_dir
+        self._worker_slot = worker_slot
+        self.log_path = log_dir / "slh_mints.log"
+        self._total_key = self.TOTAL_KEY
+        self._seq_key = self.SEQ_KEY
+        self._lock = threading.Lock()
+        self._total: Optional[Decimal] = None
+        self._seq = 0
+        self._flushed_seq = 0
+        self._flushed_at = time.monotonic()
+
+    def _ensure_loaded(self) -> None:
+        if self._total is not None:
+            return
+        slot = self._worker_slot()
+        if slot:
+            self.log_path = self.log_dir / f"slh_mints.{slot}.log"
+            self._total_key = f"{self.TOTAL_KEY}:{slot}"
+            self._seq_key = f"{self.SEQ_KEY}:{slot}"
+        cfg = dynamic_config_table.load()
+        try:
+            total = Decimal(str(cfg.get(self._total_key, 0)))
+        except Exception:
+            total = Decimal("0")
+        flushed_seq = int(cfg.get(self._seq_key, 0) or 0)
+        seq = flushed_seq
+        if self.log_path.exists():
+            with self.log_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        entry_seq = int(entry["seq"])
+                        amount = Decimal(entry["amount"])
+                    except Exception:
+                        continue
+                    if entry_seq > flushed_seq:
+                        total += amount
+                        seq = max(seq, entry_seq)
+        self._total = total
+        self._seq = seq
+        self._flushed_seq = flushed_seq
+
+    def record(self, amount_slh: Decimal) -> Decimal:
+        """רושם מינט ומחזיר את הסך המעודכן."""
+        with self._lock:
+            self._ensure_loaded()
+            self._seq += 1
+            line = json.dumps(
+                {
+                    "seq": self._seq,
+                    "amount": str(amount_slh),
+                    "ts": datetime.now().isoformat(),
+                },
+                separators=(",", ":"),
+            )
+            with self.log_path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._total += amount_slh
+            if (
+                self._seq - self._flushed_seq >= MINT_FLUSH_EVERY
+                or time.monotonic() - self._flushed_at >= MINT_FLUSH_SECONDS
+            ):
+                try:
+                    self._flush_locked()
+                except Exception as e:
+                    # המינט כבר ביומן; הסך ייכתב ב-flush הבא
+                    logger.error(f"Error flushing minted SLH total: {e}")
+            return self._total + self._others_total()
+
+    def _others_total(self) -> Decimal:
+        """הסכים שתהליכים אחרים (משבצות אחרות) כתבו לקונפיגורציה."""
+        total = Decimal("0")
+        for key, value in dynamic_config_table.load().items():
+            if key == self._total_key:
+                continue
+            if key == self.TOTAL_KEY or key.startswith(self.TOTAL_KEY + ":"):
+                try:
+                    total += Decimal(str(value))
+                except Exception:
+                    continue
+        return total
+
+    def total(self) -> Decimal:
+        with self._lock:
+            self._ensure_loaded()
+            return self._total + self._others_total()
+
+    def _flush_locked(self) -> None:
+        self._flushed_at = time.monotonic()
+        if self._seq == self._flushed_seq:
+            return
+        # put_many מעלה חריגה אם הכתיבה נכשלה – ואז היומן נשאר כמו שהוא
+        dynamic_config_table.put_many(
+            {self._total_key: str(self._total), self._seq_key: self._seq}
+        )
+        self._flushed_seq = self._seq
+        try:
+            self.log_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._total is not None:
+                self._flush_locked()
+
+    def flush_if_due(self) -> None:
+        """flush לפי זמן גם בלי מינט חדש – כדי שתהליכים אחרים יראו את הסך."""
+        with self._lock:
+            if (
+                self._total is not None
+                and time.monotonic() - self._flushed_at >= MINT_FLUSH_SECONDS
+            ):
+                self._flush_locked()
+
+
+mint_accumulator = MintAccumulator(DATA_DIR, worker_slot=cluster.worker_slot)
+
+# היסטוריית שער SLH – כל /set_price נרשם כנקודה בסדרת זמן
+price_history = PriceHistory(DATA_DIR / "slh_price_history.jsonl")
+
+
+def record_price_change(old_price: Decimal, new_price: Decimal, actor: Optional[int]) -> None:
+    """
+    רושם שינוי שער בהיסטוריה. בשינוי הראשון נרשם גם המחיר הקודם (ts=0),
+    כדי ששאילתות על זמנים שלפני השינוי יחזירו את השער שהיה בתוקף.
+    """
+    if len(price_history) == 0:
+        price_history.record(old_price, ts=0.0)
+    price_history.record(new_price, actor=actor)
+
+
+def get_total_slh_minted() -> Decimal:
+    return mint_accumulator.total()
 
 
 def record_mint_amount(amount_slh: Decimal) -> None:
     try:
-        cfg = load_dynamic_config()
-        current_total = Decimal(str(cfg.get("total_slh_minted", 0.0)))
-        new_total = current_total + amount_slh
-        cfg["total_slh_minted"] = float(new_total)
-        save_dynamic_config(cfg)
+        mint_accumulator.record(amount_slh)
     except Exception as e:
         logger.error(f"Error recording minted SLH: {e}")
 
@@ -512,15 +879,34 @@ def compute_slh_for_entry(price_nis: Decimal, entry_nis: Decimal) -> Decimal:
 
 
 # =========================
-# Pydantic models
+# Internal wallet helpers (סינכרוניים – מורצים דרך run_storage)
 # =========================
-class TelegramWebhookUpdate(BaseModel):
-    update_id: int
-    message: Optional[Dict[str, Any]] = None
-    callback_query: Optional[Dict[str, Any]] = None
-    edited_message: Optional[Dict[str, Any]] = None
+def load_wallet_snapshot(
+    user_id: int, username: Optional[str] = None
+) -> (Dict[str, Any], List[Dict[str, Any]]):
+    """
+    מוודא שקיים ארנק פנימי ומחזיר (overview, stakes) בקריאה אחת,
+    כדי שה-handlers יבצעו מעבר יחיד ל-executor במקום שלושה.
+    """
+    ensure_internal_wallet(user_id, username)
+    overview = get_wallet_overview(user_id) or {}
+    stakes = get_user_stakes(user_id) or []
+    return overview, stakes
+
+
+def mint_and_record(user_id: int, amount_slh: Decimal, reason: str) -> None:
+    """מינט SLH פנימי למשתמש + עדכון סך ה-SLH שחולקו."""
+    try:
+        mint_slh_from_payment(user_id, amount_slh, reason)
+    except TypeError:
+        # אם הפונקציה מוגדרת בגירסה ישנה עם פחות פרמטרים – נתמוך גם בה
+        mint_slh_from_payment(user_id, amount_slh)
+    record_mint_amount(amount_slh)
 
 
+# =========================
+# Pydantic models
+# =========================
 class HealthResponse(BaseModel):
     status: str
     service: str
@@ -547,6 +933,11 @@ class ConfigSnapshot(BaseModel):
     cold_wallet_address: str
 
 
+class BroadcastRequest(BaseModel):
+    text: str
+    parse_mode: Optional[str] = None
+
+
 class WalletAPIResponse(BaseModel):
     user_id: int
     balance_slh: float
@@ -574,7 +965,13 @@ class Config:
     BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
     BOT_USERNAME: str = os.getenv("BOT_USERNAME", "Buy_My_Shop_bot")
     WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
+    # נשלח לטלגרם ב-set_webhook וחוזר בכותרת X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_SECRET_TOKEN: str = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+    # מספר ה-workers של UpdateWorkerPool (shard לכל worker; אותו צ'אט – לפי הסדר)
+    UPDATE_WORKERS: int = UPDATE_WORKERS
     ADMIN_ALERT_CHAT_ID: str = os.getenv("ADMIN_ALERT_CHAT_ID", "")
+    # טוקן לנקודות API ניהוליות (שידור). ריק = הנקודות חסומות
+    ADMIN_API_TOKEN: str = os.getenv("ADMIN_API_TOKEN", "")
     LANDING_URL: str = os.getenv("LANDING_URL", "https://slh-nft.com")
     BUSINESS_GROUP_URL: str = os.getenv("BUSINESS_GROUP_URL", "")
     GROUP_STATIC_INVITE: str = os.getenv("GROUP_STATIC_INVITE", "")
@@ -595,10 +992,16 @@ class Config:
     @classmethod
     def validate(cls) -> List[str]:
         warnings: List[str] = []
+        if APP_ROLE not in ("bot", "api", "both"):
+            warnings.append(f"⚠️ APP_ROLE={APP_ROLE} לא מוכר – רץ כ-both")
+        if not RUNS_BOT:
+            return warnings
         if not cls.BOT_TOKEN:
             warnings.append("⚠️ BOT_TOKEN לא מוגדר")
         if not cls.WEBHOOK_URL:
             warnings.append("⚠️ WEBHOOK_URL לא מוגדר")
+        elif not cls.WEBHOOK_SECRET_TOKEN:
+            warnings.append("⚠️ WEBHOOK_SECRET_TOKEN לא מוגדר – ה-webhook לא מאמת את השולח")
         if not cls.ADMIN_ALERT_CHAT_ID:
             warnings.append("⚠️ ADMIN_ALERT_CHAT_ID לא מוגדר")
         return warnings
@@ -606,7 +1009,8 @@ class Config:
     @classmethod
     def snapshot(cls) -> ConfigSnapshot:
         """החזרת תמונת מצב בטוחה (ללא טוקנים/סודות) לקונפיגורציה."""
-        cfg = load_dynamic_config()
+        price, entry = DynamicConfigCache.get()
+        minted = get_total_slh_minted()
         return ConfigSnapshot(
             bot_username=cls.BOT_USERNAME,
             landing_url=cls.LANDING_URL,
@@ -617,11 +1021,9 @@ class Config:
             has_paypal=bool(cls.PAYPAL_URL),
             has_ton=bool(cls.TON_WALLET_ADDRESS),
             logs_group_set=bool(cls.LOGS_GROUP_CHAT_ID),
-            slh_nis_price=float(cfg.get("slh_nis_price", float(DEFAULT_SLH_PRICE))),
-            nis_entry_amount=float(
-                cfg.get("nis_entry_amount", float(DEFAULT_ENTRY_AMOUNT))
-            ),
-            total_slh_minted=float(cfg.get("total_slh_minted", 0.0)),
+            slh_nis_price=float(price),
+            nis_entry_amount=float(entry),
+            total_slh_minted=float(minted),
             hot_wallet_address=cls.HOT_WALLET_ADDRESS,
             cold_wallet_address=cls.COLD_WALLET_ADDRESS,
         )
@@ -644,17 +1046,166 @@ def format_decimal_pretty(value: Decimal) -> str:
         return str(value)
 
 
-async def send_log_message(text: str) -> None:
-    """שולח הודעה לקבוצת לוגים (אם מוגדרת)."""
+# =========================
+# Message templates
+# =========================
+def build_template_context() -> Dict[str, str]:
+    """ערכים כלליים לתבניות: מחיר, סכום כניסה וקישורים."""
+    price_nis, entry_nis = DynamicConfigCache.cached()
+    return {
+        "price": format_decimal_pretty(price_nis),
+        "entry": format_decimal_pretty(entry_nis),
+        "slh_per_entry": format_decimal_pretty(compute_slh_for_entry(price_nis, entry_nis)),
+        "group_url": safe_get_url(
+            Config.BUSINESS_GROUP_URL or Config.GROUP_STATIC_INVITE, Config.LANDING_URL
+        ),
+        "landing_url": Config.LANDING_URL,
+        "paybox_url": Config.PAYBOX_URL,
+        "bit_url": Config.BIT_URL,
+        "paypal_url": Config.PAYPAL_URL,
+        "ton_wallet": Config.TON_WALLET_ADDRESS,
+        "bot_username": Config.BOT_USERNAME,
+    }
+
+
+def _template_version():
+    # רק קריאת גרסאות מהזיכרון – נקרא בכל render על ה-event loop.
+    # version עולה ב-save_dynamic_config, או כש-get() (ב-executor) מוצא שינוי
+    return MessageCatalog.version, DynamicConfigCache.version
+
+
+message_templates = MessageTemplates(
+    load_message_block, build_template_context, _template_version
+)
+
+PAYMENT_FOOTER = (
+    "\nלאחר שביצעת תשלום באחד האמצעים למעלה:\n"
+    "1️⃣ שמור צילום מסך ברור של אישור התשלום (או קובץ PDF / מסמך מהבנק).\n"
+    "2️⃣ שלח את צילום המסך כאן בצ׳אט עם הבוט.\n"
+    "3️⃣ המערכת תעביר את האישור אוטומטית לקבוצת הניהול.\n\n"
+    "אחרי שהאדמין יאשר – תקבל קישור לקבוצת העסקים + זיכוי SLH בארנק הפנימי."
+)
+
+# בלוק בקובץ ההודעות באותו שם גובר על ברירת המחדל שכאן
+for _name, _default in {
+    "START_BODY": (
+        "ברוך הבא לשער הדיגיטלי של קהילת SLHNET.\n"
+        "כאן אתה מצטרף לקהילת עסקים, מקבל גישה לארנקים, חוזים חכמים, "
+        "NFT וקבלת תשלומים – הכל סביב תשלום חד־פעמי של *{{entry}} ₪*."
+    ),
+    "INVESTOR_INFO": (
+        "📈 **מידע למשקיעים**\n\n"
+        "מערכת SLHNET מחברת בין טלגרם, חוזים חכמים על Binance Smart Chain, "
+        "קבלות דיגיטליות ו-NFT, כך שכל עסקה מתועדת וניתנת למעקב.\n\n"
+        "ניתן להצטרף כשותף, להחזיק טוקן SLH ולקבל חלק מהתנועה במערכת."
+    ),
+    "BENEFITS_INFO": (
+        "🎁 **מה מקבלים בתשלום {{entry}} ₪?**\n\n"
+        "• גישה לקבוצת עסקים חכמה בטלגרם עם תכנים, הדרכות וקהילה פעילה.\n"
+        "• פתיחה וחיבור של ארנק SLH על רשת Binance Smart Chain (BSC).\n"
+        "• אפשרות לקבל תשלומים דיגיטליים ועמלות הפנייה דרך המערכת.\n"
+        "• חיבור לחוזים חכמים, קבלות דיגיטליות ו-NFT שמייצגים עסקאות ושערי כניסה.\n"
+        "• בסיס לעתיד – סטייקינג, חסכונות והשקעות מתקדמות בתוך אקו־סיסטם SLHNET.\n\n"
+        "אחרי התשלום ושליחת האישור – אתה מקבל קישור לקבוצה + סט כלים דיגיטליים להתחלה."
+    ),
+    "SEND_PROOF_MENU": (
+        "💳 *איך לשלם ולשלוח אישור*\n\n"
+        "בחר אחד מאמצעי התשלום למטה לקבלת הוראות מדויקות.\n"
+        "לאחר התשלום, שלח כאן לבוט צילום מסך של האישור."
+    ),
+    "PERSONAL_AREA": (
+        "👤 *האזור האישי שלך*\n\n"
+        "לקבלת סיכום מלא (ארנק, סטייקינג והפניות):\n"
+        "השתמש בפקודה /portfolio בצ׳אט עם הבוט.\n\n"
+        "בהמשך נוסיף כאן שאלון קצר כדי להכיר אותך טוב יותר ולחבר אותך\n"
+        "למומחים ולעסקים הרלוונטיים לך."
+    ),
+    "PAYMENT_BANK": (
+        "🏦 *תשלום בהעברה בנקאית*\n\n"
+        "פרטי החשבון:\n"
+        "בנק הפועלים\n"
+        "סניף כפר גנים (153)\n"
+        "חשבון 73462\n"
+        "המוטב: קאופמן צביקה\n"
+        + PAYMENT_FOOTER
+    ),
+    "PAYMENT_PAYBOX": (
+        "📲 *תשלום ב-PayBox*\n\n"
+        "השתמש בלינק הזה לתשלום {{entry}} ₪:\n{{paybox_url}}\n"
+        + PAYMENT_FOOTER
+    ),
+    "PAYMENT_BIT": (
+        "📲 *תשלום ב-Bit*\n\n"
+        "השתמש בלינק הזה לתשלום {{entry}} ₪:\n{{bit_url}}\n"
+        + PAYMENT_FOOTER
+    ),
+    "PAYMENT_PAYPAL": (
+        "🌍 *תשלום ב-PayPal*\n\n"
+        "השתמש בלינק הבא לתשלום {{entry}} ₪:\n{{paypal_url}}\n"
+        + PAYMENT_FOOTER
+    ),
+    "PAYMENT_TON": (
+        "🔐 *תשלום בקריפטו – TON*\n\n"
+        "שלח את שווי {{entry}} ₪ בטוקן TON לכתובת:\n"
+        "`{{ton_wallet}}`\n"
+        + PAYMENT_FOOTER
+    ),
+    "APPROVE_USER": (
+        "✅ התשלום שלך אושר!\n\n"
+        "הנה הקישור להצטרפות לקהילת העסקים שלנו:\n"
+        "{{group_url}}\n\n"
+        "בנוסף, זה הקישור האישי שלך להזמנת חברים:\n"
+        "{{referral_link}}\n"
+        "{{minted_line}}\n\n"
+        "תוכל תמיד לקבל את הקישור האישי שוב בפקודה /my_link.\n"
+        "ברוך הבא 🙌"
+    ),
+    "MINTED_LINE": (
+        "\n\nכחלק מההצטרפות קיבלת *{{minted}}* SLH פנימי לארנק שלך."
+    ),
+}.items():
+    message_templates.register(_name, _default)
+
+
+async def send_to_chat(chat: Any, *args: Any, priority: int = PRIORITY_USER, **kwargs: Any) -> Any:
+    """chat.send_message דרך מתזמן ההודעות היוצאות (מגבלות קצב של טלגרם)."""
+    return await outbound.send(
+        chat.id, lambda: chat.send_message(*args, **kwargs), priority
+    )
+
+
+async def send_bot_message(
+    bot: Any, chat_id: Any, priority: int = PRIORITY_ADMIN, **kwargs: Any
+) -> Any:
+    """bot.send_message לצ'אט אחר (למשל הודעה ללקוח מפקודת מנהל) דרך המתזמן."""
+    return await outbound.send(
+        chat_id, lambda: bot.send_message(chat_id=chat_id, **kwargs), priority
+    )
+
+
+async def _deliver_log_digest(text: str) -> None:
+    chat_id = int(Config.LOGS_GROUP_CHAT_ID)
+    bot = TelegramAppManager.get_app().bot
+    await outbound.send(
+        chat_id, lambda: bot.send_message(chat_id=chat_id, text=text), PRIORITY_LOG
+    )
+
+
+log_digest = LogDigest(_deliver_log_digest)
+
+
+async def send_log_message(text: str, urgent: bool = False) -> None:
+    """
+    מוסיף הודעה ל-digest של קבוצת הלוגים (אם מוגדרת) וחוזר מיד.
+    ההודעות נאספות ל-LOG_DIGEST_SECONDS ונשלחות יחד ברקע; urgent שולח מיד.
+    בתפקיד api אין בוט – ההודעה נרשמת רק בלוג.
+    """
+    if not RUNS_BOT:
+        logger.info(text)
+        return
     if not Config.LOGS_GROUP_CHAT_ID:
         return
-    try:
-        app_instance = TelegramAppManager.get_app()
-        await app_instance.bot.send_message(
-            chat_id=int(Config.LOGS_GROUP_CHAT_ID), text=text
-        )
-    except Exception as e:
-        logger.error(f"Failed to send log message: {e}")
+    log_digest.add(text, urgent=urgent)
 
 
 async def send_bug_report(
@@ -678,7 +1229,7 @@ async def send_bug_report(
             lines.append(f"👤 full_name={user.full_name}")
         if chat is not None:
             lines.append(f"💬 chat_id={chat.id}, type={chat.type}")
-        await send_log_message("\n".join(lines))
+        await send_log_message("\n".join(lines), urgent=True)
     except Exception as e:
         logger.error(f"Failed to send bug report: {e}")
 
@@ -701,6 +1252,7 @@ class TelegramAppManager:
         if cls._instance is None:
             if not Config.BOT_TOKEN:
                 raise RuntimeError("BOT_TOKEN is not set")
+            # ה-pool קורא ל-process_update ישירות, כך ש-concurrent_updates לא נחוץ
             cls._instance = Application.builder().token(Config.BOT_TOKEN).build()
             logger.info("Telegram Application instance created")
         return cls._instance
@@ -724,9 +1276,14 @@ class TelegramAppManager:
             CommandHandler("approve", approve_command),
             CommandHandler("reject", reject_command),
             CommandHandler("set_price", set_price_command),
+            CommandHandler("price_history", price_history_command),
+            CommandHandler("reload_messages", reload_messages_command),
             CommandHandler("admin_wallet", admin_wallet_command),
             CommandHandler("admin_user", admin_user_command),
             CommandHandler("admin_credit", admin_credit_command),
+            CommandHandler("broadcast", broadcast_command),
+            CommandHandler("broadcast_status", broadcast_status_command),
+            CommandHandler("broadcast_cancel", broadcast_cancel_command),
 
             # ארנק & סטייקינג & הפניות
             CommandHandler("wallet", wallet_command),
@@ -741,7 +1298,7 @@ class TelegramAppManager:
             CommandHandler("onchain_wallet", onchain_wallet_command),
             CommandHandler("set_wallet", set_wallet_command),
 
-            CallbackQueryHandler(callback_query_handler),
+            CallbackQueryHandler(callback_router.dispatch),
             MessageHandler(filters.PHOTO | filters.Document.ALL, payment_proof_handler),
             MessageHandler(filters.TEXT & ~filters.COMMAND, echo_message),
             MessageHandler(filters.COMMAND, unknown_command),
@@ -760,15 +1317,22 @@ class TelegramAppManager:
         if not cls._started:
             await app_instance.initialize()
             await app_instance.start()
-            try:
-                if Config.WEBHOOK_URL:
-                    await app_instance.bot.set_webhook(Config.WEBHOOK_URL)
-                    logger.info(f"Webhook set to {Config.WEBHOOK_URL}")
-            except Exception as e:
-                logger.error(f"Failed to set webhook: {e}")
             cls._started = True
             logger.info("Telegram Application started")
 
+    @classmethod
+    async def set_webhook(cls) -> None:
+        """נקרא רק בתהליך המוביל – כל התהליכים מקבלים עדכונים מאותו webhook."""
+        try:
+            if Config.WEBHOOK_URL:
+                await cls.get_app().bot.set_webhook(
+                    Config.WEBHOOK_URL,
+                    secret_token=Config.WEBHOOK_SECRET_TOKEN or None,
+                )
+                logger.info(f"Webhook set to {Config.WEBHOOK_URL}")
+        except Exception as e:
+            logger.error(f"Failed to set webhook: {e}")
+
     @classmethod
     async def shutdown(cls) -> None:
         try:
@@ -883,75 +1447,336 @@ def build_payment_menu_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(rows)
 
 
+PAYMENT_METHOD_TEMPLATES = {
+    "bank": "PAYMENT_BANK",
+    "paybox": "PAYMENT_PAYBOX",
+    "bit": "PAYMENT_BIT",
+    "paypal": "PAYMENT_PAYPAL",
+    "ton": "PAYMENT_TON",
+}
+
+
+def build_payment_instructions_text(method: str) -> str:
+    """
+    טקסט מסודר לכל אפשרויות התשלום והוראות שליחת האישור (מתבנית).
+    """
+    name = PAYMENT_METHOD_TEMPLATES.get(method)
+    if name is None:
+        return "שגיאה: אמצעי תשלום לא ידוע."
+    return message_templates.render(name)
+
+
 # =========================
-# Telegram handlers
+# Screen registry
 # =========================
-async def send_start_screen(
-    update: Update,
-    context: ContextTypes.DEFAULT_TYPE,
-    referrer: Optional[int] = None,
-) -> None:
+class Screen(NamedTuple):
+    text: str
+    reply_markup: InlineKeyboardMarkup
+    parse_mode: Optional[str] = "Markdown"
+
+
+class ScreenRegistry:
     """
-    מסך הפתיחה המרכזי. מזהה הפניות, בונה מסך שיווקי
-    ומציג למשתמש כפתורים רלוונטיים.
+    מסכים קבועים (טקסט + מקלדת + parse_mode) שתלויים רק בקונפיגורציה
+    ובקטלוג ההודעות. כל מסך נבנה פעם אחת לכל גרסה ונשלף מוכן;
+    שינוי מחיר/סכום כניסה או טעינה מחדש של קובץ ההודעות מחליפים גרסה.
     """
-    user = update.effective_user
-    chat = update.effective_chat
-    if not user or not chat:
-        return
 
-    # register referral & update profile snapshot
-    register_referral(user.id, referrer)
-    upsert_profile(user.id, user.username, user.full_name)
+    _builders: Dict[str, Callable[[], Screen]] = {}
+    _cache: Dict[str, Screen] = {}
+    _version: Any = None
+    _lock = threading.Lock()
 
-    # load title & body
-    title = load_message_block("START_TITLE", "🚀 ברוך הבא ל-SLHNET!")
-    body = load_message_block(
-        "START_BODY",
-        (
-            "ברוך הבא לשער הדיגיטלי של קהילת SLHNET.\n"
-            "כאן אתה מצטרף לקהילת עסקים, מקבל גישה לארנקים, חוזים חכמים, "
-            "NFT וקבלת תשלומים – הכל סביב תשלום חד־פעמי של *39 ₪*."
-        ),
-    )
+    @classmethod
+    def register(cls, name: str, builder: Callable[[], Screen]) -> None:
+        with cls._lock:
+            cls._builders[name] = builder
+            cls._cache.pop(name, None)
 
-    # send banner
-    image_path = BASE_DIR / Config.START_IMAGE_PATH
-    try:
-        if image_path.exists() and image_path.is_file():
-            with image_path.open("rb") as f:
-                await chat.send_photo(photo=InputFile(f), caption=title)
-        else:
-            await chat.send_message(text=title)
-    except Exception as e:
-        logger.error(f"Error sending start image: {e}")
-        await chat.send_message(text=title)
+    @classmethod
+    def get(cls, name: str) -> Screen:
+        current = _template_version()
+        with cls._lock:
+            if current != cls._version:
+                cls._cache.clear()
+                cls._version = current
+            screen = cls._cache.get(name)
+            if screen is None:
+                screen = cls._builders[name]()
+                cls._cache[name] = screen
+            return screen
 
-    # check if paid
-    has_paid = False
-    try:
-        has_paid = has_approved_payment(user.id)
-    except Exception as e:
-        logger.error(f"Error checking approved payment for user {user.id}: {e}")
+    @classmethod
+    def invalidate(cls) -> None:
+        """למשל אחרי שינוי ערכי Config בזמן ריצה."""
+        with cls._lock:
+            cls._cache.clear()
 
-    keyboard = build_start_keyboard(has_paid)
-    await chat.send_message(text=body, reply_markup=keyboard, parse_mode="Markdown")
 
-    # log
-    log_text = (
-        "📥 משתמש חדש הפעיל את הבוט\n"
-        f"👤 User ID: {user.id}\n"
-        f"📛 Username: @{user.username or 'לא מוגדר'}\n"
-        f"🔰 שם: {user.full_name}\n"
-        f"🔄 Referrer: {referrer or 'לא צוין'}"
+def _bug_report_row(feature_id: str) -> List[InlineKeyboardButton]:
+    return [
+        InlineKeyboardButton(
+            "🐞 דיווח באג במסך זה", callback_data=f"report_bug:{feature_id}"
+        )
+    ]
+
+
+def _build_info_screen(template: str, feature_id: str, back_label: str) -> Screen:
+    keyboard = InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton(back_label, callback_data="back_to_main")],
+            _bug_report_row(feature_id),
+        ]
     )
-    await send_log_message(log_text)
+    return Screen(message_templates.render(template), keyboard)
 
 
-async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    referrer = None
-    if context.args:
-        try:
+def _build_payment_method_screen(method: str) -> Screen:
+    keyboard = InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    "📤 שלח עכשיו צילום מסך", callback_data="send_proof_menu"
+                )
+            ],
+            [
+                InlineKeyboardButton(
+                    "🔙 חזרה לאפשרויות תשלום", callback_data="send_proof_menu"
+                )
+            ],
+            [InlineKeyboardButton("🏠 חזרה לתפריט הראשי", callback_data="back_to_main")],
+            _bug_report_row(f"pay_{method}"),
+        ]
+    )
+    return Screen(build_payment_instructions_text(method), keyboard)
+
+
+ScreenRegistry.register(
+    "start", lambda: Screen(message_templates.render("START_BODY"), build_start_keyboard(False))
+)
+ScreenRegistry.register(
+    "start_paid",
+    lambda: Screen(message_templates.render("START_BODY"), build_start_keyboard(True)),
+)
+ScreenRegistry.register(
+    "send_proof_menu",
+    lambda: Screen(message_templates.render("SEND_PROOF_MENU"), build_payment_menu_keyboard()),
+)
+ScreenRegistry.register(
+    "investor",
+    lambda: _build_info_screen("INVESTOR_INFO", "investor_screen", "🔙 חזרה לתפריט הראשי"),
+)
+ScreenRegistry.register(
+    "benefits",
+    lambda: _build_info_screen("BENEFITS_INFO", "benefits_screen", "🔙 חזרה לתפריט הראשי"),
+)
+ScreenRegistry.register(
+    "personal_area",
+    lambda: _build_info_screen("PERSONAL_AREA", "personal_area", "🏠 חזרה לתפריט הראשי"),
+)
+for _method in PAYMENT_METHOD_TEMPLATES:
+    ScreenRegistry.register(
+        f"pay_{_method}", lambda m=_method: _build_payment_method_screen(m)
+    )
+
+
+async def show_screen(query: Any, name: str) -> None:
+    """עורך את הודעת ה-callback למסך שמור מהרישום."""
+    screen = ScreenRegistry.get(name)
+    await query.edit_message_text(
+        text=screen.text, reply_markup=screen.reply_markup, parse_mode=screen.parse_mode
+    )
+
+
+# =========================
+# Media cache (Telegram file_id)
+# =========================
+class MediaCache:
+    """
+    כל קובץ מדיה מועלה לטלגרם פעם אחת; ה-file_id שחוזר נשמר (לפי sha256 של
+    תוכן הקובץ ומזהה הבוט) ומשמש לשליחות הבאות – גם אחרי ריסטארט.
+    ה-hash מחושב מחדש רק כשה-mtime/גודל של הקובץ משתנים.
+    """
+
+    def __init__(self, table) -> None:
+        self.table = table
+        self._digests: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path: Path) -> Optional[str]:
+        """sha256 של הקובץ, או None אם אינו קיים."""
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        if not path.is_file():
+            return None
+        key = str(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._digests.get(key)
+            if cached and cached[0] == stamp:
+                return cached[1]
+        h = hashlib.sha256()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._digests[key] = (stamp, digest)
+        return digest
+
+    def get(self, digest: str, bot_id: int) -> Optional[str]:
+        rec = self.table.load().get(digest)
+        if not rec or rec.get("bot_id") != bot_id:
+            return None
+        return rec.get("file_id")
+
+    def remember(self, digest: str, bot_id: int, file_id: str, name: str) -> None:
+        self.table.put(
+            digest,
+            {
+                "file_id": file_id,
+                "bot_id": bot_id,
+                "name": name,
+                "uploaded_at": datetime.now().isoformat(),
+            },
+        )
+
+    def forget(self, digest: str) -> None:
+        self.table.put(digest, None)
+
+
+media_cache = MediaCache(media_cache_table)
+
+
+async def send_cached_photo(chat: Any, bot: Any, path: Path, caption: str) -> None:
+    """
+    שולח תמונה לפי file_id שמור; מעלה את הקובץ רק בפעם הראשונה,
+    אחרי שינוי בקובץ, או אם טלגרם דחה את ה-file_id השמור.
+    """
+    digest = await run_storage(media_cache.digest, path)
+    if digest is None:
+        raise FileNotFoundError(str(path))
+
+    file_id = await run_storage(media_cache.get, digest, bot.id)
+    if file_id:
+        try:
+            await outbound.send(
+                chat.id, lambda: chat.send_photo(photo=file_id, caption=caption)
+            )
+            return
+        except BadRequest as e:
+            logger.warning(f"Cached file_id for {path.name} rejected, re-uploading: {e}")
+            await run_storage(media_cache.forget, digest)
+
+    data = await run_storage(path.read_bytes)
+    message = await outbound.send(
+        chat.id,
+        lambda: chat.send_photo(photo=InputFile(data, filename=path.name), caption=caption),
+    )
+    if message and message.photo:
+        await run_storage(
+            media_cache.remember, digest, bot.id, message.photo[-1].file_id, path.name
+        )
+
+
+# =========================
+# Telegram handlers
+# =========================
+async def send_start_screen(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    referrer: Optional[int] = None,
+) -> None:
+    """
+    מסך הפתיחה המרכזי. מזהה הפניות, בונה מסך שיווקי
+    ומציג למשתמש כפתורים רלוונטיים.
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    if not user or not chat:
+        return
+
+    # register referral & update profile snapshot
+    await run_storage(register_referral, user.id, referrer)
+    await run_storage(upsert_profile, user.id, user.username, user.full_name)
+
+    # load title & body
+    title = load_message_block("START_TITLE", "🚀 ברוך הבא ל-SLHNET!")
+
+    # send banner
+    image_path = BASE_DIR / Config.START_IMAGE_PATH
+    try:
+        try:
+            await send_cached_photo(chat, context.bot, image_path, title)
+        except FileNotFoundError:
+            await send_to_chat(chat, text=title)
+    except Exception as e:
+        logger.error(f"Error sending start image: {e}")
+        await send_to_chat(chat, text=title)
+
+    # check if paid
+    has_paid = False
+    try:
+        has_paid = await run_storage(has_approved_payment, user.id)
+    except Exception as e:
+        logger.error(f"Error checking approved payment for user {user.id}: {e}")
+
+    screen = ScreenRegistry.get("start_paid" if has_paid else "start")
+    await send_to_chat(
+        chat,
+        text=screen.text, reply_markup=screen.reply_markup, parse_mode=screen.parse_mode
+    )
+
+    # log
+    log_text = (
+        "📥 משתמש חדש הפעיל את הבוט\n"
+        f"👤 User ID: {user.id}\n"
+        f"📛 Username: @{user.username or 'לא מוגדר'}\n"
+        f"🔰 שם: {user.full_name}\n"
+        f"🔄 Referrer: {referrer or 'לא צוין'}"
+    )
+    await send_log_message(log_text)
+
+
+async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    חזרה לתפריט הראשי מכפתור "חזרה": עריכת ההודעה הקיימת למסך השמור.
+    בלי רישום הפניה, באנר או לוג – אלה שייכים ל-/start אמיתי.
+    """
+    query = update.callback_query
+    user = update.effective_user
+    if not query or not user:
+        return
+
+    has_paid = False
+    try:
+        has_paid = await run_storage(has_approved_payment, user.id)
+    except Exception as e:
+        logger.error(f"Error checking approved payment for user {user.id}: {e}")
+
+    screen = ScreenRegistry.get("start_paid" if has_paid else "start")
+    try:
+        await query.edit_message_text(
+            text=screen.text, reply_markup=screen.reply_markup, parse_mode=screen.parse_mode
+        )
+    except BadRequest as e:
+        if "not modified" in str(e).lower():
+            return
+        # למשל הודעת תמונה שאין בה טקסט לעריכה – שולחים את התפריט כהודעה חדשה
+        chat = update.effective_chat
+        if chat:
+            await send_to_chat(
+                chat,
+                text=screen.text, reply_markup=screen.reply_markup, parse_mode=screen.parse_mode
+            )
+
+
+async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    referrer = None
+    if context.args:
+        try:
             referrer = int(context.args[0])
         except Exception:
             logger.warning(f"Invalid referrer param: {context.args[0]}")
@@ -964,8 +1789,7 @@ async def whoami_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if not user or not chat:
         return
 
-    refs = load_referrals()
-    ref_data = refs.get("users", {}).get(str(user.id), {})
+    ref_data = await run_storage(referral_store.get_user, user.id)
     text = (
         "👤 **פרטי המשתמש שלך:**\n"
         f"🆔 ID: `{user.id}`\n"
@@ -974,7 +1798,7 @@ async def whoami_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         f"🔄 מספר הפניות: {ref_data.get('referral_count', 0)}\n"
         f"📅 הצטרף: {ref_data.get('joined_at', 'לא ידוע')}"
     )
-    await chat.send_message(text=text, parse_mode="Markdown")
+    await send_to_chat(chat, text=text, parse_mode="Markdown")
 
 
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -983,21 +1807,17 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     if not user or not chat:
         return
 
-    refs = load_referrals()
-    stats = refs.get("statistics", {})
-    total_users = stats.get("total_users", 0)
-    users_count = len(refs.get("users", {}))
-    total_refs = sum(
-        u.get("referral_count", 0) for u in refs.get("users", {}).values()
-    )
+    stats = await run_storage(referral_store.statistics)
 
     text = (
         "📊 סטטיסטיקות קהילה:\n"
-        f"👥 סה״כ משתמשים: {total_users}\n"
-        f"📈 משתמשים פעילים: {users_count}\n"
-        f"🔄 הפניות כוללות: {total_refs}"
+        f"👥 סה״כ משתמשים: {stats['total_users']}\n"
+        f"🆕 הצטרפו היום: {stats['joined_today']}\n"
+        f"📅 הצטרפו ב-7 הימים האחרונים: {stats['joined_this_week']}\n"
+        f"📈 מפנים פעילים: {stats['active_referrers']}\n"
+        f"🔄 הפניות כוללות: {stats['total_referrals']}"
     )
-    await chat.send_message(text=text)
+    await send_to_chat(chat, text=text)
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1025,11 +1845,16 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "• /approve <user_id> – אישור תשלום + מינט SLH פנימי\n"
         "• /reject <user_id> <סיבה> – דחיית תשלום\n"
         "• /set_price <מחיר_ש\"ח_ל-SLH_1> – עדכון שער SLH\n"
+        "• /price\\_history – היסטוריית שינויי שער SLH\n"
+        "• /reload\\_messages – טעינה מחדש של קובץ ההודעות\n"
         "• /admin_wallet – סקירת ארנק מערכת ושערים\n"
         "• /admin_user <user_id> – צילום מצב משתמש\n"
         "• /admin_credit <user_id> <amount_slh> – קרדיט ידני של SLH\n"
+        "• /broadcast <טקסט> – שידור הודעה לכל המשתמשים\n"
+        "• /broadcast\\_status [id] – מצב שידור\n"
+        "• /broadcast\\_cancel <id> – עצירת שידור\n"
     )
-    await chat.send_message(text=text, parse_mode="Markdown")
+    await send_to_chat(chat, text=text, parse_mode="Markdown")
 
 
 # ===== Payments & admin =====
@@ -1064,17 +1889,21 @@ async def payment_proof_handler(update: Update, context: ContextTypes.DEFAULT_TY
         pay_method = "screenshot"
 
     try:
-        log_payment(user.id, user.username, pay_method)
+        await run_storage(log_payment, user.id, user.username, pay_method)
     except Exception as e:
         logger.error(f"Error logging payment for user {user.id}: {e}")
 
     if Config.LOGS_GROUP_CHAT_ID:
         try:
             admin_chat_id = int(Config.LOGS_GROUP_CHAT_ID)
-            await context.bot.copy_message(
-                chat_id=admin_chat_id,
-                from_chat_id=chat.id,
-                message_id=message.message_id,
+            await outbound.send(
+                admin_chat_id,
+                lambda: context.bot.copy_message(
+                    chat_id=admin_chat_id,
+                    from_chat_id=chat.id,
+                    message_id=message.message_id,
+                ),
+                PRIORITY_ADMIN,
             )
 
             keyboard = InlineKeyboardMarkup(
@@ -1102,15 +1931,17 @@ async def payment_proof_handler(update: Update, context: ContextTypes.DEFAULT_TY
                 "(או להשתמש בכפתורי האישור/דחייה מתחת להודעה זו)"
             )
 
-            await context.bot.send_message(
-                chat_id=admin_chat_id,
+            await send_bot_message(
+                context.bot,
+                admin_chat_id,
                 text=admin_text,
                 reply_markup=keyboard,
             )
         except Exception as e:
             logger.error(f"Error sending payment log to admin group: {e}")
 
-    await chat.send_message(
+    await send_to_chat(
+        chat,
         "📥 קיבלנו את אישור התשלום שלך!\n"
         "ההודעה הועברה לצוות הניהול. לאחר אישור, ישלח אליך קישור לקבוצת העסקים + זיכוי SLH בארנק הפנימי."
     )
@@ -1126,13 +1957,14 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
 
     if not is_admin(user.id):
-        await chat.send_message("❌ הפקודה /admin מיועדת למנהלי המערכת בלבד.")
+        await send_to_chat(chat, "❌ הפקודה /admin מיועדת למנהלי המערכת בלבד.")
         return
 
-    approval_stats = get_approval_stats() or {}
-    reserve_stats = get_reserve_stats() or {}
-    price_nis, entry_nis = get_current_price_and_entry()
-    cfg = load_dynamic_config()
+    approval_stats = await run_storage(get_approval_stats) or {}
+    reserve_stats = await run_storage(get_reserve_stats) or {}
+    price_nis, entry_nis = await run_storage(get_current_price_and_entry)
+    total_minted = await run_storage(get_total_slh_minted)
+    community = await run_storage(referral_store.statistics)
 
     text_lines = [
         "🛠 *פאנל ניהול SLHNET – תקציר מיידי*",
@@ -1151,7 +1983,13 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         f" - מחיר נוכחי ל-SLH 1: ~{format_decimal_pretty(price_nis)} ₪",
         f" - סכום כניסה (NIS_ENTRY_AMOUNT): ~{format_decimal_pretty(entry_nis)} ₪",
         f" - SLH מחושב לכל כניסה: ~{format_decimal_pretty(compute_slh_for_entry(price_nis, entry_nis))} SLH",
-        f" - סך SLH שחולקו ללקוחות: ~{format_decimal_pretty(Decimal(str(cfg.get('total_slh_minted', 0.0))))} SLH",
+        f" - סך SLH שחולקו ללקוחות: ~{format_decimal_pretty(total_minted)} SLH",
+        "",
+        "👥 *קהילה והפניות:*",
+        f" - סה״כ משתמשים: {community['total_users']}",
+        f" - הצטרפו היום / 7 ימים: {community['joined_today']} / {community['joined_this_week']}",
+        f" - מפנים פעילים: {community['active_referrers']}",
+        f" - הפניות כוללות: {community['total_referrals']}",
         "",
         "📋 *פקודות ניהול זמינות (לשימושך ולמסמך ללקוחות):*",
         " - /pending  – רשימת תשלומים ממתינים",
@@ -1161,6 +1999,12 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         " - /set_price <מחיר_ש\"ח_ל-SLH_1>",
         "     מעדכן את שער SLH בש\"ח. מכאן ואילך חישוב הכמות ללקוח משתנה בהתאם.",
         "",
+        " - /price_history",
+        "     שינויי השער האחרונים + השער שהיה בתוקף לפני 24 שעות / 7 ימים / 30 ימים.",
+        "",
+        " - /reload_messages",
+        "     טוען מחדש את bot_messages_slhnet.txt בלי להפעיל מחדש את השרת.",
+        "",
         " - /admin_wallet",
         "     מציג תמונת מצב מערכתית: שער נוכחי, סכום כניסה, סך SLH שחולקו, כתובות ארנק חם / קר.",
         "",
@@ -1169,9 +2013,12 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         "",
         " - /admin_credit <user_id> <amount_slh>",
         "     מאפשר לתת זיכוי SLH פנימי ידני למשתמש (לדוגמה: בונוס, תיקון טכני, מתנה).",
+        "",
+        " - /broadcast <טקסט>",
+        "     שולח הודעה לכל המשתמשים בקצב המותר; /broadcast_status ו-/broadcast_cancel למעקב ועצירה.",
     ]
 
-    await chat.send_message("\n".join(text_lines), parse_mode="Markdown")
+    await send_to_chat(chat, "\n".join(text_lines), parse_mode="Markdown")
 
 
 async def pending_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1181,12 +2028,12 @@ async def pending_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     if not is_admin(user.id):
-        await chat.send_message("❌ הפקודה /pending מיועדת למנהלי המערכת בלבד.")
+        await send_to_chat(chat, "❌ הפקודה /pending מיועדת למנהלי המערכת בלבד.")
         return
 
-    pending = get_pending_payments(limit=30)
+    pending = await run_storage(get_pending_payments, limit=30)
     if not pending:
-        await chat.send_message("✅ אין תשלומים ממתינים כרגע.")
+        await send_to_chat(chat, "✅ אין תשלומים ממתינים כרגע.")
         return
 
     lines = ["💳 *תשלומים ממתינים:*", ""]
@@ -1195,7 +2042,7 @@ async def pending_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             f"• user_id={p['user_id']} | username=@{p['username'] or 'לא ידוע'} | שיטה={p['pay_method']} | id={p['id']}"
         )
 
-    await chat.send_message("\n".join(lines), parse_mode="Markdown")
+    await send_to_chat(chat, "\n".join(lines), parse_mode="Markdown")
 
 
 async def auto_mint_slh_for_entry(user_id: int) -> Optional[Decimal]:
@@ -1204,7 +2051,7 @@ async def auto_mint_slh_for_entry(user_id: int) -> Optional[Decimal]:
     משתמש במחיר SLH נוכחי ובסכום כניסה NIS_ENTRY_AMOUNT.
     """
     try:
-        price_nis, entry_nis = get_current_price_and_entry()
+        price_nis, entry_nis = await run_storage(get_current_price_and_entry)
         amount_slh = compute_slh_for_entry(price_nis, entry_nis)
         if amount_slh <= 0:
             logger.warning("auto_mint_slh_for_entry: computed amount <= 0, skipping")
@@ -1216,13 +2063,7 @@ async def auto_mint_slh_for_entry(user_id: int) -> Optional[Decimal]:
         )
 
         # מינט בפועל דרך מודול הארנקים
-        try:
-            mint_slh_from_payment(user_id, amount_slh, reason)
-        except TypeError:
-            # אם הפונקציה מוגדרת בגירסה ישנה עם פחות פרמטרים – נתמוך גם בה
-            mint_slh_from_payment(user_id, amount_slh)
-
-        record_mint_amount(amount_slh)
+        await run_storage(mint_and_record, user_id, amount_slh, reason)
 
         await send_log_message(
             "💎 מינט SLH אוטומטי בעקבות תשלום מאושר:\n"
@@ -1237,64 +2078,48 @@ async def auto_mint_slh_for_entry(user_id: int) -> Optional[Decimal]:
         return None
 
 
-async def approve_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """
-    אישור תשלום ידני לפי user_id – למנהלים בלבד.
-    שולח למשתמש גם קישור לקבוצה וגם קישור אישי להפניות + מינט SLH.
-    """
-    user = update.effective_user
-    chat = update.effective_chat
-    if not user or not chat:
-        return
-
-    if not is_admin(user.id):
-        await chat.send_message("❌ הפקודה /approve מיועדת למנהלי המערכת בלבד.")
-        return
+# user_id-ים שהאישור שלהם באמצע – לחיצה כפולה על הכפתור לא ממנטת פעמיים
+_approvals_in_flight: Set[int] = set()
 
-    if not context.args:
-        await chat.send_message("שימוש: /approve <user_id>")
-        return
 
+async def approve_payment(bot: Any, target_id: int, note: str) -> str:
+    """
+    אישור תשלום – משותף ל-/approve ולכפתור האישור בקבוצת הניהול:
+    סטטוס approved + ארנק פנימי, מינט SLH לפי השער הנוכחי והודעה ללקוח
+    (קישור לקבוצה + קישור אישי). מחזיר את הודעת הסיכום למנהל.
+    תשלום שכבר אושר (או שאישורו באמצע) לא מאושר שוב.
+    חריגה בעדכון הסטטוס עוברת לקורא.
+    """
+    if target_id in _approvals_in_flight or await run_storage(has_approved_payment, target_id):
+        return f"ℹ️ התשלום של המשתמש {target_id} כבר אושר – לא בוצע מינט נוסף."
+    _approvals_in_flight.add(target_id)
     try:
-        target_id = int(context.args[0])
-    except ValueError:
-        await chat.send_message("user_id לא תקין.")
-        return
+        return await _approve_payment(bot, target_id, note)
+    finally:
+        _approvals_in_flight.discard(target_id)
 
-    try:
-        update_payment_status(target_id, "approved", "approved via /approve")
-        ensure_internal_wallet(target_id, None)
-    except Exception as e:
-        logger.error(f"Error updating payment status for {target_id}: {e}")
-        await chat.send_message("❌ שגיאה בעדכון סטטוס התשלום.")
-        return
+
+async def _approve_payment(bot: Any, target_id: int, note: str) -> str:
+    await run_storage(update_payment_status, target_id, "approved", note)
+    await run_storage(ensure_internal_wallet, target_id, None)
 
     # מינט SLH לפי שער נוכחי
     minted = await auto_mint_slh_for_entry(target_id)
     minted_str = format_decimal_pretty(minted) if minted else None
 
-    group_url = safe_get_url(
-        Config.BUSINESS_GROUP_URL or Config.GROUP_STATIC_INVITE, Config.LANDING_URL
-    )
     referral_link = f"https://t.me/{Config.BOT_USERNAME}?start={target_id}"
 
     try:
         extra_slh = (
-            f"\n\nכחלק מההצטרפות קיבלת *{minted_str}* SLH פנימי לארנק שלך."
+            message_templates.render("MINTED_LINE", minted=minted_str)
             if minted_str
             else ""
         )
-        await context.bot.send_message(
-            chat_id=target_id,
-            text=(
-                "✅ התשלום שלך אושר!\n\n"
-                "הנה הקישור להצטרפות לקהילת העסקים שלנו:\n"
-                f"{group_url}\n\n"
-                "בנוסף, זה הקישור האישי שלך להזמנת חברים:\n"
-                f"{referral_link}\n"
-                f"{extra_slh}\n\n"
-                "תוכל תמיד לקבל את הקישור האישי שוב בפקודה /my_link.\n"
-                "ברוך הבא 🙌"
+        await send_bot_message(
+            bot,
+            target_id,
+            text=message_templates.render(
+                "APPROVE_USER", referral_link=referral_link, minted_line=extra_slh
             ),
             parse_mode="Markdown",
         )
@@ -1306,8 +2131,64 @@ async def approve_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     )
     if minted_str:
         admin_msg += f"\nנמינטו לו {minted_str} SLH פנימיים."
+    return admin_msg
+
+
+async def reject_payment(bot: Any, target_id: int, reason: Optional[str], note: str) -> str:
+    """
+    דחיית תשלום – משותף ל-/reject ולכפתור הדחייה: סטטוס rejected והודעה
+    ללקוח (עם הסיבה, אם נמסרה). מחזיר את הודעת הסיכום למנהל.
+    """
+    await run_storage(update_payment_status, target_id, "rejected", note)
+
+    try:
+        await send_bot_message(
+            bot,
+            target_id,
+            text=(
+                "❌ התשלום שלך נדחה.\n"
+                + (f"סיבה: {reason}\n\n" if reason else "")
+                + "אם לדעתך מדובר בטעות, ניתן לפנות לתמיכה."
+            ),
+        )
+    except Exception as e:
+        logger.error(f"Error sending rejection message to user {target_id}: {e}")
+
+    return f"🚫 התשלום של המשתמש {target_id} נדחה ונשלחה לו הודעה."
+
+
+async def approve_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    אישור תשלום ידני לפי user_id – למנהלים בלבד.
+    שולח למשתמש גם קישור לקבוצה וגם קישור אישי להפניות + מינט SLH.
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    if not user or not chat:
+        return
+
+    if not is_admin(user.id):
+        await send_to_chat(chat, "❌ הפקודה /approve מיועדת למנהלי המערכת בלבד.")
+        return
 
-    await chat.send_message(admin_msg)
+    if not context.args:
+        await send_to_chat(chat, "שימוש: /approve <user_id>")
+        return
+
+    try:
+        target_id = int(context.args[0])
+    except ValueError:
+        await send_to_chat(chat, "user_id לא תקין.")
+        return
+
+    try:
+        admin_msg = await approve_payment(context.bot, target_id, "approved via /approve")
+    except Exception as e:
+        logger.error(f"Error updating payment status for {target_id}: {e}")
+        await send_to_chat(chat, "❌ שגיאה בעדכון סטטוס התשלום.")
+        return
+
+    await send_to_chat(chat, admin_msg)
 
 
 async def reject_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1320,41 +2201,29 @@ async def reject_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     if not is_admin(user.id):
-        await chat.send_message("❌ הפקודה /reject מיועדת למנהלי המערכת בלבד.")
+        await send_to_chat(chat, "❌ הפקודה /reject מיועדת למנהלי המערכת בלבד.")
         return
 
     if len(context.args) < 1:
-        await chat.send_message("שימוש: /reject <user_id> <סיבה>")
+        await send_to_chat(chat, "שימוש: /reject <user_id> <סיבה>")
         return
 
     try:
         target_id = int(context.args[0])
     except ValueError:
-        await chat.send_message("user_id לא תקין.")
+        await send_to_chat(chat, "user_id לא תקין.")
         return
 
     reason = " ".join(context.args[1:]) if len(context.args) > 1 else "ללא סיבה מפורטת"
 
     try:
-        update_payment_status(target_id, "rejected", reason)
+        admin_msg = await reject_payment(context.bot, target_id, reason, reason)
     except Exception as e:
         logger.error(f"Error updating payment status for {target_id}: {e}")
-        await chat.send_message("❌ שגיאה בעדכון סטטוס התשלום.")
+        await send_to_chat(chat, "❌ שגיאה בעדכון סטטוס התשלום.")
         return
 
-    try:
-        await context.bot.send_message(
-            chat_id=target_id,
-            text=(
-                "❌ התשלום שלך נדחה.\n"
-                f"סיבה: {reason}\n\n"
-                "אם לדעתך מדובר בטעות, ניתן לפנות לתמיכה."
-            ),
-        )
-    except Exception as e:
-        logger.error(f"Error sending rejection message to user {target_id}: {e}")
-
-    await chat.send_message(f"🚫 התשלום של המשתמש {target_id} נדחה ונשלחה לו הודעה.")
+    await send_to_chat(chat, admin_msg)
 
 
 async def set_price_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1368,12 +2237,13 @@ async def set_price_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     if not is_admin(user.id):
-        await chat.send_message("❌ הפקודה /set_price מיועדת למנהלי המערכת בלבד.")
+        await send_to_chat(chat, "❌ הפקודה /set_price מיועדת למנהלי המערכת בלבד.")
         return
 
     if not context.args:
-        price_nis, entry_nis = get_current_price_and_entry()
-        await chat.send_message(
+        price_nis, entry_nis = await run_storage(get_current_price_and_entry)
+        await send_to_chat(
+            chat,
             "ℹ️ שער SLH נוכחי:\n"
             f"• מחיר ל-SLH 1: {format_decimal_pretty(price_nis)} ₪\n"
             f"• סכום כניסה: {format_decimal_pretty(entry_nis)} ₪\n"
@@ -1390,13 +2260,13 @@ async def set_price_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if new_price <= 0:
             raise InvalidOperation
     except InvalidOperation:
-        await chat.send_message("מחיר לא תקין. השתמש במספר גדול מאפס, לדוגמה: 444")
+        await send_to_chat(chat, "מחיר לא תקין. השתמש במספר גדול מאפס, לדוגמה: 444")
         return
 
-    cfg = load_dynamic_config()
-    old_price = Decimal(str(cfg.get("slh_nis_price", float(DEFAULT_SLH_PRICE))))
-    cfg["slh_nis_price"] = float(new_price)
-    save_dynamic_config(cfg)
+    old_price, _ = await run_storage(get_current_price_and_entry)
+    # שומרים רק את המחיר – כדי לא לדרוס את סך המינטים שנצבר במקביל
+    await run_storage(save_dynamic_config, {"slh_nis_price": float(new_price)})
+    await run_storage(record_price_change, old_price, new_price, user.id)
 
     await send_log_message(
         "⚙️ עדכון שער SLH:\n"
@@ -1405,8 +2275,9 @@ async def set_price_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"חדש: {format_decimal_pretty(new_price)} ₪"
     )
 
-    price_nis, entry_nis = get_current_price_and_entry()
-    await chat.send_message(
+    price_nis, entry_nis = await run_storage(get_current_price_and_entry)
+    await send_to_chat(
+        chat,
         "✅ שער SLH עודכן בהצלחה.\n\n"
         f"מחיר חדש ל-SLH 1: *{format_decimal_pretty(price_nis)} ₪*\n"
         f"סכום כניסה: *{format_decimal_pretty(entry_nis)} ₪*\n"
@@ -1415,6 +2286,84 @@ async def set_price_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     )
 
 
+async def price_history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /price_history
+    שינויי שער SLH האחרונים, והשער שהיה בתוקף לפני יום / שבוע / חודש.
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    if not user or not chat:
+        return
+
+    if not is_admin(user.id):
+        await send_to_chat(chat, "❌ הפקודה /price_history מיועדת למנהלי המערכת בלבד.")
+        return
+
+    def _collect():
+        now = time.time()
+        lookback = [
+            (label, price_history.price_at(now - seconds))
+            for label, seconds in (
+                ("לפני 24 שעות", 86400),
+                ("לפני 7 ימים", 7 * 86400),
+                ("לפני 30 ימים", 30 * 86400),
+            )
+        ]
+        current_price, _ = get_current_price_and_entry()
+        return price_history.latest(10), lookback, current_price
+
+    recent, lookback, current_price = await run_storage(_collect)
+
+    lines = [
+        "📈 היסטוריית שער SLH",
+        "",
+        f"שער נוכחי: {format_decimal_pretty(current_price)} ₪",
+    ]
+    for label, price in lookback:
+        shown = f"{format_decimal_pretty(price)} ₪" if price is not None else "—"
+        lines.append(f"{label}: {shown}")
+
+    lines.append("")
+    if not recent:
+        lines.append("עדיין לא נרשמו שינויי שער.")
+    else:
+        lines.append("שינויים אחרונים:")
+        for entry in recent:
+            if entry["ts"] <= 0:
+                when = "שער התחלתי"
+            else:
+                when = datetime.utcfromtimestamp(entry["ts"]).strftime("%Y-%m-%d %H:%M UTC")
+            by = f" (admin_id={entry['by']})" if entry["by"] is not None else ""
+            lines.append(f"• {when}: {format_decimal_pretty(entry['price'])} ₪{by}")
+
+    await send_to_chat(chat, "\n".join(lines))
+
+
+async def reload_messages_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /reload_messages
+    טעינה מחדש של קובץ ההודעות (בנוסף לבדיקת ה-mtime האוטומטית).
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    if not user or not chat:
+        return
+
+    if not is_admin(user.id):
+        await send_to_chat(chat, "❌ הפקודה /reload_messages מיועדת למנהלי המערכת בלבד.")
+        return
+
+    count = await run_storage(MessageCatalog.reload)
+    if not MessageCatalog.file_exists():
+        await send_to_chat(chat, f"⚠️ קובץ ההודעות לא נמצא: {MESSAGES_FILE.name}")
+        return
+    await send_to_chat(
+        chat,
+        f"✅ קובץ ההודעות נטען מחדש: {count} בלוקים (גרסה {MessageCatalog.version})."
+    )
+
+
 async def admin_wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     סקירת מצב מערכת: שערים, כמות SLH שחולקה, וארנק חם/קר.
@@ -1425,12 +2374,11 @@ async def admin_wallet_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     if not is_admin(user.id):
-        await chat.send_message("❌ הפקודה /admin_wallet מיועדת למנהלי המערכת בלבד.")
+        await send_to_chat(chat, "❌ הפקודה /admin_wallet מיועדת למנהלי המערכת בלבד.")
         return
 
-    price_nis, entry_nis = get_current_price_and_entry()
-    cfg = load_dynamic_config()
-    total_minted = Decimal(str(cfg.get("total_slh_minted", 0.0)))
+    price_nis, entry_nis = await run_storage(get_current_price_and_entry)
+    total_minted = await run_storage(get_total_slh_minted)
 
     hot = Config.HOT_WALLET_ADDRESS or "לא הוגדר (HOT_WALLET_ADDRESS)"
     cold = Config.COLD_WALLET_ADDRESS or "לא הוגדר (COLD_WALLET_ADDRESS)"
@@ -1455,7 +2403,7 @@ async def admin_wallet_command(update: Update, context: ContextTypes.DEFAULT_TYP
         "HOT_WALLET_ADDRESS, COLD_WALLET_ADDRESS",
     ]
 
-    await chat.send_message("\n".join(lines), parse_mode="Markdown")
+    await send_to_chat(chat, "\n".join(lines), parse_mode="Markdown")
 
 
 async def admin_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1469,26 +2417,24 @@ async def admin_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     if not is_admin(user.id):
-        await chat.send_message("❌ הפקודה /admin_user מיועדת למנהלי המערכת בלבד.")
+        await send_to_chat(chat, "❌ הפקודה /admin_user מיועדת למנהלי המערכת בלבד.")
         return
 
     if not context.args:
-        await chat.send_message("שימוש: /admin_user <user_id>")
+        await send_to_chat(chat, "שימוש: /admin_user <user_id>")
         return
 
     try:
         target_id = int(context.args[0])
     except ValueError:
-        await chat.send_message("user_id לא תקין.")
+        await send_to_chat(chat, "user_id לא תקין.")
         return
 
     try:
-        ensure_internal_wallet(target_id, None)
-        overview = get_wallet_overview(target_id) or {}
-        stakes = get_user_stakes(target_id) or []
+        overview, stakes = await run_storage(load_wallet_snapshot, target_id, None)
     except Exception as e:
         logger.error(f"admin_user error for {target_id}: {e}")
-        await chat.send_message("❌ לא ניתן לטעון את נתוני המשתמש.")
+        await send_to_chat(chat, "❌ לא ניתן לטעון את נתוני המשתמש.")
         return
 
     # ארנק פנימי
@@ -1507,17 +2453,16 @@ async def admin_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             continue
 
     # הפניות
-    refs = load_referrals()
-    udata = refs.get("users", {}).get(str(target_id), {})
+    udata = await run_storage(referral_store.get_user, target_id)
     my_ref_count = udata.get("referral_count", 0)
     joined_at = udata.get("joined_at", "לא ידוע")
     referrer = udata.get("referrer", "N/A")
 
-    price_nis, _ = get_current_price_and_entry()
+    price_nis, _ = await run_storage(get_current_price_and_entry)
     wallet_value_nis = balance * price_nis if price_nis > 0 else Decimal("0")
 
     # ארנק חיצוני אישי
-    onchain = get_onchain_wallet(target_id)
+    onchain = await run_storage(get_onchain_wallet, target_id)
     bsc_addr = onchain.get("bsc") or "לא מוגדר"
     ton_addr = onchain.get("ton") or "לא מוגדר"
     updated_at = onchain.get("updated_at") or "N/A"
@@ -1546,7 +2491,7 @@ async def admin_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         f"🕒 עודכן לאחרונה: {updated_at}",
     ]
 
-    await chat.send_message("\n".join(lines), parse_mode="Markdown")
+    await send_to_chat(chat, "\n".join(lines), parse_mode="Markdown")
 
 
 async def admin_credit_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1560,17 +2505,17 @@ async def admin_credit_command(update: Update, context: ContextTypes.DEFAULT_TYP
         return
 
     if not is_admin(user.id):
-        await chat.send_message("❌ הפקודה /admin_credit מיועדת למנהלי המערכת בלבד.")
+        await send_to_chat(chat, "❌ הפקודה /admin_credit מיועדת למנהלי המערכת בלבד.")
         return
 
     if len(context.args) < 2:
-        await chat.send_message("שימוש: /admin_credit <user_id> <amount_slh>")
+        await send_to_chat(chat, "שימוש: /admin_credit <user_id> <amount_slh>")
         return
 
     try:
         target_id = int(context.args[0])
     except ValueError:
-        await chat.send_message("user_id לא תקין.")
+        await send_to_chat(chat, "user_id לא תקין.")
         return
 
     try:
@@ -1578,30 +2523,27 @@ async def admin_credit_command(update: Update, context: ContextTypes.DEFAULT_TYP
         if amount <= 0:
             raise InvalidOperation
     except InvalidOperation:
-        await chat.send_message("סכום SLH לא תקין. השתמש במספר גדול מאפס.")
+        await send_to_chat(chat, "סכום SLH לא תקין. השתמש במספר גדול מאפס.")
         return
 
     try:
-        ensure_internal_wallet(target_id, None)
+        await run_storage(ensure_internal_wallet, target_id, None)
         reason = f"Manual admin credit by {user.id}"
-        try:
-            mint_slh_from_payment(target_id, amount, reason)
-        except TypeError:
-            mint_slh_from_payment(target_id, amount)
+        await run_storage(mint_and_record, target_id, amount, reason)
 
-        record_mint_amount(amount)
-
-        await context.bot.send_message(
-            chat_id=target_id,
+        await send_bot_message(
+            context.bot,
+            target_id,
             text=(
                 "💎 קיבלת זיכוי SLH מהמנהל.\n"
                 f"סכום: *{format_decimal_pretty(amount)}* SLH\n"
-                "הזיכוי הועבר לארנק הפנימי שלך בבוט.",
+                "הזיכוי הועבר לארנק הפנימי שלך בבוט."
             ),
             parse_mode="Markdown",
         )
 
-        await chat.send_message(
+        await send_to_chat(
+            chat,
             f"✅ זוכו למשתמש {target_id} *{format_decimal_pretty(amount)}* SLH פנימיים.",
             parse_mode="Markdown",
         )
@@ -1614,7 +2556,7 @@ async def admin_credit_command(update: Update, context: ContextTypes.DEFAULT_TYP
         )
     except Exception as e:
         logger.error(f"admin_credit error for {target_id}: {e}")
-        await chat.send_message("❌ שגיאה בעת יצירת הקרדיט.")
+        await send_to_chat(chat, "❌ שגיאה בעת יצירת הקרדיט.")
 
 
 # ===== Wallet & staking =====
@@ -1630,12 +2572,13 @@ async def wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     # === ארנק פנימי + סטייקינג ===
     try:
-        ensure_internal_wallet(user.id, user.username or None)
-        overview = get_wallet_overview(user.id) or {}
-        stakes = get_user_stakes(user.id) or []
+        overview, stakes = await run_storage(
+            load_wallet_snapshot, user.id, user.username or None
+        )
     except Exception as e:
         logger.error(f"wallet_command error: {e}")
-        await chat.send_message(
+        await send_to_chat(
+            chat,
             "❌ לא ניתן לטעון את ארנק ה-SLH כרגע. נסה שוב מאוחר יותר."
         )
         return
@@ -1657,7 +2600,7 @@ async def wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     balance_str = format_decimal_pretty(balance)
     total_staked_str = format_decimal_pretty(total_staked)
 
-    price_nis, _ = get_current_price_and_entry()
+    price_nis, _ = await run_storage(get_current_price_and_entry)
     value_nis = balance * price_nis if price_nis > 0 else Decimal("0")
 
     # === ארנקי מערכת (חם/קר) ===
@@ -1665,7 +2608,7 @@ async def wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     cold = Config.COLD_WALLET_ADDRESS or "טרם הוגדר (COLD_WALLET_ADDRESS)"
 
     # === ארנק חיצוני אישי (On-chain) – בדיקות בלבד ===
-    onchain = get_onchain_wallet(user.id)
+    onchain = await run_storage(get_onchain_wallet, user.id)
     bsc_addr = onchain.get("bsc") or "לא מוגדר"
     ton_addr = onchain.get("ton") or "לא מוגדר"
 
@@ -1692,7 +2635,7 @@ async def wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         "_נכון לעכשיו החיבור החיצוני משמש להצגה ובדיקות בלבד (אין שליחה אמיתית מהבוט)._"
     )
 
-    await chat.send_message(text=msg, parse_mode="Markdown")
+    await send_to_chat(chat, text=msg, parse_mode="Markdown")
 
 
 async def send_slh_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1706,28 +2649,28 @@ async def send_slh_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
 
     if len(context.args) < 2:
-        await chat.send_message("שימוש: /send_slh <amount> <user_id>")
+        await send_to_chat(chat, "שימוש: /send_slh <amount> <user_id>")
         return
 
     amount_str, target = context.args[0], context.args[1]
     try:
         amount = Decimal(amount_str.replace(",", "."))
     except InvalidOperation:
-        await chat.send_message("סכום לא תקין. נסה שוב עם מספר תקין.")
+        await send_to_chat(chat, "סכום לא תקין. נסה שוב עם מספר תקין.")
         return
 
     try:
         to_user_id = int(target)
     except ValueError:
-        await chat.send_message("user_id חייב להיות מספרי.")
+        await send_to_chat(chat, "user_id חייב להיות מספרי.")
         return
 
-    ok, msg = transfer_between_users(user.id, to_user_id, amount)
+    ok, msg = await run_storage(transfer_between_users, user.id, to_user_id, amount)
     if not ok:
-        await chat.send_message(f"❌ העברה נכשלה: {msg}")
+        await send_to_chat(chat, f"❌ העברה נכשלה: {msg}")
         return
 
-    await chat.send_message(f"✅ הועברו {amount} SLH פנימיים למשתמש {to_user_id}.")
+    await send_to_chat(chat, f"✅ הועברו {amount} SLH פנימיים למשתמש {to_user_id}.")
 
 
 async def stake_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1740,7 +2683,8 @@ async def stake_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         return
 
     if not context.args:
-        await chat.send_message(
+        await send_to_chat(
+            chat,
             "שימוש: /stake <amount> [days]. ברירת מחדל ימים: "
             f"{Config.STAKING_DEFAULT_DAYS}, APY: {Config.STAKING_DEFAULT_APY}%."
         )
@@ -1752,20 +2696,23 @@ async def stake_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         try:
             days = int(context.args[1])
         except ValueError:
-            await chat.send_message("ערך ימים לא תקין, משתמש בברירת מחדל.")
+            await send_to_chat(chat, "ערך ימים לא תקין, משתמש בברירת מחדל.")
 
     try:
         amount = Decimal(amount_str.replace(",", "."))
     except InvalidOperation:
-        await chat.send_message("סכום לא תקין. נסה שוב עם מספר תקין.")
+        await send_to_chat(chat, "סכום לא תקין. נסה שוב עם מספר תקין.")
         return
 
-    ok, msg = create_stake_position(user.id, amount, Config.STAKING_DEFAULT_APY, days)
+    ok, msg = await run_storage(
+        create_stake_position, user.id, amount, Config.STAKING_DEFAULT_APY, days
+    )
     if not ok:
-        await chat.send_message(f"❌ סטייקינג נכשל: {msg}")
+        await send_to_chat(chat, f"❌ סטייקינג נכשל: {msg}")
         return
 
-    await chat.send_message(
+    await send_to_chat(
+        chat,
         f"✅ פתחת סטייקינג על {amount} SLH ל-{days} ימים.\n"
         f"APY נוכחי: {Config.STAKING_DEFAULT_APY}%."
     )
@@ -1780,9 +2727,9 @@ async def mystakes_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     if not user or not chat:
         return
 
-    stakes = get_user_stakes(user.id)
+    stakes = await run_storage(get_user_stakes, user.id)
     if not stakes:
-        await chat.send_message("אין לך עדיין עמדות סטייקינג.")
+        await send_to_chat(chat, "אין לך עדיין עמדות סטייקינג.")
         return
 
     lines = ["📊 *עמדות הסטייקינג שלך:*\n"]
@@ -1796,7 +2743,7 @@ async def mystakes_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             f"• {amount} SLH | {apy}% | {lock_days} ימים | סטטוס: {status} | התחלה: {started}"
         )
 
-    await chat.send_message("\n".join(lines), parse_mode="Markdown")
+    await send_to_chat(chat, "\n".join(lines), parse_mode="Markdown")
 
 
 # ===== Referrals & personal area =====
@@ -1810,7 +2757,7 @@ async def my_link_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         return
 
     # ensure user exists in referrals db
-    register_referral(user.id, None)
+    await run_storage(register_referral, user.id, None)
 
     link = f"https://t.me/{Config.BOT_USERNAME}?start={user.id}"
     text = (
@@ -1818,7 +2765,7 @@ async def my_link_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         f"{link}\n\n"
         "כל מי שנכנס דרך הקישור הזה ונרשם – נרשם על שמך במערכת ההפניות."
     )
-    await chat.send_message(text=text, parse_mode="Markdown")
+    await send_to_chat(chat, text=text, parse_mode="Markdown")
 
 
 async def my_referrals_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1830,26 +2777,40 @@ async def my_referrals_command(update: Update, context: ContextTypes.DEFAULT_TYP
     if not user or not chat:
         return
 
-    refs = load_referrals()
-    udata = refs.get("users", {}).get(str(user.id), {})
-    count = udata.get("referral_count", 0)
-    referred_ids = get_user_referrals(user.id)
-
-    lines = [
+    # /my_referrals <user_id_אחרון> – דפדוף לעמוד הבא
+    after: Optional[int] = None
+    if context.args:
+        try:
+            after = int(context.args[0])
+        except ValueError:
+            after = None
+
+    udata = await run_storage(referral_store.get_user, user.id)
+    count = udata.get("referral_count", 0)
+    page_size = 10
+    referred_ids = await run_storage(
+        get_user_referrals, user.id, limit=page_size + 1, after=after
+    )
+    has_more = len(referred_ids) > page_size
+    referred_ids = referred_ids[:page_size]
+
+    lines = [
         "👥 *הפניות על שמך:*",
         f"🔢 סה\"כ הפניות: {count}",
         "",
-        "רשימה (עד 10 ראשונים, לפי ID):",
+        f"רשימה (עד {page_size} בכל עמוד, לפי סדר הצטרפות):",
     ]
 
     if not referred_ids:
         lines.append("אין עדיין רשומות.\n\nהמשך להזמין אנשים דרך הקישור האישי שלך!")
     else:
-        for rid in referred_ids[:10]:
+        for rid in referred_ids:
             lines.append(f"• user_id = {rid}")
+        if has_more:
+            lines.append(f"\nלעמוד הבא: /my\\_referrals {referred_ids[-1]}")
         lines.append("\nהמשך להזמין אנשים דרך הקישור האישי שלך!")
 
-    await chat.send_message("\n".join(lines), parse_mode="Markdown")
+    await send_to_chat(chat, "\n".join(lines), parse_mode="Markdown")
 
 
 async def portfolio_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1862,12 +2823,12 @@ async def portfolio_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     try:
-        ensure_internal_wallet(user.id, user.username or None)
-        overview = get_wallet_overview(user.id) or {}
-        stakes = get_user_stakes(user.id) or []
+        overview, stakes = await run_storage(
+            load_wallet_snapshot, user.id, user.username or None
+        )
     except Exception as e:
         logger.error(f"portfolio_command error: {e}")
-        await chat.send_message("❌ לא ניתן לטעון את הנתונים כרגע.")
+        await send_to_chat(chat, "❌ לא ניתן לטעון את הנתונים כרגע.")
         return
 
     try:
@@ -1890,11 +2851,10 @@ async def portfolio_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     total_staked_str = format_decimal_pretty(total_staked)
     total_expected_str = format_decimal_pretty(total_expected)
 
-    refs = load_referrals()
-    udata = refs.get("users", {}).get(str(user.id), {})
+    udata = await run_storage(referral_store.get_user, user.id)
     my_ref_count = udata.get("referral_count", 0)
 
-    price_nis, _ = get_current_price_and_entry()
+    price_nis, _ = await run_storage(get_current_price_and_entry)
     value_nis = balance * price_nis if price_nis > 0 else Decimal("0")
 
     text = (
@@ -1916,7 +2876,7 @@ async def portfolio_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         "• /onchain_wallet – פירוט ארנק חיצוני (בדיקות בלבד)\n"
     )
 
-    await chat.send_message(text=text, parse_mode="Markdown")
+    await send_to_chat(chat, text=text, parse_mode="Markdown")
 
 
 async def set_wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1931,7 +2891,8 @@ async def set_wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     if not context.args:
-        await chat.send_message(
+        await send_to_chat(
+            chat,
             "שימוש: /set_wallet <כתובת_BSC|-> [כתובת_TON|-]\n\n"
             "דוגמאות:\n"
             "• /set_wallet 0x1234... UQxxxxx...\n"
@@ -1944,7 +2905,8 @@ async def set_wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     bsc_arg = context.args[0]
     ton_arg = context.args[1] if len(context.args) > 1 else None
 
-    rec = set_onchain_wallet(
+    rec = await run_storage(
+        set_onchain_wallet,
         user_id=user.id,
         bsc_address=bsc_arg,
         ton_address=ton_arg,
@@ -1953,7 +2915,8 @@ async def set_wallet_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     bsc = rec.get("bsc") or "לא מוגדר"
     ton = rec.get("ton") or "לא מוגדר"
 
-    await chat.send_message(
+    await send_to_chat(
+        chat,
         "🌐 ארנק חיצוני עודכן (בדיקות בלבד):\n\n"
         f"• BSC / BNB Chain: `{bsc}`\n"
         f"• TON: `{ton}`\n\n"
@@ -1978,12 +2941,13 @@ async def onchain_wallet_command(update: Update, context: ContextTypes.DEFAULT_T
     if not user or not chat:
         return
 
-    rec = get_onchain_wallet(user.id)
+    rec = await run_storage(get_onchain_wallet, user.id)
     bsc = rec.get("bsc") or "לא מוגדר"
     ton = rec.get("ton") or "לא מוגדר"
     updated_at = rec.get("updated_at") or "N/A"
 
-    await chat.send_message(
+    await send_to_chat(
+        chat,
         "🌐 *ארנק חיצוני (בדיקות בלבד)*\n\n"
         f"• BSC / BNB Chain: `{bsc}`\n"
         f"• TON: `{ton}`\n"
@@ -1995,88 +2959,154 @@ async def onchain_wallet_command(update: Update, context: ContextTypes.DEFAULT_T
     )
 
 
-# ===== Callback queries =====
-async def handle_investor_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    if not query:
-        return
-    investor_text = load_message_block(
-        "INVESTOR_INFO",
-        (
-            "📈 **מידע למשקיעים**\n\n"
-            "מערכת SLHNET מחברת בין טלגרם, חוזים חכמים על Binance Smart Chain, "
-            "קבלות דיגיטליות ו-NFT, כך שכל עסקה מתועדת וניתנת למעקב.\n\n"
-            "ניתן להצטרף כשותף, להחזיק טוקן SLH ולקבל חלק מהתנועה במערכת."
-        ),
+# ===== Broadcast =====
+async def _broadcast_send(user_id: int, text: str, parse_mode: Optional[str]) -> None:
+    bot = TelegramAppManager.get_app().bot
+    await send_bot_message(
+        bot, user_id, priority=PRIORITY_BULK, text=text, parse_mode=parse_mode
     )
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "🔙 חזרה לתפריט הראשי", callback_data="back_to_main"
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    "🐞 דיווח באג במסך זה",
-                    callback_data="report_bug:investor_screen",
-                )
-            ],
-        ]
-    )
-    await query.edit_message_text(
-        text=investor_text, reply_markup=keyboard, parse_mode="Markdown"
+
+
+def _broadcast_classify(exc: Exception) -> str:
+    # Forbidden: bot was blocked by the user / user is deactivated
+    return RESULT_BLOCKED if isinstance(exc, Forbidden) else RESULT_FAILED
+
+
+def format_broadcast_status(rec: Dict[str, Any]) -> str:
+    status_names = {
+        "running": "🔄 בשליחה",
+        "done": "✅ הסתיים",
+        "cancelled": "⛔ בוטל",
+        "failed": "❌ נכשל",
+    }
+    done = rec["sent"] + rec["failed"] + rec["blocked"] + rec["skipped_blocked"]
+    total = rec.get("total")
+    progress = f"{done}/{total}" if total is not None else str(done)
+    return (
+        f"📣 שידור {rec['id']}\n"
+        f"מצב: {status_names.get(rec.get('status'), rec.get('status'))}\n"
+        f"התקדמות: {progress}\n"
+        f"נשלחו: {rec['sent']} | נכשלו: {rec['failed']} | "
+        f"חסמו: {rec['blocked']} | דולגו (חסומים): {rec['skipped_blocked']}"
+        + (f"\nשגיאה: {rec['error']}" if rec.get("error") else "")
     )
 
 
-def build_payment_instructions_text(method: str) -> str:
+async def _broadcast_progress(rec: Dict[str, Any]) -> None:
+    notify = rec.get("notify") or {}
+    if not notify.get("chat_id") or not notify.get("message_id"):
+        return
+    bot = TelegramAppManager.get_app().bot
+    try:
+        await outbound.send(
+            notify["chat_id"],
+            lambda: bot.edit_message_text(
+                chat_id=notify["chat_id"],
+                message_id=notify["message_id"],
+                text=format_broadcast_status(rec),
+            ),
+            PRIORITY_ADMIN,
+        )
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+
+
+broadcast_engine = BroadcastEngine(
+    broadcasts_table,
+    recipients=lambda after, limit: referral_store.user_ids(after=after, limit=limit),
+    count_recipients=lambda after: referral_store.count_user_ids(after=after),
+    send=_broadcast_send,
+    classify=_broadcast_classify,
+    is_blocked=is_bot_blocked,
+    mark_blocked=mark_bot_blocked,
+    on_progress=_broadcast_progress,
+    is_leader=lambda: cluster.is_leader,
+)
+
+
+async def broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
-    בונה טקסט מסודר לכל אפשרויות התשלום והוראות שליחת האישור.
+    /broadcast <טקסט>
+    שידור הודעה לכל המשתמשים הרשומים – בקצב המותר, עם המשך אחרי ריסטארט.
     """
-    base_footer = (
-        "\nלאחר שביצעת תשלום באחד האמצעים למעלה:\n"
-        "1️⃣ שמור צילום מסך ברור של אישור התשלום (או קובץ PDF / מסמך מהבנק).\n"
-        "2️⃣ שלח את צילום המסך כאן בצ׳אט עם הבוט.\n"
-        "3️⃣ המערכת תעביר את האישור אוטומטית לקבוצת הניהול.\n\n"
-        "אחרי שהאדמין יאשר – תקבל קישור לקבוצת העסקים + זיכוי SLH בארנק הפנימי."
+    user = update.effective_user
+    chat = update.effective_chat
+    message = update.message
+    if not user or not chat or not message:
+        return
+
+    if not is_admin(user.id):
+        await send_to_chat(chat, "❌ הפקודה /broadcast מיועדת למנהלי המערכת בלבד.")
+        return
+
+    parts = (message.text or "").split(maxsplit=1)
+    if len(parts) < 2 or not parts[1].strip():
+        await send_to_chat(chat, "שימוש: /broadcast <טקסט ההודעה>")
+        return
+
+    status_msg = await send_to_chat(chat, "📣 מתחיל שידור...")
+    rec = await broadcast_engine.create(
+        parts[1].strip(),
+        created_by=user.id,
+        notify={"chat_id": chat.id, "message_id": status_msg.message_id},
     )
+    await send_log_message(f"📣 שידור {rec['id']} הופעל ע\"י admin_id={user.id}")
 
-    if method == "bank":
-        return (
-            "🏦 *תשלום בהעברה בנקאית*\n\n"
-            "פרטי החשבון:\n"
-            "בנק הפועלים\n"
-            "סניף כפר גנים (153)\n"
-            "חשבון 73462\n"
-            "המוטב: קאופמן צביקה\n"
-            + base_footer
-        )
-    if method == "paybox":
-        return (
-            "📲 *תשלום ב-PayBox*\n\n"
-            f"השתמש בלינק הזה לתשלום 39 ₪:\n{Config.PAYBOX_URL}\n"
-            + base_footer
-        )
-    if method == "bit":
-        return (
-            "📲 *תשלום ב-Bit*\n\n"
-            f"השתמש בלינק הזה לתשלום 39 ₪:\n{Config.BIT_URL}\n"
-            + base_footer
-        )
-    if method == "paypal":
-        return (
-            "🌍 *תשלום ב-PayPal*\n\n"
-            f"השתמש בלינק הבא לתשלום 39 ₪:\n{Config.PAYPAL_URL}\n"
-            + base_footer
-        )
-    if method == "ton":
-        return (
-            "🔐 *תשלום בקריפטו – TON*\n\n"
-            "שלח את שווי 39 ₪ בטוקן TON לכתובת:\n"
-            f"`{Config.TON_WALLET_ADDRESS}`\n"
-            + base_footer
-        )
-    return "שגיאה: אמצעי תשלום לא ידוע."
+
+async def broadcast_status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /broadcast_status [id]
+    מצב שידור (ברירת מחדל – האחרון).
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    if not user or not chat:
+        return
+
+    if not is_admin(user.id):
+        await send_to_chat(chat, "❌ הפקודה /broadcast_status מיועדת למנהלי המערכת בלבד.")
+        return
+
+    if context.args:
+        rec = await run_storage(broadcast_engine.get, context.args[0])
+    else:
+        rec = await run_storage(broadcast_engine.latest)
+    if not rec:
+        await send_to_chat(chat, "לא נמצא שידור.")
+        return
+    await send_to_chat(chat, format_broadcast_status(rec))
+
+
+async def broadcast_cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    /broadcast_cancel <id>
+    """
+    user = update.effective_user
+    chat = update.effective_chat
+    if not user or not chat:
+        return
+
+    if not is_admin(user.id):
+        await send_to_chat(chat, "❌ הפקודה /broadcast_cancel מיועדת למנהלי המערכת בלבד.")
+        return
+
+    if not context.args:
+        await send_to_chat(chat, "שימוש: /broadcast_cancel <id>")
+        return
+
+    if await broadcast_engine.cancel(context.args[0]):
+        await send_to_chat(chat, f"⛔ השידור {context.args[0]} נעצר.")
+    else:
+        await send_to_chat(chat, "לא נמצא שידור פעיל עם המזהה הזה.")
+
+
+# ===== Callback queries =====
+async def handle_investor_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    if not query:
+        return
+    await show_screen(query, "investor")
 
 
 async def handle_send_proof_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -2086,13 +3116,7 @@ async def handle_send_proof_menu(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     if not query:
         return
-    text = (
-        "💳 *איך לשלם ולשלוח אישור*\n\n"
-        "בחר אחד מאמצעי התשלום למטה לקבלת הוראות מדויקות.\n"
-        "לאחר התשלום, שלח כאן לבוט צילום מסך של האישור."
-    )
-    keyboard = build_payment_menu_keyboard()
-    await query.edit_message_text(text=text, reply_markup=keyboard, parse_mode="Markdown")
+    await show_screen(query, "send_proof_menu")
 
 
 async def handle_payment_method_callback(
@@ -2104,65 +3128,17 @@ async def handle_payment_method_callback(
     query = update.callback_query
     if not query:
         return
-    text = build_payment_instructions_text(method)
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "📤 שלח עכשיו צילום מסך", callback_data="send_proof_menu"
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    "🔙 חזרה לאפשרויות תשלום", callback_data="send_proof_menu"
-                )
-            ],
-            [InlineKeyboardButton("🏠 חזרה לתפריט הראשי", callback_data="back_to_main")],
-            [
-                InlineKeyboardButton(
-                    "🐞 דיווח באג במסך זה",
-                    callback_data=f"report_bug:pay_{method}",
-                )
-            ],
-        ]
-    )
-    await query.edit_message_text(text=text, reply_markup=keyboard, parse_mode="Markdown")
+    if method not in PAYMENT_METHOD_TEMPLATES:
+        await query.edit_message_text(build_payment_instructions_text(method))
+        return
+    await show_screen(query, f"pay_{method}")
 
 
 async def handle_benefits_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     if not query:
         return
-    benefits_text = load_message_block(
-        "BENEFITS_INFO",
-        (
-            "🎁 **מה מקבלים בתשלום 39 ₪?**\n\n"
-            "• גישה לקבוצת עסקים חכמה בטלגרם עם תכנים, הדרכות וקהילה פעילה.\n"
-            "• פתיחה וחיבור של ארנק SLH על רשת Binance Smart Chain (BSC).\n"
-            "• אפשרות לקבל תשלומים דיגיטליים ועמלות הפנייה דרך המערכת.\n"
-            "• חיבור לחוזים חכמים, קבלות דיגיטליות ו-NFT שמייצגים עסקאות ושערי כניסה.\n"
-            "• בסיס לעתיד – סטייקינג, חסכונות והשקעות מתקדמות בתוך אקו־סיסטם SLHNET.\n\n"
-            "אחרי התשלום ושליחת האישור – אתה מקבל קישור לקבוצה + סט כלים דיגיטליים להתחלה."
-        ),
-    )
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "🔙 חזרה לתפריט הראשי", callback_data="back_to_main"
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    "🐞 דיווח באג במסך זה",
-                    callback_data="report_bug:benefits_screen",
-                )
-            ],
-        ]
-    )
-    await query.edit_message_text(
-        text=benefits_text, reply_markup=keyboard, parse_mode="Markdown"
-    )
+    await show_screen(query, "benefits")
 
 
 async def handle_personal_area_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -2173,29 +3149,7 @@ async def handle_personal_area_callback(update: Update, context: ContextTypes.DE
     query = update.callback_query
     if not query:
         return
-    text = (
-        "👤 *האזור האישי שלך*\n\n"
-        "לקבלת סיכום מלא (ארנק, סטייקינג והפניות):\n"
-        "השתמש בפקודה /portfolio בצ׳אט עם הבוט.\n\n"
-        "בהמשך נוסיף כאן שאלון קצר כדי להכיר אותך טוב יותר ולחבר אותך\n"
-        "למומחים ולעסקים הרלוונטיים לך."
-    )
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "🏠 חזרה לתפריט הראשי", callback_data="back_to_main"
-                )
-            ],
-            [
-                InlineKeyboardButton(
-                    "🐞 דיווח באג במסך זה",
-                    callback_data="report_bug:personal_area",
-                )
-            ],
-        ]
-    )
-    await query.edit_message_text(text=text, reply_markup=keyboard, parse_mode="Markdown")
+    await show_screen(query, "personal_area")
 
 
 async def handle_bug_report_callback(
@@ -2214,7 +3168,7 @@ async def handle_bug_report_callback(
     user = query.from_user
     chat = query.message.chat if query.message else None
 
-    await send_bug_report(feature_id, user, chat)
+    await send_bug_report(feature_id or "unknown_feature", user, chat)
 
     await query.edit_message_text(
         "🐞 תודה שדיווחת על תקלה!\n"
@@ -2223,126 +3177,77 @@ async def handle_bug_report_callback(
     )
 
 
-async def callback_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def handle_approve_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, arg: str
+) -> None:
+    """כפתור האישור בהודעת התשלום בקבוצת הניהול (approve:<user_id>)."""
     query = update.callback_query
-    if not query:
+    if not is_admin(query.from_user.id):
+        await query.answer("רק מנהל יכול לאשר תשלום.", show_alert=True)
+        return
+    try:
+        target_id = int(arg)
+    except ValueError:
+        await query.answer("user_id לא תקין.", show_alert=True)
         return
 
-    data = query.data or ""
+    # עונים מיד – האישור עצמו (מסד, מינט, הודעה ללקוח) יכול לעבור את
+    # המועד של טלגרם למענה על callback
     await query.answer()
+    try:
+        admin_msg = await approve_payment(context.bot, target_id, "approved via inline button")
+    except Exception as e:
+        logger.error(f"Error updating payment status for {target_id}: {e}")
+        await send_to_chat(query.message.chat, "❌ שגיאה בעדכון סטטוס התשלום.")
+        return
+    await query.edit_message_text(admin_msg)
 
-    if data == "open_investor":
-        await handle_investor_callback(update, context)
-    elif data == "info_benefits":
-        await handle_benefits_callback(update, context)
-    elif data == "send_proof_menu":
-        await handle_send_proof_menu(update, context)
-    elif data == "back_to_main":
-        await send_start_screen(update, context)
-    elif data == "open_personal_area":
-        await handle_personal_area_callback(update, context)
-    elif data == "pay_bank":
-        await handle_payment_method_callback(update, context, "bank")
-    elif data == "pay_paybox":
-        await handle_payment_method_callback(update, context, "paybox")
-    elif data == "pay_bit":
-        await handle_payment_method_callback(update, context, "bit")
-    elif data == "pay_paypal":
-        await handle_payment_method_callback(update, context, "paypal")
-    elif data == "pay_ton":
-        await handle_payment_method_callback(update, context, "ton")
-    elif data.startswith("report_bug:"):
-        feature_id = data.split(":", 1)[1] or "unknown_feature"
-        await handle_bug_report_callback(update, context, feature_id)
-    elif data.startswith("approve:"):
-        if not is_admin(query.from_user.id):
-            await query.answer("רק מנהל יכול לאשר תשלום.", show_alert=True)
-            return
-        try:
-            target_id = int(data.split(":", 1)[1])
-        except ValueError:
-            await query.answer("user_id לא תקין.", show_alert=True)
-            return
-
-        try:
-            update_payment_status(target_id, "approved", "approved via inline button")
-            ensure_internal_wallet(target_id, None)
-        except Exception as e:
-            logger.error(f"Error updating payment status for {target_id}: {e}")
-            await query.answer("שגיאה בעדכון סטטוס התשלום.", show_alert=True)
-            return
 
-        minted = await auto_mint_slh_for_entry(target_id)
-        minted_str = format_decimal_pretty(minted) if minted else None
+async def handle_reject_callback(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, arg: str
+) -> None:
+    """כפתור הדחייה בהודעת התשלום בקבוצת הניהול (reject:<user_id>)."""
+    query = update.callback_query
+    if not is_admin(query.from_user.id):
+        await query.answer("רק מנהל יכול לדחות תשלום.", show_alert=True)
+        return
+    try:
+        target_id = int(arg)
+    except ValueError:
+        await query.answer("user_id לא תקין.", show_alert=True)
+        return
 
-        group_url = safe_get_url(
-            Config.BUSINESS_GROUP_URL or Config.GROUP_STATIC_INVITE,
-            Config.LANDING_URL,
+    await query.answer()
+    try:
+        admin_msg = await reject_payment(
+            context.bot, target_id, None, "rejected via inline button"
         )
-        referral_link = f"https://t.me/{Config.BOT_USERNAME}?start={target_id}"
+    except Exception as e:
+        logger.error(f"Error updating payment status (reject) for {target_id}: {e}")
+        await send_to_chat(query.message.chat, "❌ שגיאה בעדכון סטטוס התשלום.")
+        return
+    await query.edit_message_text(admin_msg)
 
-        try:
-            extra_slh = (
-                f"\n\nכחלק מההצטרפות קיבלת *{minted_str}* SLH פנימי לארנק שלך."
-                if minted_str
-                else ""
-            )
-            await context.bot.send_message(
-                chat_id=target_id,
-                text=(
-                    "✅ התשלום שלך אושר!\n\n"
-                    "הנה הקישור להצטרפות לקהילת העסקים שלנו:\n"
-                    f"{group_url}\n\n"
-                    "בנוסף, זה הקישור האישי שלך להזמנת חברים:\n"
-                    f"{referral_link}\n"
-                    f"{extra_slh}\n\n"
-                    "תוכל תמיד לקבל אותו שוב בפקודה /my_link.\n"
-                    "ברוך הבא 🙌"
-                ),
-                parse_mode="Markdown",
-            )
-        except Exception as e:
-            logger.error(f"Error sending approval message to user {target_id}: {e}")
 
-        admin_msg = (
-            f"✅ התשלום של המשתמש {target_id} אושר ונשלח לו קישור לקבוצה + לינק אישי."
-        )
-        if minted_str:
-            admin_msg += f"\nנמינטו לו {minted_str} SLH פנימיים."
-        await query.edit_message_text(admin_msg)
-    elif data.startswith("reject:"):
-        if not is_admin(query.from_user.id):
-            await query.answer("רק מנהל יכול לדחות תשלום.", show_alert=True)
-            return
-        try:
-            target_id = int(data.split(":", 1)[1])
-        except ValueError:
-            await query.answer("user_id לא תקין.", show_alert=True)
-            return
+async def handle_unknown_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await update.callback_query.edit_message_text("❌ פעולה לא מוכרת.")
 
-        try:
-            update_payment_status(target_id, "rejected", "rejected via inline button")
-        except Exception as e:
-            logger.error(f"Error updating payment status (reject) for {target_id}: {e}")
-            await query.answer("שגיאה בעדכון סטטוס התשלום.", show_alert=True)
-            return
 
-        try:
-            await context.bot.send_message(
-                chat_id=target_id,
-                text=(
-                    "❌ התשלום שלך נדחה.\n"
-                    "אם לדעתך מדובר בטעות, ניתן לפנות לתמיכה."
-                ),
-            )
-        except Exception as e:
-            logger.error(f"Error sending rejection message to user {target_id}: {e}")
-
-        await query.edit_message_text(
-            f"🚫 התשלום של המשתמש {target_id} נדחה ונשלחה לו הודעה."
-        )
-    else:
-        await query.edit_message_text("❌ פעולה לא מוכרת.")
+# כל callback_data נרשם כאן פעם אחת – מסך חדש הוא שורה נוספת
+callback_router = CallbackRouter(fallback=handle_unknown_callback)
+callback_router.route("open_investor", handle_investor_callback)
+callback_router.route("info_benefits", handle_benefits_callback)
+callback_router.route("send_proof_menu", handle_send_proof_menu)
+callback_router.route("back_to_main", show_main_menu)
+callback_router.route("open_personal_area", handle_personal_area_callback)
+for _method in PAYMENT_METHOD_TEMPLATES:
+    callback_router.route(
+        f"pay_{_method}", functools.partial(handle_payment_method_callback, method=_method)
+    )
+callback_router.prefix("report_bug", handle_bug_report_callback)
+# approve/reject עונים בעצמם – התראה למי שאינו מנהל או על שגיאה
+callback_router.prefix("approve", handle_approve_callback, answer=False)
+callback_router.prefix("reject", handle_reject_callback, answer=False)
 
 
 async def echo_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -2359,15 +3264,18 @@ async def echo_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             "השתמש ב-/start כדי לראות את התפריט הראשי."
         ),
     )
-    await update.message.reply_text(response)
+    await outbound.send(update.message.chat_id, lambda: update.message.reply_text(response))
 
 
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     טיפול בפקודות לא מוכרות.
     """
-    await update.message.reply_text(
-        "❓ פקודה לא מוכרת. השתמש ב-/start כדי לראות את התפריט הזמין."
+    await outbound.send(
+        update.message.chat_id,
+        lambda: update.message.reply_text(
+            "❓ פקודה לא מוכרת. השתמש ב-/start כדי לראות את התפריט הזמין."
+        ),
     )
 
 
@@ -2379,8 +3287,8 @@ async def finance_metrics():
     """
     סטטוס כספי כולל – הכנסות, רזרבות, נטו ואישורים.
     """
-    reserve_stats = get_reserve_stats() or {}
-    approval_stats = get_approval_stats() or {}
+    reserve_stats = await run_storage(get_reserve_stats) or {}
+    approval_stats = await run_storage(get_approval_stats) or {}
     return {
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "reserve": reserve_stats,
@@ -2394,7 +3302,7 @@ async def monthly_metrics():
     מדד פשוט של תשלומים חודשיים מה-DB (אם ממומש בצד db.py).
     """
     try:
-        data = get_monthly_payments() or []
+        data = await run_storage(get_monthly_payments) or []
     except Exception as e:
         logger.error(f"Error fetching monthly payments: {e}")
         data = []
@@ -2410,7 +3318,7 @@ async def debug_config():
     החזרת תמונת קונפיגורציה (ללא סודות) כדי שתוכל לבדוק מה נטען בשרת.
     כולל שער SLH נוכחי ומידע ארנק חם/קר.
     """
-    return Config.snapshot()
+    return await run_storage(Config.snapshot)
 
 
 @app.get("/api/referrals/summary")
@@ -2418,11 +3326,79 @@ async def referrals_summary():
     """
     סיכום הפניות דרך HTTP – future-ready ללוח בקרה חיצוני.
     """
-    data = load_referrals()
+    stats = await run_storage(referral_store.statistics)
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "statistics": stats,
+        "users_count": stats["total_users"],
+    }
+
+
+def _parse_history_ts(value: Optional[str]) -> Optional[float]:
+    """epoch seconds או ISO-8601 (ללא אזור זמן = UTC)."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+PRICE_HISTORY_MAX_BUCKETS = 2000
+
+
+@app.get("/api/price/history")
+async def api_price_history(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    step: Optional[float] = None,
+    at: Optional[str] = None,
+):
+    """
+    היסטוריית שער SLH.
+    - at=<זמן>: השער שהיה בתוקף באותו רגע.
+    - start/end (ברירת מחדל: 30 הימים האחרונים): נקודות השינוי בטווח.
+    - step=<שניות>: דגימה לחלונות open/high/low/close.
+    זמנים מתקבלים כ-epoch seconds או ISO-8601.
+    """
+    try:
+        at_ts = _parse_history_ts(at)
+        end_ts = _parse_history_ts(end)
+        start_ts = _parse_history_ts(start)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "detail": f"bad timestamp: {e}"}, status_code=400)
+
+    if at_ts is not None:
+        price = await run_storage(price_history.price_at, at_ts)
+        return {
+            "at": at_ts,
+            "price": float(price) if price is not None else None,
+        }
+
+    end_ts = time.time() if end_ts is None else end_ts
+    start_ts = end_ts - 30 * 86400 if start_ts is None else start_ts
+    if start_ts > end_ts:
+        return JSONResponse({"status": "error", "detail": "start is after end"}, status_code=400)
+    if step is not None and step > 0 and (end_ts - start_ts) / step > PRICE_HISTORY_MAX_BUCKETS:
+        return JSONResponse(
+            {"status": "error", "detail": f"step too small (max {PRICE_HISTORY_MAX_BUCKETS} buckets)"},
+            status_code=400,
+        )
+
+    points = await run_storage(price_history.range, start_ts, end_ts, step)
     return {
         "timestamp": datetime.utcnow().isoformat() + "Z",
-        "statistics": data.get("statistics", {}),
-        "users_count": len(data.get("users", {})),
+        "start": start_ts,
+        "end": end_ts,
+        "step": step,
+        "points": [
+            {k: (float(v) if isinstance(v, Decimal) else v) for k, v in p.items()}
+            for p in points
+        ],
     }
 
 
@@ -2434,9 +3410,7 @@ async def api_user_wallet(user_id: int):
     - כתובות BSC/TON (אם הוגדרו) – בדיקות בלבד.
     """
     try:
-        ensure_internal_wallet(user_id, None)
-        overview = get_wallet_overview(user_id) or {}
-        stakes = get_user_stakes(user_id) or []
+        overview, stakes = await run_storage(load_wallet_snapshot, user_id, None)
     except Exception as e:
         logger.error(f"api_user_wallet error for {user_id}: {e}")
         raise
@@ -2453,10 +3427,10 @@ async def api_user_wallet(user_id: int):
         except Exception:
             continue
 
-    price_nis, _ = get_current_price_and_entry()
+    price_nis, _ = await run_storage(get_current_price_and_entry)
     value_nis = balance * price_nis if price_nis > 0 else Decimal("0")
 
-    onchain = get_onchain_wallet(user_id)
+    onchain = await run_storage(get_onchain_wallet, user_id)
     bsc_addr = onchain.get("bsc")
     ton_addr = onchain.get("ton")
 
@@ -2472,6 +3446,11 @@ async def api_user_wallet(user_id: int):
 
 @app.get("/metrics")
 async def metrics():
+    # בכמה תהליכים (PROMETHEUS_MULTIPROC_DIR מוגדר) – מאחדים את המדדים של כולם
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
@@ -2507,50 +3486,274 @@ async def landing(request: Request):
     )
 
 
-@app.post("/webhook")
-async def telegram_webhook(update: TelegramWebhookUpdate):
+def _check_admin_token(token: Optional[str]) -> Optional[JSONResponse]:
+    if not Config.ADMIN_API_TOKEN or token != Config.ADMIN_API_TOKEN:
+        return JSONResponse({"status": "error", "detail": "forbidden"}, status_code=403)
+    return None
+
+
+@app.post("/api/broadcast")
+async def api_broadcast_create(
+    body: BroadcastRequest, x_admin_token: Optional[str] = Header(None)
+):
+    """
+    הפעלת שידור לכל המשתמשים. דורש כותרת X-Admin-Token = ADMIN_API_TOKEN.
+    """
+    denied = _check_admin_token(x_admin_token)
+    if denied:
+        return denied
+    if not body.text.strip():
+        return JSONResponse({"status": "error", "detail": "empty text"}, status_code=400)
+    rec = await broadcast_engine.create(body.text.strip(), parse_mode=body.parse_mode)
+    await send_log_message(f"📣 שידור {rec['id']} הופעל דרך ה-API")
+    return {k: v for k, v in rec.items() if k != "notify"}
+
+
+@app.get("/api/broadcast/{broadcast_id}")
+async def api_broadcast_status(broadcast_id: str, x_admin_token: Optional[str] = Header(None)):
+    """מצב שידור: sent / failed / blocked / skipped_blocked / total."""
+    denied = _check_admin_token(x_admin_token)
+    if denied:
+        return denied
+    rec = await run_storage(broadcast_engine.get, broadcast_id)
+    if not rec:
+        return JSONResponse({"status": "error", "detail": "not found"}, status_code=404)
+    return {k: v for k, v in rec.items() if k != "notify"}
+
+
+@app.post("/api/broadcast/{broadcast_id}/cancel")
+async def api_broadcast_cancel(broadcast_id: str, x_admin_token: Optional[str] = Header(None)):
+    denied = _check_admin_token(x_admin_token)
+    if denied:
+        return denied
+    cancelled = await broadcast_engine.cancel(broadcast_id)
+    return {"id": broadcast_id, "cancelled": cancelled}
+
+
+async def _process_telegram_update(ptb_update: Update) -> None:
+    await TelegramAppManager.get_app().process_update(ptb_update)
+
+
+def _update_order_key(ptb_update: Update) -> int:
+    """עדכונים של אותו צ'אט (או משתמש, אם אין צ'אט) מעובדים לפי הסדר."""
+    if ptb_update.effective_chat is not None:
+        return ptb_update.effective_chat.id
+    if ptb_update.effective_user is not None:
+        return ptb_update.effective_user.id
+    return ptb_update.update_id
+
+
+update_workers = UpdateWorkerPool(
+    _process_telegram_update, key=_update_order_key, workers=Config.UPDATE_WORKERS
+)
+update_dedup = UpdateDeduplicator(bot_state_table)
+# שמירות ה-high-water mark שרצות ברקע – מוחזקות עד שסיימו, וממתינים להן בכיבוי
+_persist_tasks: Set[asyncio.Task] = set()
+
+
+async def _persist_update_dedup() -> None:
+    try:
+        await run_storage(update_dedup.persist)
+    except Exception as e:
+        logger.error(f"Error persisting update high-water mark: {e}")
+
+
+_SECRET_HEADER = "x-telegram-bot-api-secret-token"
+
+
+async def telegram_webhook(request: Request):
     """
     נקודת ה-webhook של טלגרם – Railway מפנה לכאן.
+    הכותרת הסודית נבדקת לפני כל פענוח; גוף הבקשה מפוענח פעם אחת ל-dict
+    שעובר ישירות ל-PTB (כל סוגי העדכונים). העדכון נכנס לתור ומעובד ע"י
+    update_workers; התשובה חוזרת מיד.
     """
+    if Config.WEBHOOK_SECRET_TOKEN and not hmac.compare_digest(
+        request.headers.get(_SECRET_HEADER, ""), Config.WEBHOOK_SECRET_TOKEN
+    ):
+        return JSONResponse({"status": "forbidden"}, status_code=403)
+
+    try:
+        body = await request.body()
+        raw_update = orjson.loads(body) if orjson is not None else json.loads(body)
+    except ValueError:
+        return JSONResponse({"status": "bad_json"}, status_code=400)
+    update_id = raw_update.get("update_id") if isinstance(raw_update, dict) else None
+    if not isinstance(update_id, int):
+        return JSONResponse({"status": "no_update"}, status_code=400)
+    if not update_dedup.claim(update_id):
+        # שליחה חוזרת של עדכון שכבר התקבל – מאשרים בלי לעבד שוב
+        return JSONResponse({"status": "duplicate"})
+
     try:
         TelegramAppManager.initialize_handlers()
         app_instance = TelegramAppManager.get_app()
-        raw_update = update.dict()
         ptb_update = Update.de_json(raw_update, app_instance.bot)
-        if ptb_update:
-            await app_instance.process_update(ptb_update)
-            return JSONResponse({"status": "processed"})
-        else:
+        if not ptb_update:
+            update_dedup.release(update_id)
             return JSONResponse({"status": "no_update"}, status_code=400)
+        if not update_workers.enqueue(ptb_update):
+            # טלגרם ישלח את העדכון שוב
+            update_dedup.release(update_id)
+            return JSONResponse({"status": "busy"}, status_code=503)
+        update_dedup.confirm(update_id)
+        if update_dedup.should_persist():
+            task = asyncio.create_task(_persist_update_dedup())
+            _persist_tasks.add(task)
+            task.add_done_callback(_persist_tasks.discard)
+        return JSONResponse({"status": "queued"})
     except Exception as e:
+        update_dedup.release(update_id)
         logger.error(f"Webhook error: {e}")
         return JSONResponse({"status": "error", "detail": str(e)}, status_code=500)
 
 
+# בתפקיד api אין נקודת webhook – טלגרם מופנה רק לשרתי הבוט
+if RUNS_BOT:
+    app.post("/webhook")(telegram_webhook)
+
+
+def refresh_shared_state() -> None:
+    """מושך את מה שתהליכים אחרים כתבו מאז הבדיקה הקודמת (ב-executor)."""
+    for table in (
+        referral_store.table,
+        profiles_table,
+        onchain_table,
+        dynamic_config_table,
+        media_cache_table,
+        broadcasts_table,
+        bot_state_table,
+    ):
+        table.refresh_if_changed()
+    price_history.refresh_if_changed()
+    mint_accumulator.flush_if_due()
+
+
+async def become_leader() -> None:
+    """תפקידי המוביל: webhook ושידורים שנקטעו."""
+    await TelegramAppManager.set_webhook()
+    try:
+        resumed = await broadcast_engine.resume_all()
+        if resumed:
+            await send_log_message(f"📣 שידורים ממשיכים אחרי אתחול: {', '.join(resumed)}")
+    except Exception as e:
+        logger.error(f"Failed to resume broadcasts: {e}")
+
+
+async def run_cluster() -> None:
+    """
+    כל CLUSTER_CHECK_SECONDS: ריענון המצב המשותף (כשיש תהליכים נוספים),
+    ניסיון לתפוס את ההובלה אם המוביל נפל, ובמוביל – איסוף שידורים
+    שנוצרו בתהליכים אחרים.
+    """
+    while True:
+        await asyncio.sleep(CLUSTER_CHECK_SECONDS)
+        try:
+            if SHARED_STORAGE:
+                await run_storage(refresh_shared_state)
+            if not RUNS_BOT:
+                # שרת API לא מנהל webhook ולא מריץ שידורים
+                continue
+            if cluster.try_lead():
+                await become_leader()
+            elif cluster.is_leader and SHARED_STORAGE:
+                await broadcast_engine.resume_all()
+        except Exception as e:
+            logger.error(f"Cluster check failed: {e}")
+
+
+_cluster_task: Optional[asyncio.Task] = None
+
+
 @app.on_event("startup")
 async def startup_event():
     """
-    אתחול בסיסי של ה-DB ושל אפליקציית הטלגרם.
+    אתחול בסיסי של ה-DB ושל אפליקציית הטלגרם (בתפקיד api – DB בלבד).
     """
+    global _messages_watcher, _cluster_task
     try:
-        init_schema()
+        await run_storage(init_schema)
     except Exception as e:
         logger.warning(f"init_schema failed: {e}")
     try:
-        init_internal_wallet_schema()
+        await run_storage(init_internal_wallet_schema)
     except Exception as e:
         logger.warning(f"init_internal_wallet_schema failed: {e}")
 
+    if RUNS_BOT:
+        await run_storage(MessageCatalog.reload)
+        await run_storage(DynamicConfigCache.get)
+        _messages_watcher = asyncio.create_task(watch_messages_file())
+
     warnings = Config.validate()
     for w in warnings:
         logger.warning(w)
     if warnings:
-        await send_log_message("⚠️ **אזהרות אתחול:**\n" + "\n".join(warnings))
+        await send_log_message(
+            "⚠️ **אזהרות אתחול:**\n" + "\n".join(warnings), urgent=True
+        )
 
+    if RUNS_BOT:
+        try:
+            await TelegramAppManager.start()
+        except Exception as e:
+            logger.error(f"Failed to start Telegram Application: {e}")
+        try:
+            await run_storage(update_dedup.load)
+        except Exception as e:
+            logger.error(f"Failed to load update high-water mark: {e}")
+        update_workers.start()
+
+        # רק תהליך אחד מגדיר webhook וממשיך שידורים; השאר מנסים שוב ברקע
+        if cluster.try_lead():
+            await become_leader()
+    _cluster_task = asyncio.create_task(run_cluster())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """
+    דחיסת ה-journal של מאגרי הקבצים וסגירת ה-backend לפני יציאה.
+    """
+    if _messages_watcher is not None:
+        _messages_watcher.cancel()
+    if _cluster_task is not None:
+        _cluster_task.cancel()
+    # עדכונים שכבר התקבלו מעובדים עד הסוף לפני שסוגרים את שאר השכבות
+    await update_workers.drain()
+    if _persist_tasks:
+        await asyncio.gather(*_persist_tasks)
+    await _persist_update_dedup()
+    # שידורים פעילים נשארים running וממשיכים מה-cursor באתחול הבא
+    await broadcast_engine.stop()
+    # נותנים להודעות שכבר בתור (לוגים, אישורים) לצאת לפני הסגירה
+    await log_digest.stop()
+    await outbound.stop()
+    await TelegramAppManager.shutdown()
+    try:
+        mint_accumulator.flush()
+    except Exception as e:
+        logger.error(f"Error flushing mint accumulator: {e}")
+    for table in (
+        referral_store,
+        profiles_table,
+        onchain_table,
+        dynamic_config_table,
+        media_cache_table,
+        broadcasts_table,
+        bot_state_table,
+    ):
+        try:
+            table.close()
+        except Exception as e:
+            logger.error(f"Error closing storage table: {e}")
     try:
-        await TelegramAppManager.start()
+        storage_backend.close()
     except Exception as e:
-        logger.error(f"Failed to start Telegram Application: {e}")
+        logger.error(f"Error closing storage backend: {e}")
+    shutdown_storage_executor()
+    # ההובלה משתחררת רק אחרי שהשידורים נעצרו והמצב נשמר
+    cluster.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+"""
+תבניות מלל לבוט – מעל קטלוג בלוקי ההודעות.
+
+בלוק בקובץ ההודעות (או טקסט ברירת המחדל שבקוד) יכול להכיל placeholders
+בצורה {{entry}} / {{price}} / {{paybox_url}} וכו'. כל תבנית מקומפלת פעם אחת
+לרשימת חלקים (מלל קבוע + שמות שדות), ותוצאת הרינדור מול הקונטקסט הכללי
+(מחיר, סכום כניסה, קישורים) נשמרת לפי גרסת הקונטקסט – כך שמסכים חמים לא
+מרכיבים מחדש טקסט זהה, ושינוי ניסוח לא מצריך שינוי קוד.
+"""
+
+import re
+import threading
+from typing import Callable, Dict, Hashable, List, Optional
+
+_PLACEHOLDER = re.compile(r"\{\{\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*\}\}")
+
+
+class CompiledTemplate:
+    """
+    תבנית מפורקת: parts הוא רשימה לסירוגין של מלל קבוע ושמות שדות
+    (אינדקסים זוגיים – מלל, אי-זוגיים – שדה).
+    placeholder שאין לו ערך נשאר בטקסט כמו שהוא.
+    """
+
+    __slots__ = ("source", "parts", "fields")
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.parts: List[str] = _PLACEHOLDER.split(source)
+        self.fields = frozenset(self.parts[1::2])
+
+    def render(self, values: Dict[str, str]) -> str:
+        if not self.fields:
+            return self.source
+        out = []
+        for i, part in enumerate(self.parts):
+            if i % 2 == 0:
+                out.append(part)
+            else:
+                value = values.get(part)
+                out.append("{{" + part + "}}" if value is None else str(value))
+        return "".join(out)
+
+
+class MessageTemplates:
+    """
+    רישום תבניות בשם.
+    - source(name, default) – מחזיר את מלל הבלוק (למשל load_message_block).
+    - context() – הערכים הכלליים (מחיר, סכום כניסה, קישורים).
+    - version() – משתנה בכל פעם שהמקור או הקונטקסט השתנו; כשהוא משתנה
+      התבניות מקומפלות מחדש והרינדורים השמורים נזרקים.
+    """
+
+    def __init__(
+        self,
+        source: Callable[[str, str], str],
+        context: Callable[[], Dict[str, str]],
+        version: Callable[[], Hashable],
+    ) -> None:
+        self._source = source
+        self._context = context
+        self._version = version
+        self._defaults: Dict[str, str] = {}
+        self._compiled: Dict[str, CompiledTemplate] = {}
+        self._rendered: Dict[str, str] = {}
+        self._values: Optional[Dict[str, str]] = None
+        self._seen_version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+
+    def register(self, name: str, default: str) -> None:
+        """default משמש כשהבלוק לא קיים בקובץ ההודעות."""
+        with self._lock:
+            self._defaults[name] = default
+            self._compiled.pop(name, None)
+            self._rendered.pop(name, None)
+
+    def _sync(self) -> Dict[str, str]:
+        # נקרא תחת self._lock
+        current = self._version()
+        if current != self._seen_version or self._values is None:
+            self._compiled.clear()
+            self._rendered.clear()
+            self._values = dict(self._context())
+            self._seen_version = current
+        return self._values
+
+    def _template(self, name: str) -> CompiledTemplate:
+        tpl = self._compiled.get(name)
+        if tpl is None:
+            tpl = CompiledTemplate(self._source(name, self._defaults.get(name, "")))
+            self._compiled[name] = tpl
+        return tpl
+
+    def render(self, name: str, **extra: str) -> str:
+        """
+        מרנדר את התבנית name. בלי extra – התוצאה נשמרת עד לשינוי הגרסה.
+        ערכים ב-extra (למשל קישור אישי) גוברים על הקונטקסט הכללי.
+        """
+        with self._lock:
+            values = self._sync()
+            if not extra:
+                text = self._rendered.get(name)
+                if text is None:
+                    text = self._template(name).render(values)
+                    self._rendered[name] = text
+                return text
+            tpl = self._template(name)
+        merged = dict(values)
+        merged.update(extra)
+        return tpl.render(merged)
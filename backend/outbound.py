@@ -0,0 +1,305 @@
+"""
+תזמון הודעות יוצאות ל-Telegram Bot API לפי מגבלות הקצב של טלגרם.
+
+במקום שכל handler יקרא ישירות ל-send_message (ויספוג 429 / retry_after בתוך
+הטיפול בעדכון), כל שליחה נכנסת לתור עדיפויות:
+- PRIORITY_USER  – תשובה ישירה למשתמש
+- PRIORITY_ADMIN – הודעות שמנהל יזם (אישור / דחייה)
+- PRIORITY_LOG   – קבוצת הלוגים
+- PRIORITY_BULK  – שידורים לכל הקהילה
+
+dispatcher יחיד מוציא מהתור לפי עדיפות, ממתין לאסימון בדלי הגלובלי ובדלי
+של הצ'אט (token bucket), ומריץ את השליחה. לכל צ'אט יש לכל היותר שליחה אחת
+בטיפול בכל רגע – הודעות נוספות לאותו צ'אט ממתינות לה, כך שהסדר נשמר גם
+כש-OUTBOUND_CONCURRENCY>1. על RetryAfter – רק הצ'אט מושהה לזמן שטלגרם ביקש,
+וההודעה חוזרת לתור (ושומרת על התור של הצ'אט). הקורא מקבל future עם התוצאה
+(Message) או החריגה.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from cluster import WEB_CONCURRENCY
+
+try:
+    from telegram.error import RetryAfter
+except ImportError:  # שרת API בלי python-telegram-bot
+    RetryAfter = None
+
+logger = logging.getLogger("slhnet.outbound")
+
+PRIORITY_USER = 0
+PRIORITY_ADMIN = 1
+PRIORITY_LOG = 2
+PRIORITY_BULK = 3
+PRIORITY_NAMES = {
+    PRIORITY_USER: "user",
+    PRIORITY_ADMIN: "admin",
+    PRIORITY_LOG: "log",
+    PRIORITY_BULK: "bulk",
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+# מגבלות טלגרם: ~30 הודעות בשנייה בסה"כ, ~1 בשנייה לצ'אט פרטי, 20 בדקה לקבוצה
+OUTBOUND_GLOBAL_RATE = _env_float("OUTBOUND_GLOBAL_RATE", 25.0)
+OUTBOUND_GLOBAL_BURST = _env_float("OUTBOUND_GLOBAL_BURST", 25.0)
+OUTBOUND_CHAT_RATE = _env_float("OUTBOUND_CHAT_RATE", 1.0)
+OUTBOUND_CHAT_BURST = _env_float("OUTBOUND_CHAT_BURST", 3.0)
+OUTBOUND_GROUP_RATE = _env_float("OUTBOUND_GROUP_RATE", 20.0 / 60.0)
+OUTBOUND_GROUP_BURST = _env_float("OUTBOUND_GROUP_BURST", 5.0)
+OUTBOUND_CONCURRENCY = max(1, int(_env_float("OUTBOUND_CONCURRENCY", 8)))
+OUTBOUND_MAX_ATTEMPTS = max(1, int(_env_float("OUTBOUND_MAX_ATTEMPTS", 3)))
+
+OUTBOUND_QUEUE_DEPTH = Gauge(
+    "slhnet_outbound_queue_depth",
+    "Outbound Telegram calls waiting to be sent",
+    ["priority"],
+)
+OUTBOUND_WAIT = Histogram(
+    "slhnet_outbound_wait_seconds",
+    "Time from submitting an outbound Telegram call until it was sent",
+    ["priority"],
+)
+OUTBOUND_SENT = Counter(
+    "slhnet_outbound_sent_total",
+    "Outbound Telegram calls by result",
+    ["priority", "result"],
+)
+OUTBOUND_RETRY_AFTER = Counter(
+    "slhnet_outbound_retry_after_total",
+    "RetryAfter (429) responses received from Telegram",
+)
+
+
+class TokenBucket:
+    """
+    דלי אסימונים עם הזמנה מראש: reserve() לוקח אסימון (גם אם היתרה שלילית)
+    ומחזיר כמה שניות לחכות עד שהוא באמת זמין – כך סדר ההזמנות נשמר.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        now = time.monotonic()
+        self.paused_until = max(self.paused_until, now + seconds)
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+    def idle(self) -> bool:
+        now = time.monotonic()
+        self._refill(now)
+        return self.tokens >= self.burst and self.paused_until <= now
+
+
+class _Job:
+    __slots__ = ("priority", "chat_id", "call", "future", "submitted_at", "attempts", "chat_ready")
+
+    def __init__(self, priority: int, chat_id: Any, call: Callable[[], Awaitable[Any]], future) -> None:
+        self.priority = priority
+        self.chat_id = chat_id
+        self.call = call
+        self.future = future
+        self.submitted_at = time.monotonic()
+        self.attempts = 0
+        self.chat_ready = False
+
+
+class OutboundScheduler:
+    def __init__(self) -> None:
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        # המגבלה הגלובלית של טלגרם משותפת לכל התהליכים – כל אחד מקבל חלק שווה
+        self._global = TokenBucket(
+            OUTBOUND_GLOBAL_RATE / WEB_CONCURRENCY,
+            max(1.0, OUTBOUND_GLOBAL_BURST / WEB_CONCURRENCY),
+        )
+        self._chats: Dict[Any, TokenBucket] = {}
+        # הג'וב שמחזיק כרגע את הצ'אט (עד שסיים סופית), והג'ובים שממתינים לו
+        self._chat_owner: Dict[Any, _Job] = {}
+        self._chat_waiting: Dict[Any, Deque[_Job]] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._running: set = set()
+        self._pending: set = set()
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            try:
+                is_group = int(chat_id) < 0
+            except (TypeError, ValueError):
+                is_group = True  # @channelusername
+            if is_group:
+                bucket = TokenBucket(OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST)
+            else:
+                bucket = TokenBucket(OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST)
+            if len(self._chats) > 10000:
+                # דליים מלאים לא נושאים מידע – אפשר לזרוק אותם
+                for key in [k for k, b in self._chats.items() if b.idle()]:
+                    del self._chats[key]
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def start(self) -> None:
+        if self._dispatcher is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._slots = asyncio.Semaphore(OUTBOUND_CONCURRENCY)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def _put(self, job: _Job) -> None:
+        self._queue.put_nowait((job.priority, next(self._seq), job))
+
+    def submit(
+        self,
+        chat_id: Any,
+        call: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_USER,
+    ) -> "asyncio.Future":
+        """
+        מכניס קריאה לתור ומחזיר future עם התוצאה.
+        call – פונקציה בלי פרמטרים שמחזירה awaitable (נקראת רק בזמן השליחה,
+        ושוב אם טלגרם ביקש retry_after).
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(priority, chat_id, call, future)
+        self._pending.add(job)
+        OUTBOUND_QUEUE_DEPTH.labels(PRIORITY_NAMES[priority]).inc()
+        self._put(job)
+        return future
+
+    async def send(
+        self,
+        chat_id: Any,
+        call: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_USER,
+    ) -> Any:
+        return await self.submit(chat_id, call, priority)
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self._queue.get()
+            if job.future.cancelled():
+                self._finish(job)
+                continue
+            owner = self._chat_owner.get(job.chat_id)
+            if owner is None:
+                self._chat_owner[job.chat_id] = job
+            elif owner is not job:
+                self._chat_waiting.setdefault(job.chat_id, deque()).append(job)
+                continue
+            if not job.chat_ready:
+                job.chat_ready = True
+                delay = self._chat_bucket(job.chat_id).reserve()
+                if delay > 0:
+                    loop.call_later(delay, self._put, job)
+                    continue
+            delay = self._global.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    def _finish(self, job: _Job) -> None:
+        self._pending.discard(job)
+        OUTBOUND_QUEUE_DEPTH.labels(PRIORITY_NAMES[job.priority]).dec()
+        if self._chat_owner.get(job.chat_id) is job:
+            del self._chat_owner[job.chat_id]
+        if job.chat_id not in self._chat_owner:
+            # גם ג'וב שקודם מההמתנה ובוטל לפני שיצא מהתור לא החזיק את הצ'אט –
+            # בלי זה שאר הממתינים לצ'אט היו נתקעים
+            waiting = self._chat_waiting.get(job.chat_id)
+            if waiting:
+                self._put(waiting.popleft())
+                if not waiting:
+                    del self._chat_waiting[job.chat_id]
+
+    async def _run(self, job: _Job) -> None:
+        name = PRIORITY_NAMES[job.priority]
+        try:
+            job.attempts += 1
+            result = await job.call()
+        except Exception as e:
+            if RetryAfter is not None and isinstance(e, RetryAfter) and job.attempts < OUTBOUND_MAX_ATTEMPTS:
+                retry_after = e.retry_after
+                seconds = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+                OUTBOUND_RETRY_AFTER.inc()
+                logger.warning(f"Telegram asked to retry after {seconds}s (chat {job.chat_id})")
+                self._chat_bucket(job.chat_id).pause(seconds)
+                job.chat_ready = False
+                self._put(job)
+                return
+            self._finish(job)
+            OUTBOUND_SENT.labels(name, "error").inc()
+            if not job.future.done():
+                job.future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        self._finish(job)
+        OUTBOUND_SENT.labels(name, "ok").inc()
+        OUTBOUND_WAIT.labels(name).observe(time.monotonic() - job.submitted_at)
+        if not job.future.done():
+            job.future.set_result(result)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """ממתין עד timeout שניות לריקון התור, ואז עוצר את ה-dispatcher."""
+        if self._dispatcher is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._dispatcher.cancel()
+        for task in list(self._running):
+            task.cancel()
+        self._dispatcher = None
+        self._chat_owner.clear()
+        self._chat_waiting.clear()
+        if self._pending:
+            logger.warning(f"Outbound scheduler stopped with {len(self._pending)} unsent calls")
+        for job in list(self._pending):
+            self._finish(job)
+            if not job.future.done():
+                job.future.cancel()
+
+
+outbound = OutboundScheduler()
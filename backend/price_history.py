@@ -0,0 +1,167 @@
+"""
+היסטוריית שער SLH – סדרת זמן append-only.
+
+כל שינוי מחיר נרשם כשורה בקובץ JSON Lines, ובזיכרון נשמרים שני מערכים
+ממוינים (זמנים ומחירים) כך ש"מה היה המחיר בזמן T" הוא חיפוש בינארי – O(log n),
+ושאילתת טווח מחזירה נקודות מדוגמות לפי חלונות זמן.
+"""
+
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("slhnet.price_history")
+
+
+class PriceHistory:
+    """
+    שורה בקובץ: {"ts": <epoch seconds>, "price": "<Decimal>", "by": <admin_id|null>}
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._ts: Optional[List[float]] = None
+        self._prices: List[Decimal] = []
+        self._actors: List[Optional[int]] = []
+        # (mtime, size) של הקובץ אחרי הקריאה/הכתיבה האחרונה שלנו
+        self._seen_version: Any = None
+
+    def _disk_version(self) -> Any:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def load(self) -> None:
+        with self._lock:
+            if self._ts is not None:
+                return
+            rows = []
+            if self.path.exists():
+                try:
+                    with self.path.open("r", encoding="utf-8") as f:
+                        for line in f:
+                            try:
+                                entry = json.loads(line)
+                                rows.append(
+                                    (float(entry["ts"]), Decimal(str(entry["price"])), entry.get("by"))
+                                )
+                            except Exception:
+                                continue
+                except Exception as e:
+                    logger.error(f"Error loading price history: {e}")
+            rows.sort(key=lambda r: r[0])
+            self._ts = [r[0] for r in rows]
+            self._prices = [r[1] for r in rows]
+            self._actors = [r[2] for r in rows]
+            self._seen_version = self._disk_version()
+
+    def refresh_if_changed(self) -> bool:
+        """טוען מחדש אם תהליך אחר הוסיף נקודות לקובץ."""
+        with self._lock:
+            if self._ts is None or self._disk_version() == self._seen_version:
+                return False
+            self._ts = None
+            self.load()
+            return True
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.load()
+            return len(self._ts)
+
+    def record(
+        self,
+        price: Decimal,
+        ts: Optional[float] = None,
+        actor: Optional[int] = None,
+    ) -> None:
+        """מוסיף נקודה לסדרה (append לקובץ + עדכון המערכים בזיכרון)."""
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            self.refresh_if_changed()
+            self.load()
+            line = json.dumps(
+                {"ts": ts, "price": str(price), "by": actor}, separators=(",", ":")
+            )
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+            idx = bisect_right(self._ts, ts)
+            self._ts.insert(idx, ts)
+            self._prices.insert(idx, price)
+            self._actors.insert(idx, actor)
+            self._seen_version = self._disk_version()
+
+    def price_at(self, ts: float) -> Optional[Decimal]:
+        """המחיר שהיה בתוקף בזמן ts (None אם ts לפני הנקודה הראשונה)."""
+        with self._lock:
+            self.load()
+            idx = bisect_right(self._ts, ts) - 1
+            return self._prices[idx] if idx >= 0 else None
+
+    def latest(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """השינויים האחרונים, מהחדש לישן."""
+        with self._lock:
+            self.load()
+            start = max(0, len(self._ts) - limit)
+            return [
+                {"ts": self._ts[i], "price": self._prices[i], "by": self._actors[i]}
+                for i in range(len(self._ts) - 1, start - 1, -1)
+            ]
+
+    def range(
+        self,
+        start: float,
+        end: float,
+        step: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        נקודות בטווח [start, end]. הנקודה הראשונה היא המחיר שהיה בתוקף ב-start.
+        אם step נתון – מדגם לחלונות של step שניות עם open/high/low/close לכל חלון
+        (חלון בלי שינוי מחיר יורש את ה-close של החלון הקודם).
+        """
+        with self._lock:
+            self.load()
+            lo = bisect_right(self._ts, start)
+            hi = bisect_right(self._ts, end)
+            opening = self.price_at(start)
+            points = [(start, opening)] if opening is not None else []
+            points.extend(zip(self._ts[lo:hi], self._prices[lo:hi]))
+
+        if not step or step <= 0:
+            return [{"ts": ts, "price": price} for ts, price in points]
+
+        buckets: List[Dict[str, Any]] = []
+        bucket_starts = [start + i * step for i in range(int((end - start) // step) + 1)]
+        point_ts = [p[0] for p in points]
+        last_close: Optional[Decimal] = None
+        for b_start in bucket_starts:
+            b_end = min(b_start + step, end + 1e-9)
+            i0 = bisect_left(point_ts, b_start)
+            i1 = bisect_left(point_ts, b_end)
+            window = [p[1] for p in points[i0:i1]]
+            if not window:
+                if last_close is None:
+                    continue
+                window = [last_close]
+            elif last_close is not None:
+                window = [last_close] + window
+            buckets.append(
+                {
+                    "ts": b_start,
+                    "open": window[0],
+                    "high": max(window),
+                    "low": min(window),
+                    "close": window[-1],
+                }
+            )
+            last_close = window[-1]
+        return buckets
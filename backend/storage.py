@@ -0,0 +1,1112 @@
+"""
+שכבת אחסון לבוט – טבלאות key/value שנשמרות בזיכרון.
+
+במקום לקרוא ולכתוב את כל קובץ ה-JSON בכל פעולה, כל טבלה נטענת פעם אחת
+ומשרתת קריאות מהזיכרון. הכתיבה עצמה עוברת דרך backend נבחר:
+- json: snapshot + journal (append-only) שנדחס מדי פעם חזרה לקובץ הראשי.
+- sqlite: מסד SQLite במצב WAL, שורה לכל רשומה ו-upsert לשורה בודדת.
+
+הבחירה נעשית במשתנה הסביבה STORAGE_BACKEND (ברירת מחדל: json).
+בהרצה בכמה תהליכים רק sqlite בטוח: כל תהליך מושך את השינויים של האחרים
+לפי עמודת rev, ו-mutate() מריץ read-modify-write בטרנזקציה נעולה.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger("slhnet.storage")
+
+try:
+    DEFAULT_COMPACT_EVERY = int(os.getenv("STORAGE_COMPACT_EVERY", "500"))
+except ValueError:
+    DEFAULT_COMPACT_EVERY = 500
+
+# =========================
+# Snapshot formats
+# =========================
+# json         – הפורמט ההיסטורי (indent=2), קריא לבני אדם.
+# json-compact – JSON ללא רווחים (נכתב עם orjson אם מותקן).
+# msgpack      – בינארי: MAGIC + גרסה + אורך (8 bytes) + payload של msgpack.
+SNAPSHOT_MAGIC = b"SLHS"
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct(">4sBQ")
+SNAPSHOT_FORMATS = ("json", "json-compact", "msgpack")
+DEFAULT_SNAPSHOT_FORMAT = os.getenv("SNAPSHOT_FORMAT", "json").strip().lower()
+
+
+def encode_snapshot(doc: Any, fmt: str = DEFAULT_SNAPSHOT_FORMAT) -> bytes:
+    """מקודד מסמך snapshot לפי הפורמט המבוקש."""
+    if fmt == "msgpack":
+        if msgpack is not None:
+            payload = msgpack.packb(doc, use_bin_type=True)
+            return _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(payload)) + payload
+        logger.warning("msgpack is not installed, writing json-compact snapshot instead")
+        fmt = "json-compact"
+    if fmt == "json-compact":
+        if orjson is not None:
+            return orjson.dumps(doc)
+        return json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return json.dumps(doc, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def decode_snapshot(raw: bytes) -> Any:
+    """מזהה את הפורמט אוטומטית (לפי ה-MAGIC) ומפענח."""
+    if raw[:4] == SNAPSHOT_MAGIC:
+        if msgpack is None:
+            raise RuntimeError("msgpack snapshot found but msgpack is not installed")
+        _, version, length = _SNAPSHOT_HEADER.unpack_from(raw)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        payload = raw[_SNAPSHOT_HEADER.size:_SNAPSHOT_HEADER.size + length]
+        if len(payload) != length:
+            raise ValueError("Truncated snapshot")
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode("utf-8"))
+
+
+def detect_snapshot_format(raw: bytes) -> str:
+    if raw[:4] == SNAPSHOT_MAGIC:
+        return "msgpack"
+    return "json" if b"\n" in raw[:64] else "json-compact"
+
+
+# טבלאות הבוט: (שם טבלה, קובץ JSON תחת data/, מפתח שורש בקובץ)
+STORAGE_TABLES = [
+    ("referrals", "referrals.json", "users"),
+    ("profiles", "profiles.json", None),
+    ("onchain_wallets", "onchain_wallets.json", None),
+    ("dynamic_config", "slh_dynamic_config.json", None),
+    ("media_cache", "media_file_ids.json", None),
+    ("broadcasts", "broadcasts.json", None),
+    ("bot_state", "bot_state.json", None),
+]
+
+
+# =========================
+# Table interface
+# =========================
+class StorageTable(ABC):
+    """
+    ממשק משותף לכל הטבלאות: מילון רשומות חי בזיכרון + כתיבה ל-backend.
+    """
+
+    lock: threading.RLock
+    # עולה בכל פעם שהרשומות השתנו מבחוץ (refresh / כתיבה של תהליך אחר) –
+    # מטמונים שנבנים מעל הטבלה (אינדקסים, מונים) נעזרים בו
+    version: int = 0
+    # נקראים אחרי שהוחלו שורות שנכתבו מבחוץ (ראו add_listener)
+    _listeners: Tuple[Callable[[List[Tuple[str, Any, Any]]], None], ...] = ()
+
+    @abstractmethod
+    def load(self) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def put_many(self, items: Dict[str, Any]) -> None:
+        ...
+
+    def put(self, key: str, value: Any) -> None:
+        self.put_many({key: value})
+
+    def mutate(self, build: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        read-modify-write: build(records) מחזיר את השינויים ({key: value|None}).
+        ב-sqlite הכל רץ בטרנזקציה אחת מול נתונים עדכניים, כך ששני תהליכים
+        לא דורסים זה את העדכון של זה (למשל מונה הפניות של אותו מפנה).
+        """
+        with self.lock:
+            changes = build(self.load())
+            self.put_many(changes)
+            return changes
+
+    @abstractmethod
+    def replace_all(self, records: Dict[str, Any], extra: Optional[Dict[str, Any]] = None) -> None:
+        ...
+
+    @abstractmethod
+    def set_extra(self, key: str, value: Any) -> None:
+        ...
+
+    @abstractmethod
+    def get_extra(self, key: str, default: Any = None) -> Any:
+        ...
+
+    def refresh_if_changed(self) -> bool:
+        """
+        טוען מחדש אם הנתונים שונו מחוץ לאובייקט הזה (עריכה ידנית של הקובץ,
+        תהליך אחר). מחזיר True אם התבצעה טעינה מחדש.
+        """
+        return False
+
+    def add_listener(self, listener: Callable[[List[Tuple[str, Any, Any]]], None]) -> None:
+        """
+        listener([(key, ערך ישן, ערך חדש), ...]) נקרא תחת הנעילה, אחרי ש-version
+        עלה, כשהוחלו שינויים בודדים של תהליך אחר (None – הרשומה לא קיימת).
+        כך מטמון יכול להתעדכן בהפרש בלבד. טעינה מחדש מלאה לא קוראת לו.
+        """
+        self._listeners = self._listeners + (listener,)
+
+    def compact(self) -> None:
+        return None
+
+    def close(self) -> None:
+        return None
+
+
+# =========================
+# Journaled JSON table
+# =========================
+class JournaledJsonTable(StorageTable):
+    """
+    טבלת key -> value שנשמרת כ-snapshot JSON + journal בפורמט JSON Lines.
+
+    - snapshot: הקובץ הקיים (לדוגמה referrals.json), באותו מבנה כמו קודם.
+    - journal: קובץ <snapshot>.journal, כל שורה היא {"put": {key: value|null}}.
+      null משמעותו מחיקה.
+    אחרי compact_every שורות ב-journal ה-journal מועבר הצידה (<journal>.<gen>)
+    ו-snapshot חדש נכתב ב-thread רקע, כך שהכתיבה עצמה נשארת append בלבד.
+    journaled=False שומר על ההתנהגות הישנה: snapshot מלא בכל כתיבה.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: Path,
+        root_key: Optional[str] = None,
+        compact_every: int = DEFAULT_COMPACT_EVERY,
+        journaled: bool = True,
+        snapshot_format: Optional[str] = None,
+    ) -> None:
+        self.snapshot_path = Path(snapshot_path)
+        self.snapshot_format = snapshot_format or DEFAULT_SNAPSHOT_FORMAT
+        self.journal_path = self.snapshot_path.with_suffix(
+            self.snapshot_path.suffix + ".journal"
+        )
+        self.root_key = root_key
+        self.compact_every = max(1, compact_every)
+        self.journaled = journaled
+        self.lock = threading.RLock()
+        self._records: Optional[Dict[str, Any]] = None
+        self._extra: Dict[str, Any] = {}
+        self._journal_lines = 0
+        self._gen = 0
+        self._written_gen = 0
+        self._compacting = False
+        # (mtime, size) של הקבצים אחרי הכתיבה/קריאה האחרונה שלנו
+        self._seen_version: Any = None
+
+    # ----- loading -----
+    def load(self) -> Dict[str, Any]:
+        """מחזיר את מילון הרשומות החי (נטען מהדיסק רק בקריאה הראשונה)."""
+        with self.lock:
+            if self._records is None:
+                self._records = self._read_all()
+            return self._records
+
+    def _read_all(self) -> Dict[str, Any]:
+        records = self._read_snapshot()
+        for gen, segment in self._segments():
+            self._replay_journal(segment, records)
+            self._gen = max(self._gen, gen)
+        self._written_gen = self._gen
+        self._journal_lines = self._replay_journal(self.journal_path, records)
+        self._seal_journal()
+        self._seen_version = self._disk_version()
+        return records
+
+    def _seal_journal(self) -> None:
+        """
+        שורה אחרונה קטועה (בלי תו סוף שורה) – מוסיפים אותו, אחרת ה-append הבא
+        נדבק אליה ושתי השורות הולכות לאיבוד בטעינה הבאה.
+        """
+        try:
+            with self.journal_path.open("rb+") as f:
+                if f.seek(0, os.SEEK_END) == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        except FileNotFoundError:
+            pass
+
+    def _disk_version(self) -> Tuple[Any, ...]:
+        parts = []
+        for path in (self.snapshot_path, self.journal_path):
+            try:
+                st = path.stat()
+                parts.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                parts.append(None)
+        return tuple(parts)
+
+    def refresh_if_changed(self) -> bool:
+        with self.lock:
+            if self._records is None or self._compacting:
+                return False
+            if self._disk_version() == self._seen_version:
+                return False
+            fresh = self._read_all()
+            # שומרים על אותו אובייקט dict – קוראים אחרים מחזיקים הפניה אליו
+            self._records.clear()
+            self._records.update(fresh)
+            self.version += 1
+            logger.info(f"Reloaded {self.snapshot_path.name} after external change")
+            return True
+
+    def _segments(self) -> List[Tuple[int, Path]]:
+        """קטעי journal שהועברו הצידה לדחיסה ועדיין לא נמחקו, לפי סדר."""
+        result: List[Tuple[int, Path]] = []
+        for path in self.journal_path.parent.glob(self.journal_path.name + ".*"):
+            suffix = path.name.rsplit(".", 1)[-1]
+            if suffix.isdigit():
+                result.append((int(suffix), path))
+        result.sort()
+        return result
+
+    def _read_snapshot(self) -> Dict[str, Any]:
+        if not self.snapshot_path.exists():
+            return {}
+        try:
+            doc = decode_snapshot(self.snapshot_path.read_bytes())
+        except Exception as e:
+            logger.error(f"Error loading snapshot {self.snapshot_path.name}: {e}")
+            return {}
+        if not isinstance(doc, dict):
+            return {}
+        if self.root_key is None:
+            return doc
+        self._extra = {k: v for k, v in doc.items() if k != self.root_key}
+        records = doc.get(self.root_key)
+        return records if isinstance(records, dict) else {}
+
+    def _replay_journal(self, path: Path, records: Dict[str, Any]) -> int:
+        if not path.exists():
+            return 0
+        count = 0
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # שורה קטועה (קריסה באמצע כתיבה) – מתעלמים ממנה
+                        logger.warning(f"Skipping torn journal line in {path.name}")
+                        continue
+                    self._apply(records, entry.get("put") or {})
+                    count += 1
+        except Exception as e:
+            logger.error(f"Error replaying journal {path.name}: {e}")
+        return count
+
+    @staticmethod
+    def _apply(records: Dict[str, Any], items: Dict[str, Any]) -> None:
+        for key, value in items.items():
+            if value is None:
+                records.pop(key, None)
+            else:
+                records[key] = value
+
+    # ----- writes -----
+    def put_many(self, items: Dict[str, Any]) -> None:
+        """
+        מעדכן כמה רשומות יחד ורושם אותן כשורה אחת ב-journal
+        (כך ששינוי שנוגע בשתי רשומות נשמר באופן אטומי).
+        """
+        if not items:
+            return
+        with self.lock:
+            records = self.load()
+            self._apply(records, items)
+            if not self.journaled:
+                self.compact()
+                return
+            try:
+                line = json.dumps({"put": items}, ensure_ascii=False, separators=(",", ":"))
+                with self.journal_path.open("a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                    f.flush()
+                self._journal_lines += 1
+                self._seen_version = self._disk_version()
+            except OSError as e:
+                # בלי journal נשאר רק snapshot מלא; אם גם הוא נכשל – השגיאה עולה
+                logger.error(f"Error appending to journal {self.journal_path.name}: {e}")
+                self.compact()
+                return
+            if self._journal_lines >= self.compact_every:
+                self.compact_in_background()
+
+    def replace_all(self, records: Dict[str, Any], extra: Optional[Dict[str, Any]] = None) -> None:
+        """מחליף את כל תוכן הטבלה (תאימות ל-save_* הישנים) וכותב snapshot מלא."""
+        with self.lock:
+            if self._records is None:
+                self._records = {}
+            if records is not self._records:
+                self._records.clear()
+                self._records.update(records)
+            if extra is not None:
+                self._extra = dict(extra)
+            self.compact()
+
+    def set_extra(self, key: str, value: Any) -> None:
+        """שדות נלווים ב-snapshot (למשל statistics) – נכתבים בדחיסה הבאה."""
+        with self.lock:
+            self._extra[key] = value
+
+    def get_extra(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            self.load()
+            return self._extra.get(key, default)
+
+    # ----- compaction -----
+    def _rotate(self) -> Tuple[int, Dict[str, Any], Dict[str, Any]]:
+        """
+        תחת הנעילה: מעביר את ה-journal הנוכחי לקטע ממוספר ומחזיר העתק
+        (רדוד) של הרשומות – הרשומות עצמן לא משתנות במקום, רק מוחלפות.
+        """
+        records = self.load()
+        self._gen += 1
+        if self.journal_path.exists():
+            self.journal_path.replace(
+                self.journal_path.with_name(f"{self.journal_path.name}.{self._gen}")
+            )
+        self._journal_lines = 0
+        self._seen_version = self._disk_version()
+        return self._gen, dict(records), dict(self._extra)
+
+    def _write_snapshot(self, gen: int, records: Dict[str, Any], extra: Dict[str, Any]) -> None:
+        if self.root_key is None:
+            doc: Dict[str, Any] = records
+        else:
+            doc = {self.root_key: records}
+            doc.update(extra)
+        tmp_path = self.snapshot_path.with_suffix(f".{gen}.tmp")
+        try:
+            tmp_path.write_bytes(encode_snapshot(doc, self.snapshot_format))
+            with self.lock:
+                if gen <= self._written_gen:
+                    # כבר נכתב snapshot חדש יותר בזמן שכתבנו את זה
+                    tmp_path.unlink()
+                    return
+                tmp_path.replace(self.snapshot_path)
+                self._written_gen = gen
+                self._seen_version = self._disk_version()
+                for seg_gen, segment in self._segments():
+                    if seg_gen <= gen:
+                        segment.unlink()
+        except Exception:
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            raise
+
+    def compact(self) -> None:
+        """
+        כותב snapshot מלא בצורה אטומית ומאפס את ה-journal (סינכרוני).
+        כשל בכתיבה עולה לקורא; קטע ה-journal שהועבר הצידה נשאר ויוחל בטעינה.
+        """
+        with self.lock:
+            gen, records, extra = self._rotate()
+        self._write_snapshot(gen, records, extra)
+
+    def compact_in_background(self) -> None:
+        """
+        מתזמן דחיסה ב-thread רקע (אם אין כבר אחת רצה). הרוטציה של ה-journal
+        מהירה ונעשית תחת הנעילה; הסריאליזציה והכתיבה לדיסק – מחוצה לה.
+        """
+        with self.lock:
+            if self._compacting:
+                return
+            self._compacting = True
+            gen, records, extra = self._rotate()
+
+        def _run() -> None:
+            try:
+                self._write_snapshot(gen, records, extra)
+            except Exception as e:
+                logger.error(f"Error compacting {self.snapshot_path.name}: {e}")
+            finally:
+                with self.lock:
+                    self._compacting = False
+
+        threading.Thread(
+            target=_run, name=f"compact-{self.snapshot_path.stem}", daemon=True
+        ).start()
+
+    def close(self) -> None:
+        with self.lock:
+            pending = self._records is not None and (
+                self._journal_lines or self._gen > self._written_gen
+            )
+        if pending:
+            self.compact()
+
+
+# =========================
+# SQLite (WAL) table
+# =========================
+# מחיקה נשמרת כשורה עם JSON null, כדי שתהליכים אחרים יראו אותה לפי rev
+_TOMBSTONE = "null"
+
+
+class SQLiteDatabase:
+    """
+    חיבור SQLite יחיד ומשותף לכל הטבלאות באותו קובץ מסד.
+    WAL מאפשר קריאות במקביל לכתיבה, ו-synchronous=NORMAL מספיק לבטיחות
+    מול קריסת תהליך (commit נשמר ב-WAL).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS table_meta ("
+            " tbl TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " PRIMARY KEY (tbl, key))"
+        )
+
+    def data_version(self) -> int:
+        with self.lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def ensure_table(self, name: str) -> None:
+        with self.lock:
+            self.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, rev INTEGER NOT NULL)"
+            )
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_{name}_rev ON {name}(rev)"
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            try:
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except sqlite3.Error as e:
+                logger.error(f"Error checkpointing {self.path.name}: {e}")
+            self.conn.close()
+
+
+class SQLiteTable(StorageTable):
+    """
+    טבלת key -> value במסד SQLite: שורה לכל משתמש (key הוא PRIMARY KEY),
+    וכל עדכון הוא upsert של השורות שהשתנו בלבד – בלי לכתוב מחדש את כל הנתונים.
+    עמודת rev (עם אינדקס) עולה בכל כתיבה ומאפשרת לזהות שורות שהשתנו.
+
+    כמה תהליכים יכולים לחלוק את אותו מסד: מחיקה נשמרת כשורת tombstone
+    (value = 'null') עם rev חדש, כך שכל תהליך מושך רק את השורות עם rev גבוה
+    מהאחרון שראה – גם בריענון וגם בתחילת כל טרנזקציית כתיבה.
+    """
+
+    def __init__(self, db: SQLiteDatabase, name: str) -> None:
+        if not name.isidentifier():
+            raise ValueError(f"Invalid table name: {name}")
+        self.db = db
+        self.name = name
+        self.lock = db.lock
+        self._records: Optional[Dict[str, Any]] = None
+        self._extra: Dict[str, Any] = {}
+        # שדות נלווים שעודכנו ויכתבו יחד עם הטרנזקציה הבאה
+        self._pending_extra: Dict[str, Any] = {}
+        self._data_version: Optional[int] = None
+        # ה-rev הגבוה ביותר שכבר נמצא ב-_records
+        self._rev = 0
+        db.ensure_table(name)
+
+    def load(self) -> Dict[str, Any]:
+        with self.lock:
+            if self._records is None:
+                records: Dict[str, Any] = {}
+                rev = 0
+                for key, value, row_rev in self.db.conn.execute(
+                    f"SELECT key, value, rev FROM {self.name}"
+                ):
+                    rev = max(rev, row_rev)
+                    if value != _TOMBSTONE:
+                        records[key] = json.loads(value)
+                self._load_extra()
+                self._records = records
+                self._rev = rev
+                self._data_version = self.db.data_version()
+            return self._records
+
+    def _load_extra(self) -> None:
+        for key, value in self.db.conn.execute(
+            "SELECT key, value FROM table_meta WHERE tbl = ?", (self.name,)
+        ):
+            self._extra[key] = json.loads(value)
+        self._extra.update(self._pending_extra)
+
+    def _catch_up(self) -> bool:
+        """מחיל על _records שורות שתהליך אחר כתב מאז ה-rev האחרון שראינו."""
+        rows = self.db.conn.execute(
+            f"SELECT key, value, rev FROM {self.name} WHERE rev > ?", (self._rev,)
+        ).fetchall()
+        if not rows:
+            return False
+        records = self._records
+        changes: List[Tuple[str, Any, Any]] = []
+        for key, value, rev in rows:
+            self._rev = max(self._rev, rev)
+            old = records.get(key)
+            if value == _TOMBSTONE:
+                records.pop(key, None)
+                new = None
+            else:
+                new = records[key] = json.loads(value)
+            changes.append((key, old, new))
+        self._load_extra()
+        self.version += 1
+        for listener in self._listeners:
+            listener(changes)
+        return True
+
+    def refresh_if_changed(self) -> bool:
+        """
+        PRAGMA data_version משתנה רק כשחיבור אחר (תהליך אחר) ביצע commit,
+        כך שכתיבות שלנו לא גורמות לריענון. הריענון עצמו מושך רק שורות חדשות.
+        """
+        with self.lock:
+            if self._records is None:
+                return False
+            version = self.db.data_version()
+            if version == self._data_version:
+                return False
+            self._data_version = version
+            return self._catch_up()
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            row = self.db.conn.execute(
+                f"SELECT 1 FROM {self.name} WHERE value != ? LIMIT 1", (_TOMBSTONE,)
+            ).fetchone()
+            return row is None
+
+    @contextmanager
+    def _transaction(self) -> Iterator[Dict[str, Any]]:
+        """
+        BEGIN IMMEDIATE נועל את המסד לכתיבה מול כל התהליכים; בתוך הנעילה
+        מושכים קודם את מה שאחרים כתבו, כך שהכתיבה שלנו נבנית על נתונים עדכניים.
+        """
+        records = self.load()
+        conn = self.db.conn
+        conn.execute("BEGIN IMMEDIATE")
+        seen_rev = self._rev
+        try:
+            self._catch_up()
+            yield records
+            self._flush_extra()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            # השורות שנמשכו יוחלו שוב (באותו ערך) בריענון הבא
+            self._rev = seen_rev
+            raise
+
+    def _write_rows(self, items: Dict[str, Any]) -> None:
+        # נקרא בתוך _transaction
+        if not items:
+            return
+        # אחרי _catch_up בתוך הנעילה, self._rev הוא ה-rev הגבוה ביותר במסד
+        rev = self._rev + 1
+        self.db.conn.executemany(
+            f"INSERT INTO {self.name} (key, value, rev) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, rev = excluded.rev",
+            [
+                (key, json.dumps(value, ensure_ascii=False, separators=(",", ":")), rev)
+                for key, value in items.items()
+            ],
+        )
+        self._rev = rev
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        with self.lock:
+            with self._transaction() as records:
+                self._write_rows(items)
+            JournaledJsonTable._apply(records, items)
+
+    def mutate(self, build: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, Any]:
+        with self.lock:
+            with self._transaction() as records:
+                changes = build(records)
+                self._write_rows(changes)
+            JournaledJsonTable._apply(records, changes)
+            return changes
+
+    def replace_all(self, records: Dict[str, Any], extra: Optional[Dict[str, Any]] = None) -> None:
+        with self.lock:
+            current = self.load()
+            if extra is not None:
+                for key, value in extra.items():
+                    self.set_extra(key, value)
+            with self._transaction() as current:
+                items: Dict[str, Any] = {k: None for k in current if k not in records}
+                items.update(records)
+                self._write_rows(items)
+            if records is not current:
+                current.clear()
+                current.update(records)
+
+    def set_extra(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.load()
+            self._extra[key] = value
+            self._pending_extra[key] = value
+
+    def _flush_extra(self) -> None:
+        if not self._pending_extra:
+            return
+        self.db.conn.executemany(
+            "INSERT INTO table_meta (tbl, key, value) VALUES (?, ?, ?) "
+            "ON CONFLICT(tbl, key) DO UPDATE SET value = excluded.value",
+            [
+                (self.name, key, json.dumps(value, ensure_ascii=False))
+                for key, value in self._pending_extra.items()
+            ],
+        )
+        self._pending_extra.clear()
+
+    def close(self) -> None:
+        with self.lock:
+            self._flush_extra()
+
+    def get_extra(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            self.load()
+            return self._extra.get(key, default)
+
+
+# =========================
+# Backends
+# =========================
+class JsonStorageBackend:
+    """ה-backend הקיים: קבצי JSON תחת data/ (עם journal היכן שמבוקש)."""
+
+    kind = "json"
+
+    def table(
+        self,
+        name: str,
+        snapshot_path: Path,
+        root_key: Optional[str] = None,
+        journaled: bool = True,
+    ) -> StorageTable:
+        return JournaledJsonTable(snapshot_path, root_key=root_key, journaled=journaled)
+
+    def close(self) -> None:
+        return None
+
+
+class SQLiteStorageBackend:
+    """
+    backend מבוסס SQLite (WAL) – קובץ מסד יחיד לכל הטבלאות.
+    בפתיחה הראשונה של טבלה ריקה מתבצעת הגירה חד-פעמית מקובץ ה-JSON הקיים.
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, db_path: Path) -> None:
+        self.db = SQLiteDatabase(db_path)
+
+    def table(
+        self,
+        name: str,
+        snapshot_path: Path,
+        root_key: Optional[str] = None,
+        journaled: bool = True,
+    ) -> StorageTable:
+        table = SQLiteTable(self.db, name)
+        migrate_json_table(table, snapshot_path, root_key)
+        return table
+
+    def close(self) -> None:
+        self.db.close()
+
+
+def migrate_json_table(
+    table: SQLiteTable,
+    snapshot_path: Path,
+    root_key: Optional[str] = None,
+) -> int:
+    """
+    הגירה חד-פעמית: אם טבלת ה-SQLite ריקה וקיים קובץ JSON (כולל journal),
+    מעתיק את כל הרשומות בטרנזקציה אחת. מחזיר את מספר הרשומות שהועברו.
+    """
+    if table.get_extra("migrated_from") is not None or not table.is_empty():
+        return 0
+    source = JournaledJsonTable(snapshot_path, root_key=root_key)
+    if not source.snapshot_path.exists() and not source.journal_path.exists():
+        return 0
+    records = source.load()
+    extra = {k: v for k, v in source._extra.items()}
+    extra["migrated_from"] = source.snapshot_path.name
+    table.replace_all(dict(records), extra)
+    logger.info(
+        f"Migrated {len(records)} records from {source.snapshot_path.name} "
+        f"to sqlite table {table.name}"
+    )
+    return len(records)
+
+
+def create_backend(kind: str, data_dir: Path):
+    """מחזיר backend לפי שם (json / sqlite)."""
+    kind = (kind or "json").strip().lower()
+    if kind == "sqlite":
+        db_path = Path(os.getenv("SQLITE_PATH", "") or (Path(data_dir) / "slhnet.db"))
+        return SQLiteStorageBackend(db_path)
+    if kind != "json":
+        logger.warning(f"Unknown STORAGE_BACKEND '{kind}', falling back to json")
+    return JsonStorageBackend()
+
+
+# =========================
+# Referral store
+# =========================
+class ReferralStore:
+    """
+    מאגר ההפניות שנשמר בזיכרון לכל אורך חיי התהליך.
+    קריאות מוגשות מהזיכרון, כתיבות עוברות דרך ה-journal של הטבלה.
+    """
+
+    def __init__(self, table: StorageTable) -> None:
+        self.table = table
+        # אינדקס הפוך: referrer -> [(joined_at, user_id), ...] ממוין לפי הצטרפות
+        self._children: Optional[Dict[str, List[Tuple[str, str]]]] = None
+        # מונים מצטברים לסטטיסטיקות קהילה (נבנים פעם אחת ומתעדכנים ב-register)
+        self._counters: Optional[Dict[str, int]] = None
+        self._joins_per_day: Dict[str, int] = {}
+        # כל ה-user_id-ים המספריים בסדר עולה – לדפדוף לפי cursor (שידורים)
+        self._ids: Optional[List[int]] = None
+        # גרסת הטבלה שממנה נבנו האינדקס והמונים
+        self._table_version = table.version
+        table.add_listener(self._apply_external)
+
+    @property
+    def users(self) -> Dict[str, Any]:
+        return self.table.load()
+
+    def get_user(self, user_id: int) -> Dict[str, Any]:
+        return self.users.get(str(user_id), {})
+
+    def total_users(self) -> int:
+        return len(self.users)
+
+    def as_document(self) -> Dict[str, Any]:
+        """מבנה זהה ל-referrals.json – לתאימות עם load_referrals."""
+        return {"users": self.users, "statistics": self.statistics()}
+
+    def _check_table_version(self) -> None:
+        # הטבלה רועננה (תהליך אחר כתב) – האינדקס והמונים נבנים מחדש
+        if self.table.version != self._table_version:
+            self._table_version = self.table.version
+            self._children = None
+            self._counters = None
+            self._ids = None
+
+    def _apply_external(self, changes: List[Tuple[str, Any, Any]]) -> None:
+        """
+        שורות שתהליך אחר כתב (נקרא גם בתוך טרנזקציית הכתיבה): האינדקס והמונים
+        מתעדכנים בהפרש בלבד, בלי לבנות הכל מחדש בזמן שהמסד נעול.
+        """
+        if self._table_version != self.table.version - 1:
+            return  # המטמונים כבר לא עדכניים – ייבנו מחדש בקריאה הבאה
+        self._table_version = self.table.version
+        for uid, old, new in changes:
+            if old is not None:
+                self._account(uid, old, -1)
+            if new is not None:
+                self._account(uid, new, 1)
+            if (old is None) != (new is None):
+                self._track_id(uid, new is not None)
+
+    def _account(self, uid: str, rec: Dict[str, Any], sign: int) -> None:
+        joined_at = rec.get("joined_at") or ""
+        if self._counters is not None:
+            day = joined_at[:10]
+            self._joins_per_day[day] = self._joins_per_day.get(day, 0) + sign
+            count = rec.get("referral_count", 0) or 0
+            self._counters["total_users"] += sign
+            self._counters["total_referrals"] += sign * count
+            if count > 0:
+                self._counters["active_referrers"] += sign
+        ref = rec.get("referrer")
+        if self._children is not None and ref:
+            if sign > 0:
+                self._index_child(self._children, uid, rec)
+                return
+            lst = self._children.get(ref, [])
+            i = bisect_left(lst, (joined_at, uid))
+            if i < len(lst) and lst[i] == (joined_at, uid):
+                del lst[i]
+
+    def _track_id(self, uid: str, present: bool) -> None:
+        if self._ids is None:
+            return
+        try:
+            num = int(uid)
+        except ValueError:
+            return
+        i = bisect_left(self._ids, num)
+        found = i < len(self._ids) and self._ids[i] == num
+        if present and not found:
+            self._ids.insert(i, num)
+        elif not present and found:
+            del self._ids[i]
+
+    # ----- counters -----
+    def _counts(self) -> Dict[str, int]:
+        with self.table.lock:
+            self._check_table_version()
+            if self._counters is None:
+                users = self.users
+                joins: Dict[str, int] = {}
+                total_refs = 0
+                active = 0
+                for rec in users.values():
+                    day = (rec.get("joined_at") or "")[:10]
+                    joins[day] = joins.get(day, 0) + 1
+                    count = rec.get("referral_count", 0) or 0
+                    total_refs += count
+                    if count > 0:
+                        active += 1
+                self._joins_per_day = joins
+                self._counters = {
+                    "total_users": len(users),
+                    "total_referrals": total_refs,
+                    "active_referrers": active,
+                }
+            return self._counters
+
+    def statistics(self) -> Dict[str, Any]:
+        """
+        סטטיסטיקות קהילה ב-O(1): סה״כ משתמשים, סה״כ הפניות, מפנים פעילים
+        (לפחות הפניה אחת), הצטרפו היום והצטרפו ב-7 הימים האחרונים.
+        """
+        with self.table.lock:
+            counts = dict(self._counts())
+            today = date.today()
+            counts["joined_today"] = self._joins_per_day.get(today.isoformat(), 0)
+            counts["joined_this_week"] = sum(
+                self._joins_per_day.get((today - timedelta(days=i)).isoformat(), 0)
+                for i in range(7)
+            )
+            return counts
+
+    def register(self, user_id: int, referrer_id: Optional[int] = None) -> bool:
+        """
+        רושם משתמש חדש. מחזיר True אם נוצר משתמש חדש.
+        אם המפנה קיים – מגדיל לו את מונה ההפניות (באותה שורת journal).
+        """
+        suid = str(user_id)
+
+        def build(users: Dict[str, Any]) -> Dict[str, Any]:
+            # רץ מול נתונים עדכניים (ב-sqlite – בתוך טרנזקציה נעולה)
+            if suid in users:
+                return {}
+            changes: Dict[str, Any] = {
+                suid: {
+                    "referrer": str(referrer_id) if referrer_id else None,
+                    "joined_at": datetime.now().isoformat(),
+                    "referral_count": 0,
+                }
+            }
+            if referrer_id:
+                rid = str(referrer_id)
+                if rid in users:
+                    parent = dict(users[rid])
+                    parent["referral_count"] = parent.get("referral_count", 0) + 1
+                    changes[rid] = parent
+            self._index()
+            counts = self._counts()
+            counts["total_users"] += 1
+            day = changes[suid]["joined_at"][:10]
+            self._joins_per_day[day] = self._joins_per_day.get(day, 0) + 1
+            if len(changes) > 1:
+                counts["total_referrals"] += 1
+                if changes[str(referrer_id)]["referral_count"] == 1:
+                    counts["active_referrers"] += 1
+            self.table.set_extra("statistics", self.statistics())
+            return changes
+
+        with self.table.lock:
+            try:
+                changes = self.table.mutate(build)
+            except Exception:
+                # המונים כבר עודכנו בזיכרון – נבנה אותם מחדש בקריאה הבאה
+                self._children = None
+                self._counters = None
+                self._ids = None
+                raise
+            if not changes:
+                return False
+            self._index_child(self._index(), suid, changes[suid])
+            self._track_id(suid, True)
+            return True
+
+    # ----- paging over all users -----
+    def _sorted_ids(self) -> List[int]:
+        with self.table.lock:
+            self._check_table_version()
+            if self._ids is None:
+                ids: List[int] = []
+                for uid in self.users:
+                    try:
+                        ids.append(int(uid))
+                    except ValueError:
+                        continue
+                ids.sort()
+                self._ids = ids
+            return self._ids
+
+    def user_ids(self, after: Optional[int] = None, limit: Optional[int] = None) -> List[int]:
+        """
+        user_id-ים בסדר עולה, החל מהראשון שגדול מ-after (cursor).
+        הרשימה הממוינת נבנית פעם אחת, וכל עמוד עולה O(log n + limit).
+        """
+        with self.table.lock:
+            ids = self._sorted_ids()
+            start = 0 if after is None else bisect_right(ids, after)
+            end = len(ids) if limit is None else start + max(0, limit)
+            return ids[start:end]
+
+    def count_user_ids(self, after: Optional[int] = None) -> int:
+        """כמה user_id-ים גדולים מ-after."""
+        with self.table.lock:
+            ids = self._sorted_ids()
+            return len(ids) - (0 if after is None else bisect_right(ids, after))
+
+    # ----- reverse index -----
+    def _index(self) -> Dict[str, List[Tuple[str, str]]]:
+        with self.table.lock:
+            self._check_table_version()
+            if self._children is None:
+                children: Dict[str, List[Tuple[str, str]]] = {}
+                for uid, rec in self.users.items():
+                    ref = rec.get("referrer")
+                    if ref:
+                        children.setdefault(ref, []).append(
+                            (rec.get("joined_at") or "", uid)
+                        )
+                for lst in children.values():
+                    lst.sort()
+                self._children = children
+            return self._children
+
+    @staticmethod
+    def _index_child(
+        children: Dict[str, List[Tuple[str, str]]], uid: str, rec: Dict[str, Any]
+    ) -> None:
+        ref = rec.get("referrer")
+        if ref:
+            insort(children.setdefault(ref, []), (rec.get("joined_at") or "", uid))
+
+    def referrals_of(
+        self,
+        user_id: int,
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> List[int]:
+        """
+        מחזיר את המשתמשים שהופנו ע״י user_id, לפי סדר הצטרפות.
+        after – cursor: user_id האחרון מהעמוד הקודם (מתחילים מהבא אחריו).
+        העלות היא O(log n + limit) ביחס להפניות של המשתמש בלבד.
+        """
+        with self.table.lock:
+            lst = self._index().get(str(user_id), [])
+            start = 0
+            if after is not None:
+                sub = str(after)
+                rec = self.users.get(sub)
+                if rec is not None and rec.get("referrer") == str(user_id):
+                    start = bisect_right(lst, (rec.get("joined_at") or "", sub))
+            end = len(lst) if limit is None else start + max(0, limit)
+            page = lst[start:end]
+        result: List[int] = []
+        for _, uid in page:
+            try:
+                result.append(int(uid))
+            except ValueError:
+                continue
+        return result
+
+    def replace(self, data: Dict[str, Any]) -> None:
+        users = data.get("users", {})
+        with self.table.lock:
+            self._children = None
+            self._counters = None
+            self._ids = None
+            self.table.replace_all(users, {"statistics": data.get("statistics", {})})
+            self.table.set_extra("statistics", self.statistics())
+
+    def close(self) -> None:
+        self.table.close()
+
+
+# =========================
+# CLI
+# =========================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SLHNET storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    mig = sub.add_parser("migrate", help="הגירה חד-פעמית מקבצי JSON ל-SQLite")
+    mig.add_argument("--data-dir", default=str(Path(__file__).resolve().parent / "data"))
+    mig.add_argument("--db", default="")
+    conv = sub.add_parser("convert", help="המרת קובץ snapshot בין פורמטים")
+    conv.add_argument("paths", nargs="+")
+    conv.add_argument("--format", choices=SNAPSHOT_FORMATS, required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "migrate":
+        data_dir = Path(args.data_dir)
+        backend = SQLiteStorageBackend(Path(args.db) if args.db else data_dir / "slhnet.db")
+        for name, filename, root in STORAGE_TABLES:
+            backend.table(name, data_dir / filename, root_key=root)
+        backend.close()
+    else:
+        for raw_path in args.paths:
+            path = Path(raw_path)
+            raw = path.read_bytes()
+            encoded = encode_snapshot(decode_snapshot(raw), args.format)
+            tmp_path = path.with_suffix(".convert.tmp")
+            tmp_path.write_bytes(encoded)
+            tmp_path.replace(path)
+            logger.info(
+                f"{path.name}: {detect_snapshot_format(raw)} ({len(raw)} bytes) -> "
+                f"{args.format} ({len(encoded)} bytes)"
+            )
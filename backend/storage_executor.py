@@ -0,0 +1,122 @@
+"""
+הרצת עבודת I/O חוסמת (קבצים, DB, ארנקים פנימיים) מחוץ ל-event loop.
+
+כל ה-handlers של טלגרם וה-routes של FastAPI הם async; קריאה סינכרונית לדיסק
+בתוכם עוצרת את כל העדכונים שבטיפול. כאן יש executor ייעודי עם מספר
+threads חסום, ו-run_storage(...) מחזיר awaitable שרץ עליו.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from prometheus_client import Gauge, Histogram
+
+logger = logging.getLogger("slhnet.storage_executor")
+
+T = TypeVar("T")
+
+try:
+    STORAGE_EXECUTOR_WORKERS = max(1, int(os.getenv("STORAGE_EXECUTOR_WORKERS", "4")))
+except ValueError:
+    STORAGE_EXECUTOR_WORKERS = 4
+
+try:
+    # מעבר למספר הזה של משימות ממתינות – הקוראים ממתינים (backpressure)
+    STORAGE_EXECUTOR_MAX_PENDING = max(
+        1, int(os.getenv("STORAGE_EXECUTOR_MAX_PENDING", "256"))
+    )
+except ValueError:
+    STORAGE_EXECUTOR_MAX_PENDING = 256
+
+STORAGE_QUEUE_DEPTH = Gauge(
+    "slhnet_storage_executor_queue_depth",
+    "Storage tasks submitted (including those waiting for a slot) and not yet started",
+)
+STORAGE_IN_FLIGHT = Gauge(
+    "slhnet_storage_executor_in_flight",
+    "Storage tasks currently running on executor threads",
+)
+STORAGE_QUEUE_WAIT = Histogram(
+    "slhnet_storage_executor_wait_seconds",
+    "Time a storage task waited in the executor queue",
+)
+STORAGE_TASK_SECONDS = Histogram(
+    "slhnet_storage_executor_task_seconds",
+    "Time spent running a storage task",
+)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+_claim_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=STORAGE_EXECUTOR_WORKERS, thread_name_prefix="storage"
+        )
+    return _executor
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(STORAGE_EXECUTOR_MAX_PENDING)
+    return _slots
+
+
+def _leave_queue(state: dict) -> None:
+    """מוריד את המשימה ממד עומק התור – בדיוק פעם אחת (התחלה או ביטול)."""
+    with _claim_lock:
+        if state["left"]:
+            return
+        state["left"] = True
+    STORAGE_QUEUE_DEPTH.dec()
+
+
+def _timed_call(func: Callable[..., T], submitted_at: float, state: dict) -> T:
+    started = time.perf_counter()
+    _leave_queue(state)
+    STORAGE_QUEUE_WAIT.observe(started - submitted_at)
+    STORAGE_IN_FLIGHT.inc()
+    try:
+        return func()
+    finally:
+        STORAGE_IN_FLIGHT.dec()
+        STORAGE_TASK_SECONDS.observe(time.perf_counter() - started)
+
+
+async def run_storage(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    מריץ func(*args, **kwargs) על ה-executor הייעודי ומחזיר את התוצאה.
+    חריגות מועברות לקורא כרגיל.
+    """
+    call = functools.partial(func, *args, **kwargs)
+    loop = asyncio.get_running_loop()
+    state = {"left": False}
+    submitted_at = time.perf_counter()
+    # נספרת בתור כבר מההמתנה ל-slot – כך רואים גם את ה-backpressure
+    STORAGE_QUEUE_DEPTH.inc()
+    try:
+        async with _get_slots():
+            return await loop.run_in_executor(
+                get_executor(), _timed_call, call, submitted_at, state
+            )
+    finally:
+        # אם לא התחילה לרוץ (ביטול, שגיאה) – יוצאת מהתור כאן
+        _leave_queue(state)
+
+
+def shutdown_storage_executor() -> None:
+    """ממתין לסיום המשימות שכבר נשלחו וסוגר את ה-threads."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# המודולים של ה-backend מיובאים בשמם (כמו ב-main.py)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
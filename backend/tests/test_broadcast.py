@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+import broadcast
+from broadcast import BroadcastEngine
+
+
+class MemoryTable:
+    def __init__(self):
+        self.records = {}
+        self.lock = threading.RLock()
+        self.fail_writes = 0
+
+    def load(self):
+        return self.records
+
+    def put(self, key, value):
+        self.records[key] = value
+
+    def mutate(self, build):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise OSError("disk full")
+        changes = build(self.records)
+        self.records.update(changes)
+        return changes
+
+
+def make_engine(table, users, send):
+    return BroadcastEngine(
+        table,
+        recipients=lambda after, limit: [u for u in users if after is None or u > after][:limit],
+        count_recipients=lambda after: len([u for u in users if after is None or u > after]),
+        send=send,
+        classify=lambda exc: broadcast.RESULT_FAILED,
+        is_blocked=lambda user_id: False,
+        mark_blocked=lambda user_id: None,
+    )
+
+
+def test_error_outside_a_single_send_marks_the_broadcast_failed():
+    async def scenario():
+        table = MemoryTable()
+        sent = []
+
+        async def send(user_id, text, parse_mode):
+            sent.append(user_id)
+
+        engine = make_engine(table, [1, 2, 3], send)
+        engine._is_blocked = lambda user_id: 1 / 0
+        rec = await engine.create("hi")
+        await asyncio.sleep(0.05)
+
+        stored = table.records[rec["id"]]
+        assert stored["status"] == "failed"
+        assert "division by zero" in stored["error"]
+        assert sent == []
+        assert await engine.resume_all() == []
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_is_retried_when_the_failure_could_not_be_saved(monkeypatch):
+    monkeypatch.setattr(broadcast, "BROADCAST_RETRY_SECONDS", 0.05)
+
+    async def scenario():
+        table = MemoryTable()
+        sent = []
+
+        async def send(user_id, text, parse_mode):
+            sent.append(user_id)
+
+        engine = make_engine(table, [1, 2], send)
+        rec = await engine.create("hi")
+        # הצ'קפוינט הראשון והסימון כ-failed נכשלים – השידור נשאר running
+        table.fail_writes = 2
+        await asyncio.sleep(0.02)
+        assert table.records[rec["id"]]["status"] == "running"
+        assert rec["id"] in engine._retries
+        assert await engine.resume_all() == []
+
+        await asyncio.sleep(0.1)
+        assert table.records[rec["id"]]["status"] == "done"
+        assert not engine._retries
+        await engine.stop()
+
+    asyncio.run(scenario())
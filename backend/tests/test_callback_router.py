@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from callback_router import CallbackRouter
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.answers = 0
+
+    async def answer(self, *args, **kwargs):
+        self.answers += 1
+
+
+class FakeUpdate:
+    def __init__(self, data):
+        self.callback_query = FakeQuery(data)
+
+
+def make_router():
+    calls = []
+
+    async def exact(update, context):
+        calls.append(("exact",))
+
+    async def approve(update, context, arg):
+        calls.append(("approve", arg))
+
+    async def fallback(update, context):
+        calls.append(("fallback",))
+
+    router = CallbackRouter(fallback=fallback)
+    router.route("approve", exact)
+    router.prefix("approve", approve, answer=False)
+    return router, calls
+
+
+def dispatch(router, data):
+    update = FakeUpdate(data)
+    asyncio.run(router.dispatch(update, None))
+    return update.callback_query
+
+
+def test_exact_route_and_prefix_route_are_told_apart():
+    router, calls = make_router()
+    exact = dispatch(router, "approve")
+    prefixed = dispatch(router, "approve:123")
+    assert calls == [("exact",), ("approve", "123")]
+    # הנתיב המדויק נענה ע"י הנתב; ה-prefix נרשם עם answer=False
+    assert exact.answers == 1
+    assert prefixed.answers == 0
+
+
+def test_unknown_callback_is_answered_and_sent_to_fallback():
+    router, calls = make_router()
+    query = dispatch(router, "reject:5")
+    assert calls == [("fallback",)]
+    assert query.answers == 1
+
+
+def test_duplicate_or_invalid_registrations_are_rejected():
+    router, _ = make_router()
+    with pytest.raises(ValueError):
+        router.route("approve", None)
+    with pytest.raises(ValueError):
+        router.prefix("approve", None)
+    with pytest.raises(ValueError):
+        router.prefix("a:b", None)
@@ -0,0 +1,80 @@
+from message_templates import CompiledTemplate, MessageTemplates
+
+
+class FakeCatalog:
+    """מקור בלוקים + קונטקסט עם גרסאות, כמו MessageCatalog ו-DynamicConfigCache."""
+
+    def __init__(self):
+        self.blocks = {}
+        self.catalog_version = 0
+        self.config = {"entry": "39", "price": "444"}
+        self.config_version = 0
+        self.context_calls = 0
+        self.source_calls = 0
+
+    def source(self, name, default):
+        self.source_calls += 1
+        return self.blocks.get(name, default)
+
+    def context(self):
+        self.context_calls += 1
+        return dict(self.config)
+
+    def version(self):
+        return self.catalog_version, self.config_version
+
+
+def make_templates():
+    catalog = FakeCatalog()
+    templates = MessageTemplates(catalog.source, catalog.context, catalog.version)
+    return catalog, templates
+
+
+def test_placeholders_are_filled_from_context_and_extra():
+    catalog, templates = make_templates()
+    templates.register("PAY", "שלם {{ entry }} ₪ דרך {{link}}")
+    assert templates.render("PAY", link="https://pay") == "שלם 39 ₪ דרך https://pay"
+    # extra גובר על הקונטקסט הכללי
+    assert templates.render("PAY", entry="50", link="x") == "שלם 50 ₪ דרך x"
+
+
+def test_missing_placeholder_is_left_as_is():
+    assert CompiledTemplate("a {{missing}} b").render({}) == "a {{missing}} b"
+    _, templates = make_templates()
+    templates.register("PAY", "שלם {{entry}} ל-{{link}}")
+    assert templates.render("PAY") == "שלם 39 ל-{{link}}"
+
+
+def test_catalog_text_overrides_the_default():
+    catalog, templates = make_templates()
+    catalog.blocks["PAY"] = "מחיר: {{price}}"
+    templates.register("PAY", "ברירת מחדל {{entry}}")
+    assert templates.render("PAY") == "מחיר: 444"
+
+
+def test_render_is_memoized_until_the_config_version_changes():
+    catalog, templates = make_templates()
+    templates.register("PAY", "שלם {{entry}} ₪")
+    assert templates.render("PAY") == "שלם 39 ₪"
+    assert templates.render("PAY") == "שלם 39 ₪"
+    assert catalog.context_calls == 1
+    assert catalog.source_calls == 1
+
+    # שינוי בלי עליית גרסה לא נראה – התוצאה מהמטמון
+    catalog.config["entry"] = "49"
+    assert templates.render("PAY") == "שלם 39 ₪"
+
+    catalog.config_version += 1
+    assert templates.render("PAY") == "שלם 49 ₪"
+    assert catalog.context_calls == 2
+
+
+def test_catalog_reload_recompiles_templates():
+    catalog, templates = make_templates()
+    templates.register("PAY", "שלם {{entry}} ₪")
+    assert templates.render("PAY") == "שלם 39 ₪"
+
+    catalog.blocks["PAY"] = "נוסח חדש: {{entry}}"
+    catalog.catalog_version += 1
+    assert templates.render("PAY") == "נוסח חדש: 39"
+    assert catalog.source_calls == 2
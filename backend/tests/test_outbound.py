@@ -0,0 +1,61 @@
+import asyncio
+
+from outbound import OutboundScheduler
+
+
+def test_cancelled_waiter_does_not_block_later_calls_to_the_same_chat():
+    async def scenario():
+        scheduler = OutboundScheduler()
+        release = asyncio.Event()
+        sent = []
+
+        async def slow():
+            await release.wait()
+            sent.append("a")
+
+        async def fast(name):
+            sent.append(name)
+            return name
+
+        first = scheduler.submit(1, slow)
+        second = scheduler.submit(1, lambda: fast("b"))
+        third = scheduler.submit(1, lambda: fast("c"))
+        await asyncio.sleep(0.01)
+        # b ו-c ממתינים ל-a; b מבוטל לפני שיצא שוב מהתור
+        assert len(scheduler._chat_waiting[1]) == 2
+        second.cancel()
+        release.set()
+
+        await first
+        assert await asyncio.wait_for(third, timeout=1) == "c"
+        assert sent == ["a", "c"]
+        assert scheduler.pending() == 0
+        assert not scheduler._chat_owner and not scheduler._chat_waiting
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+
+
+def test_calls_to_one_chat_run_one_at_a_time_in_order():
+    async def scenario():
+        scheduler = OutboundScheduler()
+        in_flight = 0
+        max_in_flight = 0
+        order = []
+
+        def call(i):
+            async def send():
+                nonlocal in_flight, max_in_flight
+                in_flight += 1
+                max_in_flight = max(max_in_flight, in_flight)
+                await asyncio.sleep(0.001)
+                in_flight -= 1
+                order.append(i)
+            return send
+
+        await asyncio.gather(*(scheduler.submit(-100, call(i)) for i in range(3)))
+        assert order == [0, 1, 2]
+        assert max_in_flight == 1
+        await scheduler.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,147 @@
+import threading
+import time
+
+import storage
+from storage import JournaledJsonTable, ReferralStore, SQLiteDatabase, SQLiteTable
+
+
+def _store(db_path):
+    return ReferralStore(SQLiteTable(SQLiteDatabase(db_path), "referrals"))
+
+
+def _rebuilt(store):
+    fresh = ReferralStore(store.table)
+    return fresh._counts(), fresh._index()
+
+
+def test_catch_up_updates_index_and_counters_incrementally(tmp_path):
+    db_path = tmp_path / "slhnet.db"
+    a = _store(db_path)
+    b = _store(db_path)
+    a.register(1)
+    b.register(2, referrer_id=1)
+    # b בונה את המטמונים שלו, ואז a כותב עוד שורות
+    assert b.statistics()["total_users"] == 2
+    assert b.referrals_of(1) == [2]
+    a.register(3, referrer_id=1)
+    a.register(4, referrer_id=2)
+
+    b.register(5, referrer_id=3)
+
+    assert b._children is not None and b._counters is not None
+    assert b.referrals_of(1) == [2, 3]
+    assert b.referrals_of(3) == [5]
+    assert b._counts() == _rebuilt(b)[0]
+    assert b._index() == _rebuilt(b)[1]
+    assert b._counts() == {"total_users": 5, "total_referrals": 4, "active_referrers": 3}
+
+
+def test_catch_up_applies_deletions(tmp_path):
+    db_path = tmp_path / "slhnet.db"
+    a = _store(db_path)
+    b = _store(db_path)
+    a.register(1)
+    a.register(2, referrer_id=1)
+    assert b.referrals_of(1) == [2]
+
+    a.table.put("2", None)
+    assert b.table.refresh_if_changed()
+
+    assert b.referrals_of(1) == []
+    assert b._counts()["total_users"] == 1
+
+
+def test_user_ids_pages_by_cursor_and_follows_other_writers(tmp_path):
+    db_path = tmp_path / "slhnet.db"
+    a = _store(db_path)
+    b = _store(db_path)
+    for uid in (30, 4, 100, 7):
+        a.register(uid)
+    assert b.user_ids(limit=2) == [4, 7]
+    assert b.user_ids(after=7, limit=2) == [30, 100]
+    assert b.count_user_ids(after=7) == 2
+
+    a.register(50)
+    a.table.put("4", None)
+    assert b.table.refresh_if_changed()
+
+    assert b.user_ids() == [7, 30, 50, 100]
+    assert b.count_user_ids() == 4
+
+
+# ----- JournaledJsonTable -----
+def _json_table(tmp_path, **kwargs):
+    return JournaledJsonTable(tmp_path / "referrals.json", root_key="users", **kwargs)
+
+
+def _wait_for_compaction(table):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with table.lock:
+            if not table._compacting:
+                return
+        time.sleep(0.01)
+    raise AssertionError("compaction did not finish")
+
+
+def test_journal_replay_skips_a_torn_last_line(tmp_path):
+    table = _json_table(tmp_path)
+    table.put("1", {"n": 1})
+    table.put("2", {"n": 2})
+    with table.journal_path.open("a", encoding="utf-8") as f:
+        f.write('{"put":{"3":{"n"')  # קריסה באמצע כתיבה
+
+    reopened = _json_table(tmp_path)
+    assert reopened.load() == {"1": {"n": 1}, "2": {"n": 2}}
+
+    # כתיבה אחרי השורה הקטועה לא נדבקת אליה
+    reopened.put("4", {"n": 4})
+    assert _json_table(tmp_path).load() == {"1": {"n": 1}, "2": {"n": 2}, "4": {"n": 4}}
+
+
+def test_rotation_writes_snapshot_and_removes_segments(tmp_path):
+    table = _json_table(tmp_path, compact_every=2)
+    table.put("1", {"n": 1})
+    table.put("2", {"n": 2})
+    _wait_for_compaction(table)
+
+    assert not table.journal_path.exists()
+    assert table._segments() == []
+    assert _json_table(tmp_path).load() == {"1": {"n": 1}, "2": {"n": 2}}
+
+
+def test_rotated_segment_is_replayed_if_the_snapshot_was_never_written(tmp_path):
+    table = _json_table(tmp_path)
+    table.put("1", {"n": 1})
+    with table.lock:
+        table._rotate()  # קריסה אחרי הרוטציה ולפני כתיבת ה-snapshot
+    table.put("2", {"n": 2})
+
+    reopened = _json_table(tmp_path)
+    assert [gen for gen, _ in reopened._segments()] == [1]
+    assert reopened.load() == {"1": {"n": 1}, "2": {"n": 2}}
+
+
+def test_append_during_background_compaction_is_kept(tmp_path, monkeypatch):
+    table = _json_table(tmp_path, compact_every=2)
+    started = threading.Event()
+    release = threading.Event()
+    encode = storage.encode_snapshot
+
+    def slow_encode(doc, fmt):
+        started.set()
+        release.wait(5)
+        return encode(doc, fmt)
+
+    monkeypatch.setattr(storage, "encode_snapshot", slow_encode)
+    table.put("1", {"n": 1})
+    table.put("2", {"n": 2})
+    assert started.wait(5)
+    # ה-snapshot נכתב ברקע; כתיבות חדשות הולכות ל-journal הטרי
+    table.put("3", {"n": 3})
+    table.put("2", None)
+    release.set()
+    _wait_for_compaction(table)
+
+    assert table.load() == {"1": {"n": 1}, "3": {"n": 3}}
+    assert _json_table(tmp_path).load() == {"1": {"n": 1}, "3": {"n": 3}}
@@ -0,0 +1,93 @@
+from update_workers import UpdateDeduplicator
+
+
+class MemoryTable:
+    def __init__(self):
+        self.records = {}
+
+    def load(self):
+        return self.records
+
+    def put(self, key, value):
+        self.records[key] = value
+
+    def refresh_if_changed(self):
+        return False
+
+
+def restarted(table):
+    dedup = UpdateDeduplicator(table)
+    dedup.load()
+    return dedup
+
+
+def accept(dedup, update_id):
+    assert dedup.claim(update_id)
+    dedup.confirm(update_id)
+
+
+def test_duplicate_is_dropped():
+    dedup = UpdateDeduplicator(MemoryTable())
+    accept(dedup, 100)
+    assert not dedup.claim(100)
+
+
+def test_released_update_is_accepted_again():
+    dedup = UpdateDeduplicator(MemoryTable())
+    assert dedup.claim(105)
+    dedup.release(105)
+    assert dedup.claim(105)
+
+
+def test_released_update_survives_restart():
+    table = MemoryTable()
+    dedup = UpdateDeduplicator(table)
+    accept(dedup, 104)
+    assert dedup.claim(105)
+    dedup.release(105)
+    accept(dedup, 106)
+    dedup.persist()
+
+    dedup = restarted(table)
+    assert dedup.claim(105)
+    assert not dedup.claim(104)
+
+
+def test_confirmed_updates_are_dropped_after_restart():
+    table = MemoryTable()
+    dedup = UpdateDeduplicator(table)
+    for update_id in (1, 2, 3):
+        accept(dedup, update_id)
+    dedup.persist()
+
+    dedup = restarted(table)
+    assert not dedup.claim(3)
+    assert dedup.claim(4)
+
+
+def test_pending_update_caps_high_water():
+    table = MemoryTable()
+    dedup = UpdateDeduplicator(table)
+    assert dedup.claim(10)  # עוד לא נכנס לתור
+    accept(dedup, 11)
+    dedup.persist()
+
+    assert restarted(table).claim(10)
+
+
+def test_out_of_order_ids_are_not_dropped():
+    dedup = UpdateDeduplicator(MemoryTable(), window=2)
+    for update_id in (10, 5, 11):
+        accept(dedup, update_id)
+    assert dedup.claim(7)
+    assert not dedup.claim(10)
+    assert not dedup.claim(11)
+
+
+def test_floor_stays_below_pending_id():
+    dedup = UpdateDeduplicator(MemoryTable(), window=2)
+    assert dedup.claim(3)
+    dedup.release(3)
+    for update_id in (4, 5, 6):
+        accept(dedup, update_id)
+    assert dedup.claim(3)
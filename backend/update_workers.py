@@ -0,0 +1,282 @@
+"""
+עיבוד עדכוני טלגרם ברקע.
+
+ה-webhook רק מאמת ומכניס את העדכון לתור ומחזיר 200 מיד; מאגר workers
+(UPDATE_WORKERS) מרוקן את התור ומריץ את ה-handlers. כך טלגרם לא ממתין
+לסיום ה-handler (ולא שולח שוב עדכונים "תקועים"), ו-handler איטי אחד לא
+עוצר את כל השאר. בכיבוי – מפסיקים לקבל עדכונים ומרוקנים את מה שבתור.
+
+העדכונים מחולקים ל-shards לפי מפתח (chat/user id): לכל shard תור ו-worker
+משלו, כך שעדכונים של אותו צ'אט רצים לפי הסדר, ומשתמשים שונים במקביל.
+
+UpdateDeduplicator מסנן עדכונים שטלגרם שלח שוב (אותו update_id) עוד לפני
+שהם נכנסים לתור.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger("slhnet.update_workers")
+
+try:
+    UPDATE_WORKERS = max(1, int(os.getenv("UPDATE_WORKERS", "8")))
+except ValueError:
+    UPDATE_WORKERS = 8
+
+try:
+    UPDATE_DEDUP_WINDOW = max(1, int(os.getenv("UPDATE_DEDUP_WINDOW", "10000")))
+except ValueError:
+    UPDATE_DEDUP_WINDOW = 10000
+
+try:
+    UPDATE_DEDUP_PERSIST_EVERY = max(1, int(os.getenv("UPDATE_DEDUP_PERSIST_EVERY", "50")))
+except ValueError:
+    UPDATE_DEDUP_PERSIST_EVERY = 50
+
+# אחרי שבוע בלי עדכונים טלגרם מגריל update_id חדש – high-water ישן לא תקף
+UPDATE_HIGH_WATER_MAX_AGE = 6 * 24 * 3600
+# טלגרם מנסה לשלוח שוב עדכון שלא אושר עד 24 שעות
+UPDATE_RETRY_MAX_AGE = 24 * 3600
+
+try:
+    UPDATE_QUEUE_MAX = max(1, int(os.getenv("UPDATE_QUEUE_MAX", "1000")))
+except ValueError:
+    UPDATE_QUEUE_MAX = 1000
+
+UPDATE_QUEUE_LENGTH = Gauge(
+    "slhnet_update_queue_length",
+    "Telegram updates accepted by the webhook and not yet picked up by a worker",
+)
+UPDATE_SHARD_DEPTH = Gauge(
+    "slhnet_update_shard_queue_depth",
+    "Telegram updates waiting in each per-chat shard",
+    ["shard"],
+)
+UPDATE_LAG = Histogram(
+    "slhnet_update_lag_seconds",
+    "Time from webhook receipt until a worker started processing the update",
+)
+UPDATE_PROCESSING = Histogram(
+    "slhnet_update_processing_seconds",
+    "Time spent processing one Telegram update",
+)
+UPDATE_REJECTED = Counter(
+    "slhnet_update_rejected_total",
+    "Telegram updates rejected because the queue was full or shutting down",
+)
+UPDATE_DUPLICATES = Counter(
+    "slhnet_update_duplicates_total",
+    "Redelivered Telegram updates dropped by update_id de-duplication",
+)
+UPDATE_ERRORS = Counter(
+    "slhnet_update_errors_total",
+    "Telegram updates whose processing raised an exception",
+)
+
+
+class UpdateWorkerPool:
+    """
+    key(update) מחזיר את מפתח הסידור (למשל chat id); עדכונים עם אותו מפתח
+    מגיעים תמיד לאותו shard ומעובדים אחד אחרי השני.
+    max_queue הוא הגבול לכל shard.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[None]],
+        key: Callable[[Any], Hashable] = id,
+        workers: int = UPDATE_WORKERS,
+        max_queue: int = UPDATE_QUEUE_MAX,
+    ) -> None:
+        self._process = process
+        self._key = key
+        self._workers_count = max(1, workers)
+        self._max_queue = max_queue
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._accepting = False
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._queues = [
+            asyncio.Queue(maxsize=self._max_queue) for _ in range(self._workers_count)
+        ]
+        self._accepting = True
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(self._workers_count)
+        ]
+        logger.info(f"Started {self._workers_count} update workers")
+
+    def shard_of(self, update: Any) -> int:
+        return hash(self._key(update)) % self._workers_count
+
+    def enqueue(self, update: Any) -> bool:
+        """מכניס עדכון לתור ה-shard שלו. False אם התור מלא או שהמאגר בכיבוי."""
+        if not self._accepting:
+            UPDATE_REJECTED.inc()
+            return False
+        shard = self.shard_of(update)
+        try:
+            self._queues[shard].put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            UPDATE_REJECTED.inc()
+            return False
+        UPDATE_QUEUE_LENGTH.inc()
+        UPDATE_SHARD_DEPTH.labels(str(shard)).inc()
+        return True
+
+    def qsize(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    async def _worker(self, index: int) -> None:
+        queue = self._queues[index]
+        depth = UPDATE_SHARD_DEPTH.labels(str(index))
+        while True:
+            enqueued_at, update = await queue.get()
+            UPDATE_QUEUE_LENGTH.dec()
+            depth.dec()
+            started = time.monotonic()
+            UPDATE_LAG.observe(started - enqueued_at)
+            try:
+                await self._process(update)
+            except Exception as e:
+                UPDATE_ERRORS.inc()
+                logger.error(f"Error processing update in worker {index}: {e}")
+            finally:
+                UPDATE_PROCESSING.observe(time.monotonic() - started)
+                queue.task_done()
+
+    async def drain(self, timeout: float = 25.0) -> None:
+        """מפסיק לקבל עדכונים, ממתין לסיום מה שבתורים (עד timeout) ועוצר את ה-workers."""
+        if not self._workers:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.join() for q in self._queues)), timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue drain timed out with {self.qsize()} updates left")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+class UpdateDeduplicator:
+    """
+    חלון חסום של update_id-ים שכבר התקבלו, ובנוסף high-water mark שנשמר
+    בטבלת state כל UPDATE_DEDUP_PERSIST_EVERY עדכונים ובכיבוי – כך שגם אחרי
+    ריסטארט עדכון ישן שנשלח שוב לא ירוץ פעמיים.
+
+    - claim() מסמן id כ"בטיפול"; confirm() אחרי שהעדכון נכנס לתור;
+      release() כשהעדכון לא נכנס (503 – טלגרם ישלח אותו שוב).
+    - רק עדכונים שאושרו מעלים את ה-high-water, והוא (וגם ה-floor) לעולם לא
+      עולה מעל ה-id הנמוך ביותר שעדיין ממתין או שוחרר ועוד לא חזר.
+    - כשהחלון מלא נפלט ה-id הנמוך ביותר, וה-floor הוא ה-id הנפלט – כך id
+      ישן שמעולם לא התקבל לא נחסם בגלל id גבוה ממנו שהגיע קודם.
+    claim() / confirm() / release() סינכרוניים – בלי await ביניהם לבין ההכנסה לתור.
+    """
+
+    STATE_KEY = "telegram_updates"
+
+    def __init__(self, table, window: int = UPDATE_DEDUP_WINDOW) -> None:
+        self.table = table
+        self._window = window
+        self._seen: Set[int] = set()
+        # min-heap של ה-id-ים בחלון (עם מחיקה עצלה של id-ים ששוחררו)
+        self._heap: List[int] = []
+        # id-ים שנתפסו ועוד לא אושרו, או ששוחררו ויגיעו שוב: id -> זמן
+        self._unresolved: Dict[int, float] = {}
+        # כל update_id עד הערך הזה כבר התקבל (בתהליך קודם או נפלט מהחלון)
+        self._floor: Optional[int] = None
+        self._high_water: Optional[int] = None
+        self._persisted_high_water: Optional[int] = None
+        self._since_persist = 0
+
+    def load(self) -> None:
+        """טוען את ה-high-water השמור (נקרא באתחול, ב-executor)."""
+        rec = self.table.load().get(self.STATE_KEY) or {}
+        high_water = rec.get("high_water")
+        saved_at = rec.get("saved_at", 0)
+        if isinstance(high_water, int) and time.time() - saved_at < UPDATE_HIGH_WATER_MAX_AGE:
+            self._floor = self._high_water = self._persisted_high_water = high_water
+
+    def _ceiling(self) -> Optional[int]:
+        """ה-floor וה-high-water השמור חייבים להישאר מתחת ל-id הזה."""
+        if not self._unresolved:
+            return None
+        cutoff = time.monotonic() - UPDATE_RETRY_MAX_AGE
+        for update_id in [u for u, at in self._unresolved.items() if at < cutoff]:
+            # טלגרם כבר לא ישלח אותו שוב
+            del self._unresolved[update_id]
+        return min(self._unresolved) - 1 if self._unresolved else None
+
+    def claim(self, update_id: int) -> bool:
+        """True אם העדכון חדש (ומסמן אותו); False אם זה כפול."""
+        if update_id in self._seen or (self._floor is not None and update_id <= self._floor):
+            UPDATE_DUPLICATES.inc()
+            return False
+        self._seen.add(update_id)
+        heapq.heappush(self._heap, update_id)
+        self._unresolved[update_id] = time.monotonic()
+        while len(self._seen) > self._window:
+            evicted = heapq.heappop(self._heap)
+            if evicted not in self._seen:
+                continue  # שוחרר קודם
+            self._seen.discard(evicted)
+            ceiling = self._ceiling()
+            if ceiling is not None:
+                evicted = min(evicted, ceiling)
+            if self._floor is None or evicted > self._floor:
+                self._floor = evicted
+        return True
+
+    def confirm(self, update_id: int) -> None:
+        """העדכון נכנס לתור – נחשב כמתקבל גם אחרי ריסטארט."""
+        self._unresolved.pop(update_id, None)
+        if self._high_water is None or update_id > self._high_water:
+            self._high_water = update_id
+        self._since_persist += 1
+
+    def release(self, update_id: int) -> None:
+        """מבטל claim – למשל כשהתור מלא וטלגרם ישלח את העדכון שוב."""
+        self._seen.discard(update_id)
+        self._unresolved[update_id] = time.monotonic()
+
+    def should_persist(self) -> bool:
+        """True פעם אחת לכל UPDATE_DEDUP_PERSIST_EVERY עדכונים חדשים."""
+        if self._since_persist >= UPDATE_DEDUP_PERSIST_EVERY:
+            self._since_persist = 0
+            return True
+        return False
+
+    def safe_high_water(self) -> Optional[int]:
+        """ה-high-water שמותר לשמור: לא כולל id-ים שעוד עשויים להגיע שוב."""
+        high_water = self._high_water
+        ceiling = self._ceiling()
+        if high_water is not None and ceiling is not None:
+            high_water = min(high_water, ceiling)
+        return high_water
+
+    def persist(self) -> None:
+        """שומר את ה-high-water (ב-executor)."""
+        high_water = self.safe_high_water()
+        if high_water is None or high_water == self._persisted_high_water:
+            return
+        # בכמה תהליכים כל אחד שומר את שלו – לא דורסים ערך גבוה יותר
+        self.table.refresh_if_changed()
+        stored = (self.table.load().get(self.STATE_KEY) or {}).get("high_water")
+        if isinstance(stored, int) and stored >= high_water:
+            self._persisted_high_water = high_water
+            return
+        self.table.put(self.STATE_KEY, {"high_water": high_water, "saved_at": time.time()})
+        self._persisted_high_water = high_water